@@ -1,9 +1,35 @@
 from pathlib import Path
 import re
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 import tokenize
 import io
 import ast
+import asyncio
+import codecs
+from contextlib import closing
+import inspect
+import os
+import aiofiles
+
+from code_scanner import SourceScanner, scan_source
+
+# Bump whenever parse results change, so cached results of older parsers are ignored
+PARSER_VERSION = 2
+# Files are read and decoded in chunks of this many bytes
+READ_CHUNK_SIZE = 1 << 20
+# Files larger than this are parsed chunk by chunk by iter_file instead of read whole
+PARSE_STREAM_THRESHOLD = int(os.environ.get("PARSE_STREAM_THRESHOLD", str(8 << 20)))
+# Longest text block iter_file yields when a paragraph has no line breaks
+MAX_BLOCK_SIZE = 1 << 20
+
+# ScanResult fields -> result keys of each C-family parser
+TYPESCRIPT_SECTIONS = {'interfaces': 'interfaces', 'types': 'types', 'components': 'components', 'comments': 'comments'}
+JAVASCRIPT_SECTIONS = {'components': 'components', 'comments': 'comments'}
+JAVA_SECTIONS = {'classes': 'classes', 'declarations': 'methods', 'comments': 'comments'}
+CPP_SECTIONS = {'classes': 'classes', 'declarations': 'functions', 'comments': 'comments'}
+
+HEADER_PATTERN = re.compile(r'^#+\s+(.+)$', re.MULTILINE)
+CODE_BLOCK_PATTERN = re.compile(r'```[\w]*\n(.*?)```', re.MULTILINE | re.DOTALL)
 
 class CodeFileParser:
     """Parser system for code files that extracts meaningful content for analysis"""
@@ -21,6 +47,19 @@ class CodeFileParser:
             '.txt': self.parse_text,
             '.md': self.parse_markdown
         }
+        # Chunked counterparts used by iter_file for large files
+        self.streaming_parsers = {
+            '.py': self.stream_python,
+            '.js': lambda path: self.stream_source(path, JAVASCRIPT_SECTIONS),
+            '.jsx': lambda path: self.stream_source(path, JAVASCRIPT_SECTIONS),
+            '.ts': lambda path: self.stream_source(path, TYPESCRIPT_SECTIONS),
+            '.tsx': lambda path: self.stream_source(path, TYPESCRIPT_SECTIONS),
+            '.java': lambda path: self.stream_source(path, JAVA_SECTIONS),
+            '.cpp': lambda path: self.stream_source(path, CPP_SECTIONS),
+            '.h': lambda path: self.stream_source(path, CPP_SECTIONS),
+            '.txt': self.stream_text,
+            '.md': self.stream_markdown
+        }
         
     async def parse_file(self, file_path: Path) -> Optional[Dict[str, str]]:
         """Main entry point for parsing any supported file"""
@@ -28,15 +67,166 @@ class CodeFileParser:
             return None
             
         parser = self.supported_extensions[file_path.suffix.lower()]
+        content = await self.read_text(file_path)
+        return await parser(content)
+
+    async def read_text(self, file_path: Path) -> str:
+        """Read a file without blocking, decoding UTF-8 incrementally with a latin-1 fallback"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return await parser(content)
+            return await self._read_decoded(file_path, 'utf-8')
         except UnicodeDecodeError:
             # Fallback to latin-1 encoding
-            with open(file_path, 'r', encoding='latin-1') as f:
-                content = f.read()
-            return await parser(content)
+            return await self._read_decoded(file_path, 'latin-1')
+
+    async def _read_decoded(self, file_path: Path, encoding: str) -> str:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        pieces = []
+        async with aiofiles.open(file_path, 'rb') as f:
+            while chunk := await f.read(READ_CHUNK_SIZE):
+                pieces.append(decoder.decode(chunk))
+        pieces.append(decoder.decode(b'', final=True))
+        return ''.join(pieces)
+
+    async def iter_file(self, file_path: Path) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (section, item) pairs for a supported file, e.g. ('comments', '// ...').
+
+        Files up to PARSE_STREAM_THRESHOLD bytes are parsed whole and yielded section
+        by section, exactly as parse_file returns them. Larger files are read and
+        parsed chunk by chunk, so memory stays bounded by the chunk size and items
+        of different sections arrive interleaved, in source order.
+        """
+        suffix = file_path.suffix.lower()
+        if suffix not in self.supported_extensions:
+            return
+        if file_path.stat().st_size <= PARSE_STREAM_THRESHOLD:
+            for item in iter_parsed_items(await self.parse_file(file_path)):
+                yield item
+            return
+        async for item in self.streaming_parsers[suffix](file_path):
+            yield item
+
+    async def iter_chunks(self, file_path: Path) -> AsyncIterator[str]:
+        """Decoded chunks of a file, in the encoding read_text would use for all of it"""
+        decoder = codecs.getincrementaldecoder(await asyncio.to_thread(file_encoding, file_path))()
+        async with aiofiles.open(file_path, 'rb') as f:
+            while chunk := await f.read(READ_CHUNK_SIZE):
+                if text := decoder.decode(chunk):
+                    yield text
+        if text := decoder.decode(b'', final=True):
+            yield text
+
+    async def iter_blocks(self, file_path: Path) -> AsyncIterator[str]:
+        """Decoded text cut at paragraph breaks, or line breaks for very long paragraphs"""
+        pending = ''
+        async for chunk in self.iter_chunks(file_path):
+            pending += chunk
+            while True:
+                cut = pending.rfind('\n\n')
+                if cut <= 0 and len(pending) > MAX_BLOCK_SIZE:
+                    cut = pending.rfind('\n', 0, MAX_BLOCK_SIZE)
+                    if cut <= 0:
+                        cut = MAX_BLOCK_SIZE
+                if cut <= 0:
+                    break
+                yield pending[:cut]
+                pending = pending[cut:]
+                if len(pending) <= MAX_BLOCK_SIZE:
+                    break
+        if pending:
+            yield pending
+
+    async def stream_text(self, file_path: Path) -> AsyncIterator[Tuple[str, str]]:
+        """Chunked parse_text"""
+        async for block in self.iter_blocks(file_path):
+            yield 'content', block
+
+    async def stream_markdown(self, file_path: Path) -> AsyncIterator[Tuple[str, str]]:
+        """Chunked parse_markdown: content blocks, headers and fenced code blocks"""
+        code: Optional[List[str]] = None
+        async for block in self.iter_blocks(file_path):
+            yield 'content', block
+            for line in block.split('\n'):
+                if line.startswith('```'):
+                    if code is None:
+                        code = []
+                    else:
+                        yield 'code_blocks', '\n'.join(code) + '\n'
+                        code = None
+                elif code is not None:
+                    code.append(line)
+                elif header := HEADER_PATTERN.match(line):
+                    yield 'headers', header.group(1)
+
+    async def stream_source(self, file_path: Path, sections: Dict[str, str]) -> AsyncIterator[Tuple[str, str]]:
+        """Chunked parse of a C-family file; sections maps ScanResult fields to result keys"""
+        scanner = SourceScanner()
+        async for chunk in self.iter_chunks(file_path):
+            for item in _scan_items(scanner.feed(chunk), sections):
+                yield item
+        for item in _scan_items(scanner.feed('', final=True), sections):
+            yield item
+
+    async def stream_python(self, file_path: Path) -> AsyncIterator[Tuple[str, str]]:
+        """Chunked parse_python using the tokenizer, which reads one line at a time.
+
+        Yields comments, `def name(args)` and `class name` signatures, and the
+        docstring that opens a function or class body.
+        """
+        with closing(_decoded_lines(file_path)) as lines:
+            tokens = tokenize.generate_tokens(lambda: next(lines, ''))
+            header: Optional[List[str]] = None
+            params: Optional[List[str]] = None
+            depth = 0
+            starred = False
+            expect_docstring = False
+            before = previous = None
+            try:
+                for token in tokens:
+                    if token.type == tokenize.COMMENT:
+                        comment = token.string.strip('# ')
+                        if comment:
+                            yield 'comments', comment
+                        continue
+                    if token.type in (tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT):
+                        continue
+                    if expect_docstring:
+                        expect_docstring = False
+                        if token.type == tokenize.STRING:
+                            try:
+                                yield 'docstrings', inspect.cleandoc(ast.literal_eval(token.string))
+                            except (ValueError, SyntaxError):
+                                pass
+                            continue
+                    if header is None:
+                        # async functions are skipped, as ast.FunctionDef excludes them
+                        if previous in ('def', 'class') and token.type == tokenize.NAME and before != 'async':
+                            header = [previous, token.string]
+                            params = [] if previous == 'def' else None
+                            starred = False
+                            depth = 0
+                    elif token.type == tokenize.OP and token.string in '([{':
+                        depth += 1
+                    elif token.type == tokenize.OP and token.string in ')]}':
+                        depth -= 1
+                        if depth == 0:
+                            # The rest of the header is the return annotation
+                            starred = True
+                    elif token.string == ':' and depth == 0:
+                        if header[0] == 'def':
+                            yield 'functions', f"def {header[1]}({', '.join(params)})"
+                        else:
+                            yield 'classes', f"class {header[1]}"
+                        header = None
+                        expect_docstring = True
+                    elif params is not None and depth == 1:
+                        if token.string in ('*', '**'):
+                            # Only positional-or-keyword parameters, like _get_func_args
+                            starred = True
+                        elif token.type == tokenize.NAME and previous in ('(', ',') and not starred:
+                            params.append(token.string)
+                    before, previous = previous, token.string
+            except (tokenize.TokenError, SyntaxError):
+                pass
 
     async def parse_python(self, content: str) -> Dict[str, str]:
         """Parse Python files, extracting docstrings, comments, and function signatures"""
@@ -77,90 +267,42 @@ class CodeFileParser:
 
     async def parse_typescript(self, content: str) -> Dict[str, str]:
         """Parse TypeScript/TSX files"""
-        result = {
-            'interfaces': [],
-            'types': [],
-            'components': [],
+        scan = scan_source(content)
+        return {
+            'interfaces': scan.interfaces,
+            'types': scan.types,
+            'components': scan.components,
             'functions': [],
-            'comments': []
+            'comments': scan.comments
         }
-        
-        # Extract TypeScript interfaces and types
-        interface_pattern = r'interface\s+(\w+)\s*{'
-        type_pattern = r'type\s+(\w+)\s*='
-        component_pattern = r'function\s+(\w+)\s*\(.*?\).*?{|const\s+(\w+)\s*=\s*\(.*?\)\s*=>'
-        
-        result['interfaces'].extend(re.findall(interface_pattern, content))
-        result['types'].extend(re.findall(type_pattern, content))
-        
-        # Extract React components
-        for match in re.finditer(component_pattern, content, re.MULTILINE | re.DOTALL):
-            component_name = match.group(1) or match.group(2)
-            if component_name:
-                result['components'].append(component_name)
-        
-        # Extract comments (both single-line and multi-line)
-        comment_pattern = r'//.*?$|/\*.*?\*/'
-        result['comments'].extend(re.findall(comment_pattern, content, re.MULTILINE | re.DOTALL))
-        
-        return result
 
     async def parse_javascript(self, content: str) -> Dict[str, str]:
         """Parse JavaScript/JSX files"""
-        result = {
+        # Similar to TypeScript but without type information
+        scan = scan_source(content)
+        return {
             'functions': [],
-            'components': [],
-            'comments': []
+            'components': scan.components,
+            'comments': scan.comments
         }
-        
-        # Similar to TypeScript but without type information
-        component_pattern = r'function\s+(\w+)\s*\(.*?\).*?{|const\s+(\w+)\s*=\s*\(.*?\)\s*=>'
-        comment_pattern = r'//.*?$|/\*.*?\*/'
-        
-        for match in re.finditer(component_pattern, content, re.MULTILINE | re.DOTALL):
-            component_name = match.group(1) or match.group(2)
-            if component_name:
-                result['components'].append(component_name)
-                
-        result['comments'].extend(re.findall(comment_pattern, content, re.MULTILINE | re.DOTALL))
-        
-        return result
 
     async def parse_java(self, content: str) -> Dict[str, str]:
         """Parse Java files"""
-        result = {
-            'classes': [],
-            'methods': [],
-            'comments': []
+        scan = scan_source(content)
+        return {
+            'classes': scan.classes,
+            'methods': scan.declarations,
+            'comments': scan.comments
         }
-        
-        class_pattern = r'class\s+(\w+)'
-        method_pattern = r'(?:public|private|protected)?\s+(?:static\s+)?[\w<>[\],\s]+\s+(\w+)\s*\([^)]*\)'
-        comment_pattern = r'//.*?$|/\*.*?\*/'
-        
-        result['classes'].extend(re.findall(class_pattern, content))
-        result['methods'].extend(re.findall(method_pattern, content))
-        result['comments'].extend(re.findall(comment_pattern, content, re.MULTILINE | re.DOTALL))
-        
-        return result
 
     async def parse_cpp(self, content: str) -> Dict[str, str]:
         """Parse C++ files"""
-        result = {
-            'classes': [],
-            'functions': [],
-            'comments': []
+        scan = scan_source(content)
+        return {
+            'classes': scan.classes,
+            'functions': scan.declarations,
+            'comments': scan.comments
         }
-        
-        class_pattern = r'class\s+(\w+)'
-        function_pattern = r'(?:[\w:*&]+\s+)+(\w+)\s*\([^)]*\)'
-        comment_pattern = r'//.*?$|/\*.*?\*/'
-        
-        result['classes'].extend(re.findall(class_pattern, content))
-        result['functions'].extend(re.findall(function_pattern, content))
-        result['comments'].extend(re.findall(comment_pattern, content, re.MULTILINE | re.DOTALL))
-        
-        return result
 
     async def parse_text(self, content: str) -> Dict[str, str]:
         """Parse plain text files"""
@@ -174,11 +316,8 @@ class CodeFileParser:
             'content': content
         }
         
-        header_pattern = r'^#+\s+(.+)$'
-        code_block_pattern = r'```[\w]*\n(.*?)```'
-        
-        result['headers'].extend(re.findall(header_pattern, content, re.MULTILINE))
-        result['code_blocks'].extend(re.findall(code_block_pattern, content, re.MULTILINE | re.DOTALL))
+        result['headers'].extend(HEADER_PATTERN.findall(content))
+        result['code_blocks'].extend(CODE_BLOCK_PATTERN.findall(content))
         
         return result
 
@@ -191,4 +330,46 @@ class CodeFileParser:
 
     def is_supported_file(self, file_path: Path) -> bool:
         """Check if a file type is supported"""
-        return file_path.suffix.lower() in self.supported_extensions
\ No newline at end of file
+        return file_path.suffix.lower() in self.supported_extensions
+
+def iter_parsed_items(parsed_content: Optional[dict]):
+    """(section, item) pairs of a parse_file result, in section order"""
+    if not parsed_content:
+        return
+    for key, value in parsed_content.items():
+        if isinstance(value, list):
+            for item in value:
+                yield key, item
+        elif isinstance(value, str):
+            yield key, value
+
+
+def _scan_items(scan, sections: Dict[str, str]):
+    for field, key in sections.items():
+        for item in getattr(scan, field):
+            yield key, item
+
+
+def file_encoding(file_path: Path) -> str:
+    """'utf-8' if the whole file is valid UTF-8, else 'latin-1', as read_text decides.
+
+    Streamed parses call this before decoding anything, which costs one extra
+    read of the file but decodes every byte the way a whole-file parse would.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(READ_CHUNK_SIZE):
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return 'latin-1'
+    return 'utf-8'
+
+
+def _decoded_lines(file_path: Path) -> Iterator[str]:
+    """Lines of a file, in the encoding read_text would use for all of it"""
+    encoding = file_encoding(file_path)
+    with open(file_path, 'rb') as f:
+        for line in f:
+            yield line.decode(encoding)
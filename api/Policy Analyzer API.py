@@ -11,27 +11,18 @@ from datetime import datetime
 
 # Import your existing PolicyAnalyzer class
 from collections import defaultdict
-import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+from nlp_resources import get_sent_tokenize
 
 # Your existing PolicyAnalyzer class (with minor modifications for async)
 class PolicyAnalyzer:
     def __init__(self):
-        # Download NLTK data at startup
-        nltk.download('punkt', quiet=True)
-        nltk.download('stopwords', quiet=True)
-        nltk.download('wordnet', quiet=True)
-        
-        self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
+        # NLTK data is loaded lazily from disk by nlp_resources, never downloaded
         self.policy_positions = defaultdict(list)
         self.context_map = defaultdict(list)
         
     async def analyze_document(self, text: str, doc_id: str):
         """Async version of document analysis"""
-        sentences = sent_tokenize(text)
+        sentences = get_sent_tokenize()(text)
         
         for i, sentence in enumerate(sentences):
             start = max(0, i - 2)
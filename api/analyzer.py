@@ -1,127 +1,325 @@
-from collections import defaultdict
+from array import array
+from itertools import islice
 from pathlib import Path
-import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from typing import List, Dict, Set
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+import asyncio
+import os
+import time
+from typing import List, Dict, Optional, Set, Tuple
 import numpy as np
 
-import string
+from ingest import IngestPool, analyze_text, is_policy_relevant
+from metrics import INGEST_STAGE_SECONDS, QUERY_SECONDS, TOPIC_SECONDS
+from inverted_index import InvertedIndex, top_overlap
+from normalize import TextNormalizer, get_normalizer
+from ranking import BM25Index, top_k_scores
+from semantic import SemanticIndex
+from sentence_store import SentenceStore
+from snapshot import INDEX_DIR, capture_snapshot, load_snapshot, save_snapshot, write_snapshot
+from snapshot_job import SnapshotJob
+from topic_job import TopicRefreshJob
+from topics import TopicModel, TopicTagger
 
 
 UPLOAD_DIR = Path("uploads")
+# Topic refresh runs at most once per delay, or sooner once this many documents wait
+TOPIC_REFRESH_DELAY = float(os.environ.get("TOPIC_REFRESH_DELAY", "5"))
+TOPIC_REFRESH_DOCS = int(os.environ.get("TOPIC_REFRESH_DOCS", "20"))
+# The topic model is refitted from the live documents once removals since the last
+# full fit exceed this fraction of the documents it has seen
+TOPIC_REFIT_RATIO = float(os.environ.get("TOPIC_REFIT_RATIO", "0.2"))
+# Snapshots requested by topic refreshes are written at most once per interval (seconds)
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "30"))
+# Statements re-tagged per sparse product when topics change
+TAG_BATCH_SIZE = 10000
 
 class PolicyAnalyzer:
     def __init__(self):
-        # Download NLTK data at startup
-        nltk.download('punkt', quiet=True)
-        nltk.download('stopwords', quiet=True)
-        nltk.download('wordnet', quiet=True)
-        
-        
-        
-        self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
-        self.policy_positions = defaultdict(list)
-        self.context_map = defaultdict(list)
+        # NLTK data is never downloaded here; nlp_resources loads it lazily from disk
         self.all_topics = set()  # Store unique topics
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            stop_words='english',
-            ngram_range=(1, 2)
-        )
-        self.documents_text = self.get_existing_documents() 
+        self.topic_model = TopicModel(num_topics=10)
+        self._topic_tagger: Optional[TopicTagger] = None
+        self.topic_generation = 0
+        self.topics_updated_at: Optional[float] = None
+        # Sentences of each document analyzed since the last topic refresh
+        self.pending_topic_docs: List[List[str]] = []
+        # Documents removed since the topic model was last fitted from scratch
+        self.removed_since_fit = 0
+        self.topic_job = TopicRefreshJob(self, TOPIC_REFRESH_DELAY, TOPIC_REFRESH_DOCS)
+        # Segmented documents and their statements; statement ids key the postings
+        self.store = SentenceStore()
+        self.index = InvertedIndex()
+        self.bm25 = BM25Index()
+        # LSA embeddings of the statements, for the dense and hybrid rankers
+        self.semantic = SemanticIndex()
+        self.ingest_pool = IngestPool()
+        # Catalog of indexed documents, and content hash -> doc_id for deduplication
+        self.documents: Dict[str, Dict] = {}
+        self.doc_hashes: Dict[str, str] = {}
+        # Orders snapshots written from the event loop, see write_snapshot
+        self._snapshot_lock = asyncio.Lock()
+        self.snapshot_job = SnapshotJob(self.write_snapshot, SNAPSHOT_INTERVAL)
+        self.load_snapshot()
         
+    def load_snapshot(self, root: Path = INDEX_DIR) -> bool:
+        """Restore sentences, topics and the fitted topic model from disk"""
+        try:
+            return load_snapshot(self, root)
+        except Exception as e:
+            print(f"Error loading snapshot: {str(e)}")
+            return False
         
-    def get_existing_documents(self):
-        return [f.read_text() for f in UPLOAD_DIR.iterdir() if f.is_file() and not f.name.startswith(".")]
+    def save_snapshot(self, root: Path = INDEX_DIR) -> Path:
+        """Persist the current index so the next startup does not have to re-ingest"""
+        return save_snapshot(self, root)
+    
+    async def write_snapshot(self, root: Path = INDEX_DIR) -> Path:
+        """save_snapshot without blocking the event loop: the state is captured here, then
+        copied and written to disk in a worker thread, so queries and uploads carry on meanwhile"""
+        async with self._snapshot_lock:
+            state = capture_snapshot(self)
+            return await asyncio.to_thread(write_snapshot, state, root)
         
         
         
     async def analyze_document(self, text: str, doc_id: str):
         """Async version of document analysis with dynamic topic extraction"""
-        sentences = sent_tokenize(text)
-        self.documents_text.append(text)
+        # Segmentation and tagging run in the ingest pool so queries are not blocked
+        generation = self.topic_generation
+        analysis = await self.ingest_pool.run(analyze_text, text, self.all_topics)
+        analysis['topic_generation'] = generation
+        self.merge_analysis(doc_id, analysis)
+    
+    def list_documents(self, offset: int = 0, limit: int = 100) -> List[Dict]:
+        """One page of the catalog, in ingest order, without any document text"""
+        return [{'doc_id': doc_id, **meta}
+                for doc_id, meta in islice(self.documents.items(), offset, offset + limit)]
+    
+    def find_document(self, content_hash: str) -> Optional[str]:
+        """doc_id of an already indexed document with this content hash"""
+        return self.doc_hashes.get(content_hash)
+    
+    def document_text(self, doc_id: str) -> str:
+        return self.store.document_text(doc_id)
+    
+    def merge_analysis(self, doc_id: str, analysis: Dict, notify: bool = True,
+                       content_hash: Optional[str] = None, size: Optional[int] = None,
+                       filename: Optional[str] = None, path: Optional[str] = None) -> str:
+        """Fold the output of ingest.analyze_text into the shared index.
+
+        analysis['topic_generation'] is the topic_generation its sentences were
+        tagged against; if topics were published since, they are tagged again.
+
+        Returns the doc_id the content is indexed under: if a document with the same
+        content_hash is already indexed, nothing is merged and its doc_id is returned.
+        With notify=False the document is only queued for the next topic refresh,
+        which lets a batch trigger a single refresh at the end. filename is the
+        stored upload in UPLOAD_DIR; path is a file indexed where it lies, e.g. a
+        watched one. Both go into the catalog, so readers can serve the content.
+        """
+        if content_hash is not None and content_hash in self.doc_hashes:
+            return self.doc_hashes[content_hash]
         
-        # Extract topics when we have enough documents
-        if len(self.documents_text) >= 1:
-            self._extract_topics_from_documents()
+        start = time.perf_counter()
+        sentences = analysis['sentences']
+        relevant = analysis['relevant']
+        if analysis.get('topic_generation', self.topic_generation) != self.topic_generation and relevant:
+            # Tagged by the worker against topics published over since; the refresh
+            # this merge triggers only re-tags statements if the topics change again
+            tags = self.get_topic_tagger().tag([sentences[i] for i, _, _ in relevant])
+            relevant = [(i, sentence_topics, tokens) for (i, _, tokens), sentence_topics in zip(relevant, tags)]
+        doc = self.store.add_document(doc_id, sentences)
+        first = self.store.doc_first[doc]
+        for i, sentence_topics, tokens in relevant:
+            sentence = sentences[i]
+            statement_id = self.store.find(sentence)
+            if statement_id is not None:
+                # Identical sentence seen before: keep one statement and record this source
+                self.store.add_source(statement_id, doc, first + i)
+                continue
+            # Tagged with the current topics; re-tagged when a refresh publishes new ones
+            statement_id = self.store.add_statement(doc, first + i, sentence, sentence_topics, tokens)
+            self._index_statement(statement_id, tokens)
+        self.semantic.update(self.store)
         
-        for i, sentence in enumerate(sentences):
-            start = max(0, i - 2)
-            end = min(len(sentences), i + 3)
-            context = sentences[start:end]
-            
-            if self.is_policy_relevant(sentence):
-                self.policy_positions[doc_id].append(sentence)
-                # Now using dynamically extracted topics
-                sentence_topics = self.extract_topics_from_text(sentence)
-                self.context_map[sentence] = {
-                    'context': context,
-                    'doc_id': doc_id,
-                    'topics': sentence_topics
-                }
+        self.documents[doc_id] = {
+            'filename': filename,
+            'path': path,
+            'hash': content_hash,
+            'size': size,
+            'sentences': len(sentences),
+            'ingested_at': time.time()
+        }
+        if content_hash is not None:
+            self.doc_hashes[content_hash] = doc_id
+        for stage, seconds in analysis.get('timings', {}).items():
+            INGEST_STAGE_SECONDS.observe(seconds, stage)
+        INGEST_STAGE_SECONDS.observe(time.perf_counter() - start, 'merge')
+        
+        # Topic model updates are coalesced by the background refresh job
+        self.pending_topic_docs.append(sentences)
+        if notify:
+            self.topic_job.notify()
+        return doc_id
+    
+    def remove_document(self, doc_id: str, notify: bool = True) -> Optional[Dict]:
+        """Drop a document and the statements only it contained from every index.
+
+        Costs time proportional to the document, not the corpus. Returns its catalog
+        entry, or None if it is not indexed. The topic model keeps what it learned
+        from the document; the refresh job refits it from scratch once enough
+        documents are gone (see TOPIC_REFIT_RATIO) and persists the removal.
+        """
+        meta = self.documents.pop(doc_id, None)
+        if meta is None:
+            return None
+        if meta['hash'] is not None and self.doc_hashes.get(meta['hash']) == doc_id:
+            del self.doc_hashes[meta['hash']]
+        for statement_id in self.store.remove_document(doc_id):
+            self._unindex_statement(statement_id, self.store.tokens(statement_id))
+        self.removed_since_fit += 1
+        if notify:
+            self.topic_job.notify_removal()
+        return meta
+    
+    def replace_document(self, doc_id: str, analysis: Dict, content_hash: Optional[str] = None,
+                         size: Optional[int] = None, filename: Optional[str] = None,
+                         path: Optional[str] = None) -> Optional[Dict]:
+        """Swap a document's content in one step, so queries never see it missing.
+
+        Returns the old catalog entry, or None if doc_id was not indexed.
+        """
+        old = self.remove_document(doc_id, notify=False)
+        self.merge_analysis(doc_id, analysis, notify=False, content_hash=content_hash, size=size,
+                            filename=filename, path=path)
+        self.topic_job.notify_removal()
+        return old
+    
+    def topic_refit_due(self) -> bool:
+        return self.removed_since_fit > TOPIC_REFIT_RATIO * max(1, self.topic_model.num_docs)
+    
+    def live_documents(self) -> List[List[str]]:
+        """Sentences of every indexed document, for refitting the topic model"""
+        store = self.store
+        return [[store.sentence(p, doc) for p in range(store.doc_first[doc], store.doc_first[doc + 1])]
+                for doc in store.doc_index.values()]
+    
+    async def refresh_topics(self) -> bool:
+        """Fold pending documents into the topic model now instead of waiting for the job"""
+        return await self.topic_job.refresh()
+    
+    def _index_statement(self, statement_id: int, tokens: List[str]):
+        """Add the normalized tokens of a new store statement to the posting lists"""
+        self.index.add_tokens(statement_id, tokens)
+        self.bm25.add(statement_id, tokens)
+        self.semantic.add(statement_id)
+    
+    def _unindex_statement(self, statement_id: int, tokens: List[str]):
+        """Remove a tombstoned store statement from the posting lists"""
+        self.index.remove_tokens(statement_id, tokens)
+        self.bm25.remove(statement_id, tokens)
+        self.semantic.remove(statement_id)
+    
+    @property
+    def normalizer(self) -> TextNormalizer:
+        """Tokenize, drop stopwords and lemmatize; shared with the ingest workers"""
+        return get_normalizer()
     
     def is_policy_relevant(self, text: str) -> bool:
-        relevant_terms = {
-            'policy', 'strategy', 'initiative', 'regulation', 'law',
-            'governance', 'framework', 'approach', 'position', 'stance',
-            'development', 'implementation', 'ai', 'artificial intelligence',
-            'declare', 'announce', 'establish', 'create', 'propose'
+        return is_policy_relevant(text)
+    
+    def fit_topics(self, docs: List[List[str]], num_sentences: int, refit: bool = False):
+        """Fit pending documents into a copy of the topic model and re-tag statements.
+
+        Runs in a worker thread, so it never mutates live state; publish_topics swaps
+        the result in. Only the model is returned if the topics did not change, since
+        the statements are already tagged with them.
+        With refit=True docs are fitted into a new, empty model instead.
+        """
+        if refit:
+            model = TopicModel(self.topic_model.num_topics, self.topic_model.terms_per_topic,
+                               self.topic_model.n_features)
+        else:
+            model = self.topic_model.copy()
+        start = time.perf_counter()
+        changed = False
+        for sentences in docs:
+            changed = model.partial_fit(" ".join(sentences), sentences) or changed
+        topic_terms = model.topic_terms() if changed else []
+        TOPIC_SECONDS.observe(time.perf_counter() - start, 'fit')
+        topics = SentenceStore.topic_table({term for terms in topic_terms for term in terms})
+        if not topics or set(topics) == self.all_topics:
+            return model, None
+        tagger = TopicTagger(topics)
+        return model, (topic_terms, tagger, self._tag_statements(tagger, 0, num_sentences))
+    
+    def publish_topics(self, result, num_sentences: int) -> bool:
+        """Atomically install a result of fit_topics. Returns True if topics changed."""
+        model, tagging = result
+        self.topic_model = model
+        if tagging is None:
+            return False
+        topic_terms, tagger, topic_bits = tagging
+        # Statements indexed while the fit was running still carry old tags
+        topic_bits.extend(self._tag_statements(tagger, num_sentences, len(self.store)))
+        # and statements removed meanwhile were tagged while they were still live
+        np.frombuffer(topic_bits, dtype=np.uint64)[np.frombuffer(self.store.statement_pos, dtype=np.int64) < 0] = 0
+        
+        self.all_topics = set(tagger.topics)
+        self._topic_tagger = tagger
+        self.store.replace_topics(tagger.topics, topic_bits)
+        self.topic_generation += 1
+        self.topics_updated_at = time.time()
+        for i, terms in enumerate(topic_terms):
+            print(f"Topic {i}: {terms}")
+        return True
+    
+    def embeddings_due(self) -> bool:
+        return self.semantic.refit_due(self.bm25.num_live)
+    
+    def fit_embeddings(self, num_sentences: int):
+        """Fit the LSA embeddings of statements 0..num_sentences-1; runs in a worker thread"""
+        start = time.perf_counter()
+        result = self.semantic.fit(self.store, num_sentences)
+        TOPIC_SECONDS.observe(time.perf_counter() - start, 'embed')
+        return result
+    
+    def publish_embeddings(self, result):
+        """Install a result of fit_embeddings, embedding statements indexed since"""
+        self.semantic.publish(result, self.store)
+    
+    def use_default_topics(self):
+        # Fallback to some default topics if extraction fails
+        self.all_topics = {
+            "regulation", "safety", "ethics", "development",
+            "governance", "implementation"
         }
-        return any(term in text.lower() for term in relevant_terms)
+        tagger = self.get_topic_tagger()
+        self.store.replace_topics(tagger.topics, self._tag_statements(tagger, 0, len(self.store)))
+        # Analyses in flight were tagged against the topics replaced here
+        self.topic_generation += 1
     
-    def _extract_topics_from_documents(self, num_topics: int = 10):
-        """Extract topics from all documents using TF-IDF and clustering"""
-        try:
-            # Create TF-IDF matrix
-            tfidf_matrix = self.vectorizer.fit_transform(self.documents_text)
-            
-            # Perform clustering
-            kmeans = KMeans(n_clusters=min(num_topics, len(self.documents_text)), random_state=42)
-            kmeans.fit(tfidf_matrix)
-            
-            # Get top terms for each cluster
-            order_centroids = kmeans.cluster_centers_.argsort()[:, ::-1]
-            terms = self.vectorizer.get_feature_names_out()
-            
-            # Store topics
-            self.all_topics.clear()
-            for i in range(len(kmeans.cluster_centers_)):
-                topic_terms = [terms[ind] for ind in order_centroids[i, :5]]
-                print(f"Topic {i}: {topic_terms}")
-                self.all_topics = self.all_topics.union(set(topic_terms))
-                
-        except Exception as e:
-            print(f"Error in topic extraction: {str(e)}")
-            # Fallback to some default topics if extraction fails
-            self.all_topics = {
-                "regulation", "safety", "ethics", "development",
-                "governance", "implementation"
-            }
-    
-    def extract_topics_from_text(self, text: str) -> Set[str]:
+    def get_topic_tagger(self) -> TopicTagger:
+        """Tagger for the current topics, rebuilt when they change"""
+        if self._topic_tagger is None or set(self._topic_tagger.topics) != self.all_topics:
+            self._topic_tagger = TopicTagger(SentenceStore.topic_table(self.all_topics))
+        return self._topic_tagger
+    
+    def _tag_statements(self, tagger: TopicTagger, start: int, end: int) -> array:
+        """Topic bitsets of statements start..end-1, tagged in batches"""
+        started = time.perf_counter()
+        topic_bits = array('Q')
+        for batch in range(start, end, TAG_BATCH_SIZE):
+            statements = [self.store.statement(i) for i in range(batch, min(end, batch + TAG_BATCH_SIZE))]
+            topic_bits.frombytes(tagger.tag_bits(statements).tobytes())
+        TOPIC_SECONDS.observe(time.perf_counter() - started, 'tag')
+        return topic_bits
+    
+    def extract_topics_from_text(self, text: str, all_topics: Optional[Set[str]] = None) -> Set[str]:
         """Extract topics for a specific piece of text"""
-        if not self.all_topics:  # If no topics extracted yet
-            return set("general")
-            
         try:
-            # Transform the text using the same vectorizer
-            text_vector = self.vectorizer.transform([text])
-            
-            # Find similar topics based on term overlap
-            topics = set()
-            for topic in self.all_topics:
-                topic_terms = set(topic.split())
-                text_terms = set(word_tokenize(text.lower()))
-                if len(topic_terms.intersection(text_terms)) > 0:
-                    topics.add(topic)
-            
-            return topics
-            
+            tagger = self.get_topic_tagger() if all_topics is None else TopicTagger(all_topics)
+            # Topics sharing at least one word with the text
+            return tagger.tag([text])[0]
         except Exception as e:
             print(f"Error in text topic extraction: {str(e)}")
             return set()
@@ -129,26 +327,124 @@ class PolicyAnalyzer:
     def get_all_topics(self) -> List[str]:
         """Get all currently extracted topics"""
         return list(self.all_topics)
+    
+    def index_stats(self) -> Dict[str, int]:
+        return {
+            'documents': len(self.documents),
+            'sentences': self.store.num_live_positions,
+            'statements': self.bm25.num_live,
+            'vocabulary': len(self.store.token_names),
+        }
+
+    def index_memory(self) -> Dict[str, int]:
+        """Approximate bytes held by each part of the index"""
+        return {
+            'store': self.store.nbytes(),
+            'postings': self.index.nbytes(),
+            'bm25': self.bm25.nbytes(),
+            'embeddings': self.semantic.nbytes(),
+        }
+
+    def get_topic_status(self) -> Dict:
+        """Generation and age of the published topic model"""
+        age = None
+        if self.topics_updated_at is not None:
+            age = time.time() - self.topics_updated_at
+        return {
+            'generation': self.topic_generation,
+            'age_seconds': age,
+            'pending_documents': len(self.pending_topic_docs)
+        }
 
-    def get_relevant_responses(self, query: str, max_responses: int = 3) -> List[Dict]:
-        query_lower = query.lower()
-        query_topics = self.extract_topics_from_text(query)
+    def get_relevant_responses(self, query: str, max_responses: int = 3, ranker: str = "legacy") -> List[Dict]:
+        """Score only the sentences that share a token or topic with the query.
+
+        ranker="legacy" uses 2 x topic overlap + word overlap, ranker="bm25" uses BM25.
+        Both match on the normalized tokens computed at ingest. ranker="dense" ranks
+        every statement by the cosine similarity of its LSA embedding to the query's,
+        and ranker="hybrid" mixes that with BM25 (see semantic.semantic_top_k).
+        """
+        start = time.perf_counter()
+        tokens = self.normalizer.tokens(query)
+        if ranker == "bm25":
+            ranked = self.bm25.top_k(tokens, max_responses)
+        elif ranker in ("dense", "hybrid"):
+            lexical = None
+            if ranker == "hybrid":
+                candidates, scores = self.bm25.score(tokens)
+                if len(candidates):
+                    scores = scores / self.bm25.max_score(tokens)
+                lexical = candidates, scores
+            ranked = self.semantic.top_k(self._term_ids(tokens), max_responses, lexical)
+        elif ranker == "legacy":
+            topic_members = [self.store.topic_members(t) for t in self.extract_topics_from_text(query)]
+            ranked = self.index.top_k(tokens, topic_members, max_responses)
+        else:
+            raise ValueError(f"Unknown ranker: {ranker}")
+        scored = time.perf_counter()
+        QUERY_SECONDS.observe(scored - start, ranker, 'score')
+        
+        scored_responses = self._responses(ranked)
+        QUERY_SECONDS.observe(time.perf_counter() - scored, ranker, 'serialize')
         
-        scored_responses = []
-        for statement, info in self.context_map.items():
-            score = len(query_topics.intersection(info['topics'])) * 2
-            score += len(set(statement.lower().split()).intersection(set(query_lower.split())))
-            
-            if score > 0:
-                scored_responses.append({
-                    'statement': statement,
-                    'score': score,
-                    'source': info['doc_id'],
-                    'context': info['context'],
-                    'topics': list(info['topics'])
-                })
+        return scored_responses
+    
+    def get_relevant_responses_batch(self, queries: List[Tuple[str, int, str]]) -> List[List[Dict]]:
+        """get_relevant_responses of several (query, max_responses, ranker), scored together.
+
+        Queries are grouped by ranker. A group is scored with one sparse product
+        of its (queries x terms) matrix against the postings (BM25Index.score_batch,
+        InvertedIndex.score_batch), or with matrix-matrix products against the
+        embeddings (semantic.semantic_top_k_batch), instead of once per query.
+        """
+        groups: Dict[str, List[int]] = {}
+        for i, (_, _, ranker) in enumerate(queries):
+            if ranker not in ("legacy", "bm25", "dense", "hybrid"):
+                raise ValueError(f"Unknown ranker: {ranker}")
+            groups.setdefault(ranker, []).append(i)
         
-        return sorted(scored_responses, key=lambda x: x['score'], reverse=True)[:max_responses]
+        results: List[List[Dict]] = [[] for _ in queries]
+        for ranker, members in groups.items():
+            start = time.perf_counter()
+            texts = [queries[i][0] for i in members]
+            ks = [queries[i][1] for i in members]
+            tokens = [self.normalizer.tokens(text) for text in texts]
+            if ranker == "bm25":
+                ranked = [top_k_scores(*scores, k) for scores, k in zip(self.bm25.score_batch(tokens), ks)]
+            elif ranker == "legacy":
+                topics = [sorted(query_topics) for query_topics in self.get_topic_tagger().tag(texts)]
+                scores = self.index.score_batch(tokens, topics, self.store.topic_members)
+                ranked = [top_overlap(*query_scores, k) for query_scores, k in zip(scores, ks)]
+            else:
+                lexical = None
+                if ranker == "hybrid":
+                    lexical = []
+                    for query_tokens, (candidates, scores) in zip(tokens, self.bm25.score_batch(tokens)):
+                        if len(candidates):
+                            scores = scores / self.bm25.max_score(query_tokens)
+                        lexical.append((candidates, scores))
+                ranked = self.semantic.top_k_batch([self._term_ids(t) for t in tokens], ks, lexical)
+            scored = time.perf_counter()
+            QUERY_SECONDS.observe(scored - start, ranker, 'batch')
+            for i, query_ranked in zip(members, ranked):
+                results[i] = self._responses(query_ranked)
+            QUERY_SECONDS.observe(time.perf_counter() - scored, ranker, 'serialize')
+        return results
+    
+    def _term_ids(self, tokens: List[str]) -> np.ndarray:
+        """Sorted distinct store token ids of a query, as used by the embeddings"""
+        return np.array(sorted({self.store.token_ids[t] for t in tokens if t in self.store.token_ids}),
+                        dtype=np.int64)
+    
+    def _responses(self, ranked: List[Tuple[int, float]]) -> List[Dict]:
+        return [{
+            'statement': self.store.statement(statement_id),
+            'score': score,
+            'source': self.store.doc_id(statement_id),
+            'sources': self.store.sources(statement_id),
+            'context': self.store.context(statement_id),
+            'topics': list(self.store.topics(statement_id))
+        } for statement_id, score in ranked]
     
     
     
\ No newline at end of file
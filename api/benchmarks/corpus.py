@@ -0,0 +1,223 @@
+"""Deterministic synthetic corpus: policy-like prose, code files and queries.
+
+The same seed always yields byte-identical files, so results from different
+commits are comparable.
+
+    python benchmarks/corpus.py out/ --docs 100 --doc-kb 20
+"""
+from pathlib import Path
+from typing import List
+import argparse
+import random
+
+
+COUNTRIES = ["France", "Germany", "Canada", "Japan", "Brazil", "India", "Kenya", "Norway",
+             "the United Kingdom", "the European Union", "Singapore", "Australia"]
+ACTORS = ["The government", "The ministry", "The national regulator", "Parliament",
+          "The commission", "The data protection authority", "The digital agency"]
+ACTIONS = ["announced", "proposed", "established", "published", "adopted", "declared",
+           "launched", "revised", "consulted on", "funded"]
+SUBJECTS = ["a national AI strategy", "a regulation on automated decision making",
+            "a governance framework for public sector algorithms", "a data sharing initiative",
+            "an approach to AI safety testing", "a law on biometric surveillance",
+            "a development plan for research centres", "an implementation roadmap for cloud services",
+            "a position on open source models", "a policy on algorithmic transparency"]
+TOPICS = ["privacy", "safety", "ethics", "competition", "education", "health", "energy",
+          "cybersecurity", "employment", "innovation", "transparency", "accountability"]
+FILLER = ["The report was discussed in several public hearings.",
+          "Stakeholders submitted written comments over three months.",
+          "Funding is spread across five years.",
+          "Regional offices will coordinate the rollout with local partners.",
+          "A summary of the responses is available in the annex.",
+          "The budget was approved after a second reading.",
+          "Independent experts reviewed the figures."]
+
+
+def policy_sentence(rng: random.Random) -> str:
+    """One sentence, policy-relevant most of the time"""
+    if rng.random() < 0.3:
+        return rng.choice(FILLER)
+    year = rng.randint(2015, 2025)
+    topic, other = rng.sample(TOPICS, 2)
+    return rng.choice([
+        f"{rng.choice(ACTORS)} of {rng.choice(COUNTRIES)} {rng.choice(ACTIONS)} {rng.choice(SUBJECTS)} in {year}.",
+        f"In {year}, {rng.choice(COUNTRIES)} {rng.choice(ACTIONS)} {rng.choice(SUBJECTS)} focused on {topic}.",
+        f"{rng.choice(SUBJECTS).capitalize()} addresses {topic} and {other} in {rng.choice(COUNTRIES)}.",
+        f"Critics argue that the {topic} provisions of the framework lack enforcement.",
+    ])
+
+
+def policy_text(n_bytes: int, seed: int = 0) -> str:
+    """Paragraphs of policy_sentence until n_bytes"""
+    rng = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < n_bytes:
+        paragraph = " ".join(policy_sentence(rng) for _ in range(rng.randint(3, 8)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def markdown(n_bytes: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, size, i = [], 0, 0
+    while size < n_bytes:
+        part = rng.choice([
+            f"# {rng.choice(SUBJECTS).capitalize()}\n\n",
+            f"## Section {i}: {rng.choice(TOPICS)}\n\n",
+            " ".join(policy_sentence(rng) for _ in range(4)) + "\n\n",
+            f"```python\nrule_{i} = check('{rng.choice(TOPICS)}')\n```\n\n",
+        ])
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def python_source(n_bytes: int, seed: int = 4) -> str:
+    """Functions and classes whose comments and docstrings carry policy text"""
+    rng = random.Random(seed)
+    parts, size, i = [], 0, 0
+    while size < n_bytes:
+        part = rng.choice([
+            f"# {policy_sentence(rng)}\ndef check_{i}(record, threshold=0.5):\n"
+            f"    \"\"\"{policy_sentence(rng)}\"\"\"\n    return record.score > threshold\n\n",
+            f"class Rule{i}:\n    \"\"\"{policy_sentence(rng)}\"\"\"\n\n"
+            f"    def apply(self, data):\n        return [d for d in data if d]\n\n",
+            f"LIMIT_{i} = {rng.randint(1, 1000)}  # {rng.choice(FILLER)}\n",
+        ])
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def minified_js(n_bytes: int, seed: int = 0) -> str:
+    """One long line of functions, arrow functions, calls, strings and comments"""
+    rng = random.Random(seed)
+    parts, size, i = [], 0, 0
+    while size < n_bytes:
+        part = rng.choice([
+            f"function f{i}(a,b){{return a+b*({i})}}",
+            f"const c{i}=(x,y)=>x({i},y);",
+            f"var s{i}='str {i} // not a comment',t{i}=\"q(\";",
+            f"/* block {i} */",
+            f"if(a{i}){{b{i}(c,d(e,f))}}",
+            # Parenthesized initializers with no arrow after them
+            f"const v{i}=(a{i}+b)*c;",
+        ])
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def typescript(n_bytes: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    parts, size, i = [], 0, 0
+    while size < n_bytes:
+        part = rng.choice([
+            f"// comment {i}\n",
+            f"interface I{i} {{ id: number; name: string }}\n",
+            f"type T{i} = string | number;\n",
+            f"export function Comp{i}(props: I{i}) {{ return props.name; }}\n",
+            f"const handler{i} = (e: Event) => {{ console.log(e); }};\n",
+        ])
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def java(n_bytes: int, seed: int = 2) -> str:
+    rng = random.Random(seed)
+    parts, size, i = ["public class Generated {\n"], 0, 0
+    while size < n_bytes:
+        part = rng.choice([
+            f"  /** Javadoc for m{i} */\n",
+            f"  public static List<String> m{i}(int a, String[] b) {{ return helper(a, b); }}\n",
+            f"  private int v{i} = compute({i});\n",
+            f"  static class Inner{i} {{ }}\n",
+        ])
+        parts.append(part)
+        size += len(part)
+        i += 1
+    parts.append("}\n")
+    return "".join(parts)
+
+
+def cpp_header(n_bytes: int, seed: int = 3) -> str:
+    """Declarations mixed with long runs of words and no parentheses"""
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "uint32_t", "const", "static", "ptr*", "ref&", "ns::x"]
+    parts, size, i = [], 0, 0
+    while size < n_bytes:
+        part = rng.choice([
+            f"// comment {i}\n",
+            f"static inline const unsigned long long * fn{i}(int a, char **b);\n",
+            f"class C{i} : public Base {{ public: virtual void m{i}(int x) const; }};\n",
+            f"#define MACRO{i}(x) ((x) * {i})\n",
+            " ".join(rng.choice(words) for _ in range(200)) + "\n",
+        ])
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+# Generator of each file type, and its share of the generated documents
+FILE_TYPES = [
+    ('.txt', policy_text, 0.6),
+    ('.md', markdown, 0.1),
+    ('.py', python_source, 0.1),
+    ('.ts', typescript, 0.1),
+    ('.java', java, 0.05),
+    ('.h', cpp_header, 0.05),
+]
+
+
+def write_corpus(directory: Path, docs: int, doc_bytes: int, seed: int = 0) -> List[Path]:
+    """Write docs files of about doc_bytes each; the file type mix follows FILE_TYPES"""
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    suffixes = [suffix for suffix, _, _ in FILE_TYPES]
+    weights = [share for _, _, share in FILE_TYPES]
+    generators = {suffix: generate for suffix, generate, _ in FILE_TYPES}
+    paths = []
+    for i in range(docs):
+        suffix = rng.choices(suffixes, weights)[0]
+        path = directory / f"doc{i:05d}{suffix}"
+        path.write_text(generators[suffix](doc_bytes, seed=seed * 100003 + i), encoding='utf-8')
+        paths.append(path)
+    return paths
+
+
+def queries(n: int, seed: int = 0) -> List[str]:
+    """Short keyword queries, plus some phrased as questions"""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(n):
+        topic = rng.choice(TOPICS)
+        result.append(rng.choice([
+            f"{topic} regulation",
+            f"{rng.choice(COUNTRIES)} AI strategy",
+            f"What did {rng.choice(COUNTRIES)} propose on {topic}?",
+            f"{rng.choice(SUBJECTS)} {topic}",
+            f"{topic} {rng.choice(TOPICS)} framework",
+        ]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--doc-kb", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = write_corpus(args.directory, args.docs, int(args.doc_kb * 1024), args.seed)
+    print(f"Wrote {len(paths)} files to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
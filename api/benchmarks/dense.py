@@ -0,0 +1,107 @@
+"""Latency of the dense and hybrid rankers against a large embedding matrix.
+
+Fits LSA embeddings on a synthetic corpus the way the topic refresh does, then
+scores the queries against --rows statements: the fitted embeddings repeated
+(sampled with replacement) up to that many rows, which costs the same to scan
+as distinct ones. Hybrid queries fuse in the BM25 scores of the fitted corpus.
+Prints JSON, including whether the median stays within --budget-ms.
+
+    python benchmarks/dense.py --rows 1000000
+"""
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+from analyzer import PolicyAnalyzer  # noqa: E402
+from corpus import policy_text, queries  # noqa: E402
+from ingest import analyze_text  # noqa: E402
+from nlp_resources import warm_up  # noqa: E402
+from semantic import semantic_top_k  # noqa: E402
+
+
+def latency_summary(seconds: List[float]) -> Dict:
+    values = np.asarray(seconds) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p90_ms': round(float(np.percentile(values, 90)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'qps': round(len(values) / values.sum() * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000, help="statements to score per query")
+    parser.add_argument("--docs", type=int, default=200, help="synthetic documents to fit on")
+    parser.add_argument("--doc-kb", type=float, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-responses", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # The analyzer reads and writes index/ relative to the working directory
+        os.chdir(scratch)
+        warm_up()
+        analyzer = PolicyAnalyzer()
+        for i in range(args.docs):
+            text = policy_text(int(args.doc_kb * 1024), seed=args.seed * 100003 + i)
+            analyzer.merge_analysis(f"doc-{i:05d}", analyze_text(text, set()), notify=False)
+        start = time.perf_counter()
+        result = analyzer.fit_embeddings(len(analyzer.store))
+        fit_seconds = time.perf_counter() - start
+        analyzer.publish_embeddings(result)
+        analyzer.ingest_pool.shutdown()
+
+    semantic, bm25, store = analyzer.semantic, analyzer.bm25, analyzer.store
+    if semantic.model is None:
+        sys.exit("Corpus too small to fit any embedding dimension")
+    rng = np.random.default_rng(args.seed)
+    embeddings = np.ascontiguousarray(semantic.embeddings[rng.integers(0, semantic.num_rows, args.rows)])
+
+    latencies = {'dense': [], 'hybrid': []}
+    for text in queries(args.queries, args.seed):
+        tokens = analyzer.normalizer.tokens(text)
+        for ranker, seconds in latencies.items():
+            start = time.perf_counter()
+            term_ids = np.array(sorted({store.token_ids[t] for t in tokens if t in store.token_ids}),
+                                dtype=np.int64)
+            lexical = None
+            if ranker == "hybrid":
+                candidates, scores = bm25.score(tokens)
+                if len(candidates):
+                    scores = scores / bm25.max_score(tokens)
+                lexical = candidates, scores
+            semantic_top_k(embeddings, None, semantic.query_vector(term_ids), args.max_responses, lexical)
+            seconds.append(time.perf_counter() - start)
+
+    report = {ranker: latency_summary(seconds) for ranker, seconds in latencies.items()}
+    for summary in report.values():
+        summary['within_budget'] = summary['p50_ms'] <= args.budget_ms
+    print(json.dumps({
+        'meta': {'cpus': os.cpu_count(), 'rows': args.rows, 'queries': args.queries,
+                 'max_responses': args.max_responses, 'budget_ms': args.budget_ms},
+        'fit': {
+            'statements': semantic.num_rows,
+            'vocabulary': len(store.token_names),
+            'dimensions': semantic.model.dimensions,
+            'seconds': round(fit_seconds, 3),
+            'matrix_mb': round(embeddings.nbytes / (1 << 20), 1),
+        },
+        **report,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
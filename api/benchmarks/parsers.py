@@ -0,0 +1,77 @@
+"""Parser benchmark on multi-MB generated sources, including inputs that made the
+old regex parsers backtrack quadratically. Each C-family input is also fed to
+SourceScanner in --chunk-kb chunks, as uploads are streamed, and the items must
+match a whole-file scan_source ('stream_matches'). Prints a JSON report.
+
+    python benchmarks/parsers.py --sizes 1 2 4 8
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from CodeFileParser import CodeFileParser  # noqa: E402
+from code_scanner import ScanResult, SourceScanner, scan_source  # noqa: E402
+from corpus import cpp_header, java, minified_js, typescript  # noqa: E402
+
+
+CASES = {
+    'javascript': ('parse_javascript', minified_js),
+    'typescript': ('parse_typescript', typescript),
+    'java': ('parse_java', java),
+    'cpp': ('parse_cpp', cpp_header),
+}
+
+
+def bench(parser: CodeFileParser, method: str, content: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        asyncio.run(getattr(parser, method)(content))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def scan_in_chunks(content: str, chunk: int) -> ScanResult:
+    """SourceScanner fed `chunk` characters at a time, its items gathered into one result"""
+    scanner, combined = SourceScanner(), ScanResult()
+    pieces = [content[i:i + chunk] for i in range(0, len(content), chunk)] + ['']
+    for i, piece in enumerate(pieces):
+        result = scanner.feed(piece, final=i == len(pieces) - 1)
+        for field, items in vars(result).items():
+            getattr(combined, field).extend(items)
+    return combined
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 4, 8], help="input sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-kb", type=float, default=1,
+                        help="chunk size of the streamed scan; small, so tokens straddle chunks")
+    args = parser.parse_args()
+
+    code_parser = CodeFileParser()
+    report = {}
+    for language, (method, generate) in CASES.items():
+        rows = []
+        for size_mb in args.sizes:
+            content = generate(int(size_mb * (1 << 20)))
+            seconds = bench(code_parser, method, content, args.repeat)
+            rows.append({
+                'mb': size_mb,
+                'seconds': round(seconds, 4),
+                'mb_per_second': round(size_mb / seconds, 2),
+                'stream_matches': (vars(scan_in_chunks(content, int(args.chunk_kb * 1024)))
+                                   == vars(scan_source(content))),
+            })
+        report[language] = rows
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
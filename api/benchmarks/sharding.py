@@ -0,0 +1,133 @@
+"""Query throughput of the segment index against the number of index shards.
+
+Builds one synthetic generation, then replays the same queries from several
+client threads against SegmentIndex without shards and with a ShardPool of each
+requested size. Every sharded run is checked against the unsharded results.
+Shards only scale while there are free cores, so compare runs on the same
+machine and keep --shards at or below the `cpus` it reports. Prints JSON.
+
+    python benchmarks/sharding.py --statements 200000 --shards 1 2 4 8
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+from analyzer import PolicyAnalyzer  # noqa: E402
+from corpus import policy_sentence, queries  # noqa: E402
+from ingest import analyze_text  # noqa: E402
+from nlp_resources import warm_up  # noqa: E402
+from segments import SegmentIndex  # noqa: E402
+from shards import ShardPool  # noqa: E402
+
+SENTENCES_PER_DOC = 200
+
+
+def build_index(root: Path, statements: int, seed: int) -> Dict:
+    """Index distinct policy sentences, SENTENCES_PER_DOC to a document, and snapshot them"""
+    rng = random.Random(seed)
+    analyzer = PolicyAnalyzer()
+    start = time.perf_counter()
+    for doc in range((statements + SENTENCES_PER_DOC - 1) // SENTENCES_PER_DOC):
+        # The clause number keeps sentences distinct, so none collapse into one statement
+        text = " ".join(f"{policy_sentence(rng)[:-1]} under clause {doc}-{i}."
+                        for i in range(SENTENCES_PER_DOC))
+        analyzer.merge_analysis(f"doc-{doc:06d}", analyze_text(text, set()), notify=False)
+    build_seconds = time.perf_counter() - start
+    analyzer.save_snapshot(root)
+    stats = analyzer.index_stats()
+    analyzer.ingest_pool.shutdown()
+    return {**stats, 'build_seconds': round(build_seconds, 2)}
+
+
+def replay(index: SegmentIndex, query_texts: List[str], ranker: str, max_responses: int,
+           threads: int) -> Dict:
+    """Run every query once from `threads` concurrent clients"""
+    def one(query: str):
+        start = time.perf_counter()
+        _, ranked = index.rank(query, max_responses, ranker)
+        return ranked, time.perf_counter() - start
+
+    # Warm the page cache and, with shards, the processes
+    for query in query_texts[:10]:
+        index.rank(query, max_responses, ranker)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        outcomes = list(pool.map(one, query_texts))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(seconds for _, seconds in outcomes)
+    return {
+        'results': [ranked for ranked, _ in outcomes],
+        'qps': round(len(query_texts) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+    }
+
+
+def run_config(root: Path, num_shards: Optional[int], args, query_texts: List[str]) -> Dict:
+    shards = ShardPool(num_shards) if num_shards else None
+    index = SegmentIndex(root, shards=shards)
+    if shards is not None:
+        index.refresh()
+    try:
+        return {ranker: replay(index, query_texts, ranker, args.max_responses, args.threads)
+                for ranker in args.rankers}
+    finally:
+        index.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--statements", type=int, default=200000)
+    parser.add_argument("--shards", type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=16, help="concurrent query clients")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-responses", type=int, default=10)
+    parser.add_argument("--rankers", nargs='+', default=["bm25", "legacy"], choices=["bm25", "legacy"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # The analyzer reads and writes index/ relative to the working directory
+        os.chdir(scratch)
+        warm_up()
+        root = Path(scratch) / "index"
+        index_stats = build_index(root, args.statements, args.seed)
+        query_texts = queries(args.queries, args.seed)
+
+        baseline = run_config(root, None, args, query_texts)
+        report = {'unsharded': {}, 'shards': {}}
+        for ranker in args.rankers:
+            report['unsharded'][ranker] = {k: v for k, v in baseline[ranker].items() if k != 'results'}
+        for num_shards in sorted(args.shards):
+            result = run_config(root, num_shards, args, query_texts)
+            report['shards'][num_shards] = {}
+            for ranker in args.rankers:
+                run = result[ranker]
+                one_shard = report['shards'].get(min(args.shards), {}).get(ranker, run)
+                report['shards'][num_shards][ranker] = {
+                    **{k: v for k, v in run.items() if k != 'results'},
+                    # Throughput relative to the smallest shard count, ideally num_shards / min(shards)
+                    'speedup': round(run['qps'] / one_shard['qps'], 2),
+                    'mismatches': sum(a != b for a, b in zip(run['results'], baseline[ranker]['results'])),
+                }
+
+    print(json.dumps({
+        'meta': {'cpus': os.cpu_count(), 'threads': args.threads, 'queries': args.queries,
+                 'max_responses': args.max_responses, 'seed': args.seed},
+        'index': index_stats,
+        **report,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Startup-time benchmark: how long until `main` is imported, its index opened, and ready to serve.
+
+Each run is a fresh interpreter, started in a scratch directory (or --workdir, to
+include loading an existing index snapshot). Prints a JSON summary; ready includes
+the import, so ready minus import is open_index(). The first query runs without the
+warm-up the server starts in the background, so it pays for importing NLTK and
+loading its data.
+
+    python benchmarks/startup.py --runs 5
+"""
+from pathlib import Path
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {str(API_DIR)!r})
+import main
+imported = time.perf_counter() - start
+main.open_index()
+ready = time.perf_counter() - start
+heavy = sorted(m for m in ('nltk', 'sklearn', 'scipy.stats') if m in sys.modules)
+start = time.perf_counter()
+main.analyzer.get_relevant_responses("AI regulation policy")
+first_query = time.perf_counter() - start
+print(json.dumps({{'import': imported, 'ready': ready, 'first_query': first_query, 'heavy_modules': heavy}}))
+"""
+
+
+def run_once(workdir: Path) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=workdir, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(values):
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'max': max(values),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workdir", type=Path, default=None,
+                        help="directory with uploads/ and index/ to start from (default: empty scratch dir)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        workdir = args.workdir or Path(scratch)
+        runs = [run_once(workdir) for _ in range(args.runs)]
+
+    print(json.dumps({
+        'runs': args.runs,
+        'import_seconds': summarize([r['import'] for r in runs]),
+        'ready_seconds': summarize([r['ready'] for r in runs]),
+        'first_query_seconds': summarize([r['first_query'] for r in runs]),
+        'heavy_modules_at_ready': runs[-1]['heavy_modules'],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Ingestion and query benchmark over a deterministic synthetic corpus.
+
+Ingests a generated corpus into a fresh PolicyAnalyzer the way the upload
+endpoints do (parse_and_analyze, then merge_analysis), refreshes topics once,
+then replays generated queries against each ranker, one by one and in batches
+of --batch-size. Reports ingest throughput per stage and file type, topic
+extraction time, query latency percentiles, batch queries per second and
+memory per sentence as JSON. Write a baseline with --output and compare a later
+commit against it with --compare.
+
+    python benchmarks/suite.py --docs 200 --doc-kb 20 --output before.json
+    python benchmarks/suite.py --docs 200 --doc-kb 20 --compare before.json
+"""
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import asyncio
+import gc
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+from analyzer import PolicyAnalyzer  # noqa: E402
+from corpus import queries, write_corpus  # noqa: E402
+from ingest import parse_and_analyze  # noqa: E402
+from nlp_resources import warm_up  # noqa: E402
+
+RANKERS = ("legacy", "bm25", "dense", "hybrid")
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        # Peak rather than current outside Linux; kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def latency_summary(seconds: List[float]) -> Dict:
+    values = np.asarray(seconds) * 1000
+    return {
+        'count': len(values),
+        'p50_ms': round(float(np.percentile(values, 50)), 4),
+        'p90_ms': round(float(np.percentile(values, 90)), 4),
+        'p99_ms': round(float(np.percentile(values, 99)), 4),
+        'mean_ms': round(float(values.mean()), 4),
+        'qps': round(len(values) / values.sum() * 1000, 1) if values.sum() else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def ingest(analyzer: PolicyAnalyzer, paths: List[Path]) -> Dict:
+    """Ingest every file in one process; returns throughput and per-stage totals"""
+    stages = defaultdict(float)
+    by_type = defaultdict(lambda: {'files': 0, 'bytes': 0, 'parse_seconds': 0.0})
+    total_bytes = 0
+    start = time.perf_counter()
+    for path in paths:
+        data = path.read_bytes()
+        total_bytes += len(data)
+        _, analysis, timings = parse_and_analyze(path, analyzer.all_topics)
+        for stage, seconds in timings.items():
+            stages[stage] += seconds
+        file_type = by_type[path.suffix]
+        file_type['files'] += 1
+        file_type['bytes'] += len(data)
+        file_type['parse_seconds'] += timings['parse']
+        if analysis is None:
+            continue
+        merge_start = time.perf_counter()
+        analyzer.merge_analysis(path.stem, analysis, notify=False,
+                                content_hash=hashlib.sha256(data).hexdigest(), size=len(data))
+        stages['merge'] += time.perf_counter() - merge_start
+    elapsed = time.perf_counter() - start
+    for file_type in by_type.values():
+        file_type['parse_mb_per_second'] = round(
+            file_type['bytes'] / (1 << 20) / file_type['parse_seconds'], 2) if file_type['parse_seconds'] else None
+        file_type['parse_seconds'] = round(file_type['parse_seconds'], 4)
+    return {
+        'files': len(paths),
+        'mb': round(total_bytes / (1 << 20), 3),
+        'seconds': round(elapsed, 4),
+        'mb_per_second': round(total_bytes / (1 << 20) / elapsed, 3),
+        'docs_per_second': round(len(paths) / elapsed, 2),
+        'sentences_per_second': round(analyzer.store.num_positions / elapsed, 1),
+        'stage_seconds': {stage: round(seconds, 4) for stage, seconds in stages.items()},
+        'by_type': dict(by_type),
+    }
+
+
+def query_latencies(analyzer: PolicyAnalyzer, query_texts: List[str], max_responses: int) -> Dict:
+    results = {}
+    for ranker in RANKERS:
+        # One untimed pass so lazy caches and imports do not count
+        analyzer.get_relevant_responses(query_texts[0], max_responses, ranker)
+        seconds = []
+        for text in query_texts:
+            start = time.perf_counter()
+            analyzer.get_relevant_responses(text, max_responses, ranker)
+            seconds.append(time.perf_counter() - start)
+        results[ranker] = latency_summary(seconds)
+    return results
+
+
+def batch_throughput(analyzer: PolicyAnalyzer, query_texts: List[str], max_responses: int,
+                     batch_size: int) -> Dict:
+    """Queries per second through get_relevant_responses_batch, as /query/batch/ runs them"""
+    results = {}
+    for ranker in RANKERS:
+        queries = [(text, max_responses, ranker) for text in query_texts]
+        analyzer.get_relevant_responses_batch(queries[:1])
+        start = time.perf_counter()
+        for i in range(0, len(queries), batch_size):
+            analyzer.get_relevant_responses_batch(queries[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        results[ranker] = {'qps': round(len(queries) / elapsed, 1) if elapsed else None}
+    return results
+
+
+def run(args) -> Dict:
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        # The analyzer reads and writes index/ relative to the working directory
+        os.chdir(scratch)
+        paths = write_corpus(scratch / "corpus", args.docs, int(args.doc_kb * 1024), args.seed)
+        query_texts = queries(args.queries, args.seed)
+        # Loaded in the background at server startup, so not part of ingest time
+        warm_up()
+
+        gc.collect()
+        rss_before = rss_bytes()
+        analyzer = PolicyAnalyzer()
+        ingest_results = ingest(analyzer, paths)
+        gc.collect()
+        rss_ingested = rss_bytes()
+
+        start = time.perf_counter()
+        asyncio.run(analyzer.refresh_topics())
+        topic_seconds = time.perf_counter() - start
+        gc.collect()
+        rss_topics = rss_bytes()
+        sentences = analyzer.store.num_positions
+        statements = len(analyzer.store)
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'params': {'docs': args.docs, 'doc_kb': args.doc_kb, 'queries': args.queries,
+                           'max_responses': args.max_responses, 'batch_size': args.batch_size,
+                           'seed': args.seed},
+            },
+            'ingest': ingest_results,
+            'topics': {
+                'refresh_seconds': round(topic_seconds, 4),
+                'topics': len(analyzer.all_topics),
+                # The refresh also fits the LSA embeddings of the dense rankers
+                'embedding_dimensions': analyzer.semantic.model.dimensions if analyzer.semantic.model else 0,
+            },
+            'query': query_latencies(analyzer, query_texts, args.max_responses),
+            'query_batch': batch_throughput(analyzer, query_texts, args.max_responses, args.batch_size),
+            'memory': {
+                'sentences': sentences,
+                'statements': statements,
+                # Index only; the topic model is a fixed-size allocation measured separately
+                'index_rss_mb': round((rss_ingested - rss_before) / (1 << 20), 2),
+                'topic_model_rss_mb': round((rss_topics - rss_ingested) / (1 << 20), 2),
+                'bytes_per_sentence': round((rss_ingested - rss_before) / sentences, 1) if sentences else None,
+                'bytes_per_statement': round((rss_ingested - rss_before) / statements, 1) if statements else None,
+            },
+        }
+
+
+def flatten(report: Dict, prefix: str = '') -> Dict[str, float]:
+    """Numeric leaves of a report, keyed by dotted path"""
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(report: Dict, baseline: Dict) -> Dict[str, Dict]:
+    """Relative change of every metric present in both reports, skipping parameters"""
+    current, before = flatten(report), flatten(baseline)
+    changes = {}
+    for name, value in current.items():
+        if name.startswith('meta.') or name not in before:
+            continue
+        old = before[name]
+        changes[name] = {
+            'before': old,
+            'after': value,
+            'change_percent': round((value - old) / old * 100, 1) if old else None,
+        }
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--doc-kb", type=float, default=20, help="approximate size of each file")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-responses", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=100, help="queries per batch in query_batch")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="also write the report to this file")
+    parser.add_argument("--compare", type=Path, help="report from an earlier run to compare against")
+    args = parser.parse_args()
+    # Resolved before run() changes into the scratch directory
+    output = args.output.resolve() if args.output else None
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+
+    report = run(args)
+    if baseline is not None:
+        report['comparison'] = {'baseline_commit': baseline.get('meta', {}).get('commit'),
+                                'metrics': compare(report, baseline)}
+    text = json.dumps(report, indent=2)
+    if output is not None:
+        output.write_text(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
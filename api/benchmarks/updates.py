@@ -0,0 +1,154 @@
+"""Cost of removing documents from the live index, and a check of the snapshots it writes after.
+
+Neighbouring documents share some sentences, so removing one moves the sources
+of the statements it shares instead of tombstoning them. Times remove_document
+against document size, then removes --churn of the corpus and re-adds half of
+what it removed under the same doc ids, as PUT /documents/{doc_id} would.
+
+Every query is then replayed against a SegmentIndex opened from a snapshot of
+the result, and each response must match the live analyzer's ('mismatches').
+One more document is removed between capturing that snapshot and writing it,
+as the event loop may while the writer thread copies; the snapshot must still
+contain it. Prints JSON.
+
+    python benchmarks/updates.py --docs 2000 --sizes 10 100 1000 10000
+"""
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+from analyzer import PolicyAnalyzer  # noqa: E402
+from corpus import policy_sentence, queries  # noqa: E402
+from ingest import analyze_text  # noqa: E402
+from nlp_resources import warm_up  # noqa: E402
+from segments import SegmentIndex  # noqa: E402
+from snapshot import capture_snapshot, write_snapshot  # noqa: E402
+
+RANKERS = ("legacy", "bm25", "dense", "hybrid")
+
+
+def document(doc: int, sentences: int, shared: int, seed: int) -> str:
+    """Distinct sentences, plus `shared` that the document shares with its pair (doc ^ 1)"""
+    pair = random.Random(seed * 100003 + doc // 2)
+    rng = random.Random(seed * 100003 + doc + 50000)
+    # The clause numbers keep sentences distinct, so only the shared ones collapse into one statement
+    parts = [f"{policy_sentence(pair)[:-1]} under shared clause {doc // 2}-{i}." for i in range(shared)]
+    parts += [f"{policy_sentence(rng)[:-1]} under clause {doc}-{i}." for i in range(sentences)]
+    return " ".join(parts)
+
+
+def removal_seconds(analyzer: PolicyAnalyzer, size: int, repeat: int, seed: int) -> float:
+    """Best time to remove a document of `size` sentences from the built index"""
+    best = float('inf')
+    for attempt in range(repeat):
+        doc_id = f"timed-{size}-{attempt}"
+        analyzer.merge_analysis(doc_id, analyze_text(document(-1 - attempt, size, 0, seed), set()), notify=False)
+        start = time.perf_counter()
+        analyzer.remove_document(doc_id, notify=False)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def dangling_sources(analyzer: PolicyAnalyzer) -> int:
+    """Sources of live statements that name a document no longer indexed"""
+    store = analyzer.store
+    return sum(doc_id not in analyzer.documents
+               for statement_id in range(len(store)) if not store.is_removed(statement_id)
+               for doc_id in store.sources(statement_id))
+
+
+def comparable(responses: List[Dict]) -> List[Dict]:
+    """Responses without float noise in the scores or ordering within the topic sets"""
+    return [dict(r, score=round(r['score'], 4), topics=sorted(r['topics'])) for r in responses]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--sentences", type=int, default=40, help="distinct sentences per document")
+    parser.add_argument("--shared", type=int, default=10, help="sentences shared with the paired document")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="sentences in the documents removal is timed on")
+    parser.add_argument("--churn", type=float, default=0.2, help="fraction of documents removed")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-responses", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # The analyzer reads and writes index/ relative to the working directory
+        os.chdir(scratch)
+        warm_up()
+        analyzer = PolicyAnalyzer()
+        texts = {f"doc-{doc:06d}": document(doc, args.sentences, args.shared, args.seed)
+                 for doc in range(args.docs)}
+        for doc_id, text in texts.items():
+            analyzer.merge_analysis(doc_id, analyze_text(text, set()), notify=False)
+        analyzer.publish_embeddings(analyzer.fit_embeddings(len(analyzer.store)))
+
+        removal = {}
+        for size in args.sizes:
+            seconds = removal_seconds(analyzer, size, args.repeat, args.seed)
+            removal[size] = {'ms': round(seconds * 1000, 3), 'us_per_sentence': round(seconds * 1e6 / size, 3)}
+
+        rng = random.Random(args.seed)
+        removed = rng.sample(sorted(texts), int(args.churn * args.docs))
+        start = time.perf_counter()
+        for doc_id in removed:
+            analyzer.remove_document(doc_id, notify=False)
+        churn_seconds = time.perf_counter() - start
+        for doc_id in removed[::2]:
+            analyzer.merge_analysis(doc_id, analyze_text(texts[doc_id], set()), notify=False)
+        gone = set(removed[1::2])
+
+        query_texts = queries(args.queries, args.seed)
+        expected = {ranker: [comparable(analyzer.get_relevant_responses(q, args.max_responses, ranker))
+                             for q in query_texts] for ranker in RANKERS}
+        expected_stats = analyzer.index_stats()
+        root = Path(scratch) / "index"
+        state = capture_snapshot(analyzer)
+        late = next(doc_id for doc_id in texts if doc_id in analyzer.documents)
+        analyzer.remove_document(late, notify=False)
+        write_snapshot(state, root)
+
+        index = SegmentIndex(root)
+        mismatches = {ranker: sum(comparable(index.get_relevant_responses(q, args.max_responses, ranker)) != want
+                                  for q, want in zip(query_texts, expected[ranker]))
+                      for ranker in RANKERS}
+        report = {
+            'index': expected_stats,
+            'removal': removal,
+            'churn': {
+                'removed': len(removed),
+                're_added': len(removed[::2]),
+                'ms_per_document': round(churn_seconds * 1000 / max(len(removed), 1), 3),
+                'dangling_sources': dangling_sources(analyzer),
+            },
+            'snapshot': {
+                'mismatches': mismatches,
+                'stats_match': index.index_stats() == expected_stats,
+                'removed_listed': len(gone & set(index.documents)),
+                'late_removal_kept': late in index.documents,
+            },
+        }
+        analyzer.ingest_pool.shutdown()
+
+    print(json.dumps({
+        'meta': {'docs': args.docs, 'sentences': args.sentences, 'shared': args.shared,
+                 'churn': args.churn, 'queries': args.queries, 'seed': args.seed},
+        **report,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
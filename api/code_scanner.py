@@ -0,0 +1,133 @@
+"""Single-pass scanner for C-family sources (JavaScript, TypeScript, Java, C++)"""
+from typing import List, Optional
+import re
+
+
+# Every alternative consumes its text in one forward pass and always matches once
+# started (unterminated comments and strings run to the end of the file or line),
+# so scanning is linear in the input with no backtracking between alternatives.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?|`(?:[^`\\]|\\.)*`?)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<op>=>|::|[^\s\w])
+""", re.VERBOSE | re.DOTALL)
+
+# Words that are followed by '(' without declaring anything, or that precede a call
+STATEMENT_KEYWORDS = frozenset({
+    'if', 'for', 'while', 'switch', 'catch', 'return', 'new', 'delete', 'throw',
+    'else', 'do', 'case', 'sizeof', 'typeof', 'await', 'yield', 'in', 'of',
+    'instanceof', 'synchronized', 'function', 'goto', 'alignof', 'decltype',
+})
+
+
+class ScanResult:
+    """Names and comments found by scan_source, in source order"""
+
+    def __init__(self):
+        self.comments: List[str] = []
+        self.classes: List[str] = []
+        self.interfaces: List[str] = []
+        self.types: List[str] = []
+        # `function name(` declarations and `const name = (...) =>` arrow functions
+        self.components: List[str] = []
+        # `name(` preceded by a type-like token, i.e. a Java/C++ method or function
+        self.declarations: List[str] = []
+
+
+class SourceScanner:
+    """Incremental scan_source: feed the source in chunks and collect items as they complete.
+
+    A token that touches the end of a chunk may continue in the next one, so it is
+    carried over, up to max_token characters (an unterminated comment is cut there).
+    Only the last three significant tokens are remembered, plus the paren depth
+    of a pending `const name = (` arrow function.
+    """
+
+    def __init__(self, max_token: int = 1 << 20):
+        self.max_token = max_token
+        self._carry = ''
+        self._prev = (None, None, None)
+        self._depth = 0
+        # (name, depth its parameter list opened at) of a possible arrow function
+        self._arrow: Optional[tuple] = None
+        self._arrow_closed: Optional[str] = None
+        self._pending_type: Optional[str] = None
+
+    def feed(self, text: str, final: bool = False) -> ScanResult:
+        """Scan the next chunk; returns the items completed in it"""
+        result = ScanResult()
+        buffer = self._carry + text if self._carry else text
+        self._carry = ''
+        end = len(buffer)
+        prev3, prev2, prev1 = self._prev
+        depth = self._depth
+        arrow = self._arrow
+        arrow_closed = self._arrow_closed
+        pending_type = self._pending_type
+
+        for match in TOKEN_PATTERN.finditer(buffer):
+            if not final and match.end() == end and end - match.start() <= self.max_token:
+                self._carry = buffer[match.start():]
+                break
+            kind = match.lastgroup
+            token = match.group()
+            if kind == 'comment':
+                result.comments.append(token)
+                continue
+            if kind == 'string':
+                token = '""'
+
+            if arrow_closed is not None:
+                if token == '=>':
+                    result.components.append(arrow_closed)
+                arrow_closed = None
+            if pending_type is not None:
+                if token in ('=', '<'):
+                    result.types.append(pending_type)
+                pending_type = None
+
+            if kind == 'name' and prev2 != '.':
+                if prev1 == 'class':
+                    result.classes.append(token)
+                elif prev1 == 'interface':
+                    result.interfaces.append(token)
+                elif prev1 == 'type':
+                    pending_type = token
+            elif token == '(':
+                if prev2 == 'function' and prev1 is not None and prev1 not in STATEMENT_KEYWORDS:
+                    result.components.append(prev1)
+                elif prev3 == 'const' and prev1 == '=' and prev2 is not None and arrow is None:
+                    arrow = (prev2, depth)
+                elif (prev1 is not None and prev1 not in STATEMENT_KEYWORDS and _is_name(prev1)
+                      and prev2 is not None and prev2 not in STATEMENT_KEYWORDS
+                      and (_is_name(prev2) or prev2 in ('>', ']', '*', '&'))):
+                    result.declarations.append(prev1)
+                depth += 1
+            elif token == ')':
+                depth = max(0, depth - 1)
+                if arrow is not None and depth == arrow[1]:
+                    arrow_closed = arrow[0]
+                    arrow = None
+
+            prev3, prev2, prev1 = prev2, prev1, token
+
+        self._prev = (prev3, prev2, prev1)
+        self._depth = depth
+        self._arrow = arrow
+        self._arrow_closed = arrow_closed
+        self._pending_type = pending_type
+        return result
+
+
+def scan_source(content: str) -> ScanResult:
+    """Extract comments, classes, interfaces, types and functions in one pass.
+
+    Comments and string literals are consumed whole, so nothing inside them is
+    mistaken for code.
+    """
+    return SourceScanner().feed(content, final=True)
+
+
+def _is_name(token: str) -> bool:
+    return token[0].isalpha() or token[0] in '_$'
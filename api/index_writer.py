@@ -0,0 +1,173 @@
+"""Single-writer coordination for running the API in several worker processes"""
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, IO, Optional
+import asyncio
+import functools
+import hashlib
+import os
+import sys
+import threading
+
+from snapshot import INDEX_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+WRITER_LOCK_FILE = "WRITER.lock"
+WRITER_KEY_FILE = "writer.key"
+WRITER_SOCKET = "writer.sock"
+
+
+class WriterUnavailable(Exception):
+    """The process that owns the index cannot be reached"""
+
+
+def acquire_writer_lock(root: Path = INDEX_DIR) -> Optional[IO]:
+    """Take the index's writer lock without blocking; it is held until the file is closed"""
+    root.mkdir(parents=True, exist_ok=True)
+    lock_file = open(root / WRITER_LOCK_FILE, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _pack_exception(e: Exception) -> tuple:
+    # Exceptions pickle as cls(*args), which loses keyword-only state such as
+    # HTTPException's status_code, so the attributes travel separately
+    return type(e), e.args, dict(vars(e))
+
+
+def _unpack_exception(cls, args: tuple, state: Dict) -> Exception:
+    e = cls.__new__(cls)
+    e.args = args
+    e.__dict__.update(state)
+    return e
+
+
+class WriterLink:
+    """Routes index mutations to the one process that owns the index.
+
+    The first process to acquire() the lock in the index directory is the writer. It
+    keeps the PolicyAnalyzer and runs the operations registered with op() for
+    the other processes, which send them over an authenticated local socket (a
+    named pipe on Windows). The key is regenerated by every writer and stored
+    next to the index, readable by the owner only. Operations run on the
+    writer's event loop, and their result, or the exception they raised, is
+    sent back. Arguments and results must be picklable.
+    """
+
+    def __init__(self, root: Path = INDEX_DIR):
+        self.root = root
+        self._lock_file: Optional[IO] = None
+        self.ops: Dict[str, Callable[..., Awaitable]] = {}
+        self._listener: Optional[Listener] = None
+
+    def acquire(self) -> bool:
+        """Become the writer if no other process is; returns is_writer.
+
+        Separate from __init__ so ops can be registered at import time in modules
+        that child processes re-import, without those children taking the lock.
+        """
+        if self._lock_file is None:
+            self._lock_file = acquire_writer_lock(self.root)
+        return self.is_writer
+
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_file is not None
+
+    @property
+    def address(self) -> str:
+        if sys.platform == 'win32':
+            digest = hashlib.sha1(str(self.root.resolve()).encode('utf-8')).hexdigest()[:16]
+            return rf'\\.\pipe\policy-analyzer-{digest}'
+        return str(self.root / WRITER_SOCKET)
+
+    def op(self, fn: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        """Decorator: run the coroutine function in the writer, wherever it is called"""
+        self.ops[fn.__name__] = fn
+
+        @functools.wraps(fn)
+        async def run(*args):
+            if self.is_writer:
+                return await fn(*args)
+            return await asyncio.to_thread(self._call, fn.__name__, args)
+        return run
+
+    def start(self):
+        """Accept operations from the other workers; must run on the event loop of the writer"""
+        if not self.is_writer or self._listener is not None:
+            return
+        authkey = os.urandom(32)
+        key_path = self.root / WRITER_KEY_FILE
+        tmp_path = key_path.with_name(f".{WRITER_KEY_FILE}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(authkey)
+        os.replace(tmp_path, key_path)
+        if sys.platform != 'win32':
+            # Left behind by a writer that died; the lock says nobody else is using it
+            Path(self.address).unlink(missing_ok=True)
+        self._listener = Listener(self.address, authkey=authkey)
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._serve, args=(self._listener, loop), daemon=True).start()
+
+    def stop(self):
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            try:
+                listener.close()
+            except OSError:
+                pass
+
+    def _serve(self, listener: Listener, loop: asyncio.AbstractEventLoop):
+        while self._listener is listener:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                if self._listener is listener:
+                    print(f"Error accepting index writer connection: {str(e)}")
+                continue
+            threading.Thread(target=self._handle, args=(conn, loop), daemon=True).start()
+
+    def _handle(self, conn, loop: asyncio.AbstractEventLoop):
+        with conn:
+            try:
+                name, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                outcome = (True, asyncio.run_coroutine_threadsafe(self.ops[name](*args), loop).result())
+            except Exception as e:
+                outcome = (False, _pack_exception(e))
+            try:
+                conn.send(outcome)
+            except (EOFError, OSError):
+                pass
+            except Exception as e:
+                # Unpicklable result or exception
+                conn.send((False, _pack_exception(RuntimeError(str(e)))))
+
+    def _call(self, name: str, args: tuple):
+        try:
+            authkey = (self.root / WRITER_KEY_FILE).read_bytes()
+            with Client(self.address, authkey=authkey) as conn:
+                conn.send((name, args))
+                ok, value = conn.recv()
+        except (OSError, EOFError) as e:
+            raise WriterUnavailable(f"Index writer unavailable: {e}") from e
+        if not ok:
+            raise _unpack_exception(*value)
+        return value
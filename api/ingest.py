@@ -0,0 +1,221 @@
+"""CPU-bound ingestion stages that run in worker processes, off the event loop"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import asyncio
+import multiprocessing
+import os
+import tarfile
+import time
+import zipfile
+
+from CodeFileParser import PARSE_STREAM_THRESHOLD, CodeFileParser
+from nlp_resources import get_sent_tokenize
+from normalize import get_normalizer
+from topics import TopicTagger
+
+
+# Worker processes for parsing and sentence analysis; 0 runs them in a thread instead
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Most characters of text analyzed per file; anything past it is dropped
+INGEST_MEMORY_LIMIT = int(os.environ.get("INGEST_MEMORY_LIMIT", str(64 << 20)))
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+RELEVANT_TERMS = {
+    'policy', 'strategy', 'initiative', 'regulation', 'law',
+    'governance', 'framework', 'approach', 'position', 'stance',
+    'development', 'implementation', 'ai', 'artificial intelligence',
+    'declare', 'announce', 'establish', 'create', 'propose'
+}
+
+
+def is_policy_relevant(text: str) -> bool:
+    return any(term in text.lower() for term in RELEVANT_TERMS)
+
+
+def analyze_text(text: str, all_topics: Set[str]) -> Dict:
+    """Segment a document and tag its policy-relevant sentences.
+
+    Returns {'sentences': [...], 'relevant': [(sentence index, topics, tokens), ...],
+    'truncated': bool}, which PolicyAnalyzer.merge_analysis folds into the shared index.
+    """
+    return analyze_sections([text], all_topics)
+
+
+def analyze_sections(sections: Iterable[str], all_topics: Set[str],
+                     max_chars: int = INGEST_MEMORY_LIMIT) -> Dict:
+    """analyze_text over several sections, segmented one at a time without joining them"""
+    analysis = SectionAnalyzer(max_chars)
+    for section in sections:
+        if not analysis.add(section):
+            break
+    return analysis.result(all_topics)
+
+
+class SectionAnalyzer:
+    """Segments text as it arrives, keeping at most max_chars of it.
+
+    Parsed items are fed one by one with add(); a `=== SECTION ===` marker is
+    inserted whenever the section changes, matching the layout of a parsed file.
+    Once the ceiling is reached further text is dropped and the result is marked
+    truncated. Tagging and normalization run once, in result(). The seconds spent
+    in each stage are returned with the result under 'timings'.
+    """
+
+    def __init__(self, max_chars: int = INGEST_MEMORY_LIMIT):
+        self.max_chars = max_chars
+        self.chars = 0
+        self.truncated = False
+        self.sentences: List[str] = []
+        self.positions: List[int] = []
+        self._section: Optional[str] = None
+        self._sent_tokenize = get_sent_tokenize()
+        self.timings = {'segment': 0.0, 'relevance': 0.0}
+
+    def add(self, text: str, section: Optional[str] = None) -> bool:
+        """Segment one more piece of text; returns False once the ceiling is reached"""
+        if section is not None and section != self._section:
+            self._section = section
+            if not self._add(f"=== {section.upper()} ==="):
+                return False
+        return self._add(text)
+
+    def _add(self, text: str) -> bool:
+        if self.truncated:
+            return False
+        if self.chars + len(text) > self.max_chars:
+            self.truncated = True
+            return False
+        self.chars += len(text)
+        start = time.perf_counter()
+        sentences = self._sent_tokenize(text)
+        segmented = time.perf_counter()
+        first = len(self.sentences)
+        self.positions.extend(first + i for i, sentence in enumerate(sentences) if is_policy_relevant(sentence))
+        self.sentences.extend(sentences)
+        self.timings['segment'] += segmented - start
+        self.timings['relevance'] += time.perf_counter() - segmented
+        return True
+
+    def result(self, all_topics: Set[str]) -> Dict:
+        sentences, positions = self.sentences, self.positions
+        start = time.perf_counter()
+        # All relevant sentences are tagged in one batch
+        tags = TopicTagger(all_topics).tag([sentences[i] for i in positions])
+        tagged = time.perf_counter()
+        # Normalized once here so queries never re-tokenize stored sentences
+        normalizer = get_normalizer()
+        tokens = [normalizer.tokens(sentences[i]) for i in positions]
+        timings = dict(self.timings, tag=tagged - start, normalize=time.perf_counter() - tagged)
+        relevant: List[Tuple[int, Set[str], List[str]]] = list(zip(positions, tags, tokens))
+        return {'sentences': sentences, 'relevant': relevant, 'truncated': self.truncated, 'timings': timings}
+
+
+def iter_parsed_sections(parsed_content: dict) -> Iterator[str]:
+    """Yield the analyzable sections of parsed content without copying them into one text"""
+    for key, value in parsed_content.items():
+        if isinstance(value, list):
+            yield f"=== {key.upper()} ==="
+            yield from value
+        elif isinstance(value, str):
+            yield f"=== {key.upper()} ==="
+            yield value
+
+
+def parse_and_analyze(file_path: Path, all_topics: Set[str], max_chars: int = INGEST_MEMORY_LIMIT,
+                      parsed_content: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[Dict], Dict[str, float]]:
+    """Parse a stored upload and analyze its text; returns (parsed_content, analysis, timings).
+
+    Files over PARSE_STREAM_THRESHOLD are never held whole: their items are
+    analyzed as the parser yields them, and parsed_content is None. A
+    parsed_content passed in (e.g. from the parse cache) skips parsing.
+    """
+    return asyncio.run(_parse_and_analyze(file_path, all_topics, max_chars, parsed_content))
+
+
+async def _parse_and_analyze(file_path: Path, all_topics: Set[str], max_chars: int,
+                             parsed_content: Optional[Dict]):
+    parser = CodeFileParser()
+    timings = {'parse': 0.0, 'analyze': 0.0}
+    start = time.perf_counter()
+    if parsed_content is None and file_path.stat().st_size > PARSE_STREAM_THRESHOLD:
+        items = parser.iter_file(file_path)
+    else:
+        if parsed_content is None:
+            parsed_content = await parser.parse_file(file_path)
+        if not parsed_content:
+            timings['parse'] = time.perf_counter() - start
+            return parsed_content, None, timings
+        items = _aiter((None, section) for section in iter_parsed_sections(parsed_content))
+    timings['parse'] += time.perf_counter() - start
+
+    analysis = SectionAnalyzer(max_chars)
+    while True:
+        start = time.perf_counter()
+        item = await anext(items, None)
+        timings['parse'] += time.perf_counter() - start
+        if item is None:
+            break
+        start = time.perf_counter()
+        accepted = analysis.add(item[1], item[0])
+        timings['analyze'] += time.perf_counter() - start
+        if not accepted:
+            await items.aclose()
+            break
+    if not analysis.sentences:
+        return parsed_content, None, timings
+    start = time.perf_counter()
+    result = analysis.result(all_topics)
+    timings['analyze'] += time.perf_counter() - start
+    return parsed_content, result, timings
+
+
+async def _aiter(items: Iterable):
+    for item in items:
+        yield item
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_archive(fileobj: IO[bytes], filename: str) -> Iterator[Tuple[str, IO[bytes]]]:
+    """Yield (member name, readable file) for every regular file in a zip or tar archive"""
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    else:
+        with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+            for info in archive:
+                if info.isfile():
+                    member = archive.extractfile(info)
+                    if member is not None:
+                        yield info.name, member
+
+
+class IngestPool:
+    """Runs ingestion stages in a lazily started ProcessPoolExecutor.
+
+    Workers are spawned rather than forked: the server loads NLP resources in a
+    background thread, and a fork taken mid-import inherits a held import lock.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def run(self, fn, *args):
+        if self.workers <= 0:
+            return await asyncio.to_thread(fn, *args)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,173 @@
+"""Posting-list index over integer sentence ids"""
+from array import array
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from ranking import query_matrix, split_rows
+
+
+def overlap_scores(token_hits: List[np.ndarray], topic_hits: List[np.ndarray], num_sentences: int,
+                   topic_weight: int = 2) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (candidate ids, scores) from the posting lists of the query tokens and topics.
+
+    Every hit is worth one point, topic_weight for topic hits; candidates are in id order.
+    """
+    total = sum(len(hits) for hits in token_hits) + sum(len(hits) for hits in topic_hits)
+    if not total:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if total * 8 < num_sentences:
+        # Few hits: aggregate over the candidates only instead of the whole corpus
+        all_ids = np.concatenate(token_hits + topic_hits)
+        weights = np.ones(total, dtype=np.int64)
+        weights[total - sum(len(hits) for hits in topic_hits):] = topic_weight
+        candidates, inverse = np.unique(all_ids, return_inverse=True)
+        return candidates, np.bincount(inverse, weights=weights).astype(np.int64)
+
+    dense = np.zeros(num_sentences, dtype=np.int64)
+    if token_hits:
+        dense += np.bincount(np.concatenate(token_hits), minlength=num_sentences)
+    if topic_hits:
+        dense += topic_weight * np.bincount(np.concatenate(topic_hits), minlength=num_sentences)
+    candidates = np.flatnonzero(dense)
+    return candidates, dense[candidates]
+
+
+def posting_matrix(postings: List[np.ndarray], num_sentences: int) -> sparse.csr_matrix:
+    """(lists x sentences) matrix that is 1 where a posting list holds a sentence id"""
+    indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(ids) for ids in postings])
+    indices = np.concatenate(postings) if postings else np.empty(0, dtype=np.int32)
+    return sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(postings), num_sentences))
+
+
+def overlap_scores_batch(query_tokens: List[Sequence[Hashable]], token_postings: Callable[[Hashable], np.ndarray],
+                         query_topics: List[Sequence[str]], topic_postings: Callable[[str], np.ndarray],
+                         num_sentences: int, topic_weight: int = 2) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """overlap_scores of several queries, given each query's distinct tokens and topics.
+
+    The posting lists of every token and topic in the batch are gathered once
+    into sparse matrices, and one product with the (queries x tokens) and
+    (queries x topics) matrices counts the hits of every query.
+    """
+    tokens, token_matrix = query_matrix(query_tokens)
+    product = token_matrix @ posting_matrix([token_postings(t) for t in tokens], num_sentences)
+    topics, topic_matrix = query_matrix(query_topics)
+    if topics:
+        product = product + topic_weight * (topic_matrix @ posting_matrix([topic_postings(t) for t in topics],
+                                                                          num_sentences))
+    return [(candidates, scores.astype(np.int64)) for candidates, scores in split_rows(product)]
+
+
+def top_overlap(candidates: np.ndarray, scores: np.ndarray, k: Optional[int]) -> List[Tuple[int, int]]:
+    """Return (sentence_id, score) for the k best id-ordered candidates, ties broken by id.
+    k=None returns every candidate."""
+    if (k is not None and k <= 0) or not len(candidates):
+        return []
+    if k is not None and len(candidates) > k:
+        # Candidates come in id order, so ties at the k-th score are resolved
+        # by taking the lowest ids without sorting them
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = scores > kth
+        tied = np.flatnonzero(scores == kth)[:k - int(above.sum())]
+        keep = np.concatenate([np.flatnonzero(above), tied])
+        candidates, scores = candidates[keep], scores[keep]
+    order = np.lexsort((candidates, -scores))[:k]
+    return [(int(candidates[i]), int(scores[i])) for i in order]
+
+
+class InvertedIndex:
+    """Token -> sentence id posting lists.
+
+    Postings are append-only because a sentence's text never changes once it has
+    an id. Removed ids are masked out at query time, and a token's postings are
+    compacted once half of them are removed. Topic membership lives in the
+    SentenceStore bitsets and is passed to score() as id arrays.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, array] = defaultdict(lambda: array('i'))
+        self.num_sentences = 0
+        self.removed = bytearray()
+        # Removed ids still present in each token's postings
+        self._stale: Dict[str, int] = defaultdict(int)
+
+    def add_tokens(self, sentence_id: int, tokens: Iterable[str]):
+        """Register the distinct tokens of a newly assigned sentence id"""
+        for token in set(tokens):
+            self.postings[token].append(sentence_id)
+        self.num_sentences = max(self.num_sentences, sentence_id + 1)
+        if len(self.removed) < self.num_sentences:
+            self.removed.extend(bytes(self.num_sentences - len(self.removed)))
+
+    def load_segments(self, token_names: List[str], indptr: np.ndarray, ids: np.ndarray, removed: np.ndarray):
+        """Restore the postings from the term-major arrays of snapshot.export_segments.
+
+        Row t of (indptr, ids) holds the live sentence ids of token_names[t];
+        removed flags every sentence id, live or not.
+        """
+        self.postings = defaultdict(lambda: array('i'))
+        for token in np.flatnonzero(np.diff(indptr)):
+            self.postings[token_names[token]] = array('i', ids[indptr[token]:indptr[token + 1]]
+                                                      .astype(np.int32).tobytes())
+        self.num_sentences = len(removed)
+        self.removed = bytearray(removed.astype(np.uint8).tobytes())
+        self._stale = defaultdict(int)
+
+    def remove_tokens(self, sentence_id: int, tokens: Iterable[str]):
+        """Retire a sentence id; costs its own tokens plus amortized compaction"""
+        if len(self.removed) <= sentence_id:
+            self.removed.extend(bytes(sentence_id + 1 - len(self.removed)))
+        self.removed[sentence_id] = 1
+        removed = np.frombuffer(self.removed, dtype=np.bool_)
+        for token in set(tokens):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            self._stale[token] += 1
+            if 2 * self._stale[token] >= len(postings):
+                ids = np.frombuffer(postings, dtype=np.int32)
+                kept = ids[~removed[ids]]
+                del self._stale[token]
+                if len(kept):
+                    self.postings[token] = array('i', kept.tobytes())
+                else:
+                    del self.postings[token]
+
+    def nbytes(self) -> int:
+        return sum(len(postings) * postings.itemsize for postings in self.postings.values()) + len(self.removed)
+
+    def score(self, tokens: Iterable[str], topic_members: Iterable[np.ndarray] = (),
+              topic_weight: int = 2) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (candidate ids, scores): one point per shared token, topic_weight per shared topic.
+
+        topic_members holds the sentence ids of each query topic.
+        """
+        token_hits = [np.frombuffer(self.postings[t], dtype=np.int32) for t in set(tokens) if self.postings.get(t)]
+        topic_hits = [members for members in topic_members if len(members)]
+        candidates, scores = overlap_scores(token_hits, topic_hits, self.num_sentences, topic_weight)
+        if self._stale and len(candidates):
+            live = ~np.frombuffer(self.removed, dtype=np.bool_)[candidates]
+            candidates, scores = candidates[live], scores[live]
+        return candidates, scores
+
+    def score_batch(self, queries: List[Iterable[str]], query_topics: List[Sequence[str]],
+                    topic_members: Callable[[str], np.ndarray],
+                    topic_weight: int = 2) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """score() of several queries; topic_members gives the sentence ids of a topic"""
+        results = overlap_scores_batch(
+            [[t for t in set(tokens) if self.postings.get(t)] for tokens in queries],
+            lambda token: np.frombuffer(self.postings[token], dtype=np.int32),
+            query_topics, topic_members, self.num_sentences, topic_weight)
+        if self._stale:
+            removed = np.frombuffer(self.removed, dtype=np.bool_)
+            results = [(candidates[~removed[candidates]], scores[~removed[candidates]])
+                       for candidates, scores in results]
+        return results
+
+    def top_k(self, tokens: Iterable[str], topic_members: Iterable[np.ndarray], k: Optional[int]) -> List[Tuple[int, int]]:
+        """Return (sentence_id, score) for the k best candidates, ties broken by id"""
+        return top_overlap(*self.score(tokens, topic_members), k)
@@ -1,14 +1,31 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File
+from fastapi import Query as QueryParam  # models.Query is the request body of /query/
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import aiofiles
+import asyncio
 from datetime import datetime
+import hashlib
 import os
+import tarfile
+import time
 import uvicorn
+import zipfile
 
-from models import Query, AnalysisResponse
+from models import Query, AnalysisResponse, BatchAnalysisResponse
 from analyzer import PolicyAnalyzer
 from fastapi.middleware.cors import CORSMiddleware
 from CodeFileParser import CodeFileParser
+from index_writer import WriterLink, WriterUnavailable
+from ingest import INGEST_MEMORY_LIMIT, is_archive, iter_archive, parse_and_analyze
+import metrics
+from metrics import CallbackMetric, PARSE_SECONDS, REQUEST_SECONDS, UPLOAD_BYTES
+from nlp_resources import warm_up
+from parse_cache import ParseCache
+from segments import SegmentIndex, segments_published
+from shards import INDEX_SHARDS, ShardPool
+from watcher import DirectoryWatcher, hash_file
 
 code_parser = CodeFileParser()
 
@@ -28,24 +45,227 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create upload directory if it doesn't exist
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route templates rather than raw paths, so doc ids do not become label values
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                            route.path if route is not None else "unmatched")
+    return response
+
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Uploads are streamed to disk in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Most queries one /query/batch/ request may carry
+MAX_BATCH_QUERIES = int(os.environ.get("MAX_BATCH_QUERIES", "1000"))
+
+# With uvicorn --workers N the first worker owns the index; the others serve queries
+# from its snapshots and hand every change to it (see index_writer.py and segments.py).
+# Ops are registered at import; the lock and the index itself are set up by open_index()
+writer = WriterLink()
+parse_cache: Optional[ParseCache] = None
+analyzer = searcher = None
+watcher: Optional[DirectoryWatcher] = None
+
+def open_index():
+    """Set up this worker's index, parse cache and directory watcher.
+
+    Called at startup rather than at import: the spawned ingest and shard
+    processes re-import this module (as __mp_main__ under python main.py),
+    and must not each load the index or compete for the writer lock.
+    """
+    global parse_cache, analyzer, searcher, watcher
+    if analyzer is not None:
+        return
+    # Create upload directory if it doesn't exist
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    parse_cache = ParseCache()
+    if writer.acquire():
+        analyzer = PolicyAnalyzer()
+        # Each topic refresh asks for a snapshot; they are written at most once per SNAPSHOT_INTERVAL
+        analyzer.topic_job.on_refresh = analyzer.snapshot_job.request
+        # Sharded queries are scored over the published generations, not the live index
+        searcher = SegmentIndex(shards=ShardPool(INDEX_SHARDS)) if INDEX_SHARDS else analyzer
+    else:
+        analyzer = searcher = SegmentIndex(shards=ShardPool(INDEX_SHARDS) if INDEX_SHARDS else None)
+    # Indexes the directories the tray app watches, as the files change
+    watcher = DirectoryWatcher(analyzer, ingest_upload, code_parser.is_supported_file)
 
-# Global analyzer instance
-analyzer = PolicyAnalyzer()
+@app.exception_handler(WriterUnavailable)
+async def writer_unavailable(request: Request, exc: WriterUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 async def process_document(file_path: Path, doc_id: str):
     """Process a document asynchronously"""
+    content = await code_parser.read_text(file_path)
+    await analyzer.analyze_document(content, doc_id)
+
+async def save_upload(upload: UploadFile, file_path: Path) -> Tuple[int, str]:
+    """Stream an upload to disk in fixed-size chunks; returns (bytes written, sha256)"""
+    size = 0
+    digest = hashlib.sha256()
+    async with aiofiles.open(file_path, 'wb') as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            await f.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+def new_doc_path(filename: str) -> Tuple[str, Path]:
+    """Allocate a doc_id and reserve its upload path so concurrent uploads never collide.
+    Touches the file system, so async handlers call it in a worker thread."""
+    name = Path(filename).name
+    stem, suffix = os.path.splitext(name)[0], Path(name).suffix
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    doc_id = f"{stem}_{timestamp}"
+    attempt = 1
+    while True:
+        file_path = UPLOAD_DIR / f"{doc_id}{suffix}"
+        try:
+            file_path.touch(exist_ok=False)
+            return doc_id, file_path
+        except FileExistsError:
+            doc_id = f"{stem}_{timestamp}_{attempt}"
+            attempt += 1
+
+def extract_archive(fileobj, archive_name: str) -> List[Tuple[Dict, Optional[Path]]]:
+    """Store the supported members of an archive as uploads (runs in a thread).
+    If the archive turns out to be unreadable partway, the members stored so far are deleted."""
+    stored = []
+    written: List[Path] = []
     try:
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            content = await f.read()
-        await analyzer.analyze_document(content, doc_id)
-    except UnicodeDecodeError:
-        # Fallback to latin-1 encoding if UTF-8 fails
-        async with aiofiles.open(file_path, 'r', encoding='latin-1') as f:
-            content = await f.read()
-        await analyzer.analyze_document(content, doc_id)
+        for name, member in iter_archive(fileobj, archive_name):
+            result = {"filename": f"{archive_name}/{name}"}
+            if not code_parser.is_supported_file(Path(name)):
+                result["status"] = "unsupported"
+                stored.append((result, None))
+                continue
+            start = time.perf_counter()
+            doc_id, file_path = new_doc_path(name)
+            written.append(file_path)
+            size = 0
+            digest = hashlib.sha256()
+            with open(file_path, 'wb') as f:
+                while chunk := member.read(UPLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            result.update(doc_id=doc_id, bytes=size, hash=digest.hexdigest(),
+                          timings={"save": time.perf_counter() - start})
+            stored.append((result, file_path))
+    except Exception:
+        for file_path in written:
+            file_path.unlink(missing_ok=True)
+        raise
+    return stored
+
+async def ingest_upload(file_path: Path, content_hash: str
+                        ) -> Tuple[Optional[Dict], Optional[Dict], Dict[str, float], bool]:
+    """parse_and_analyze in the ingest pool, reusing the cached parse of identical content.
+    The last item is whether the parse came from the cache."""
+    suffix = file_path.suffix
+    cached = await asyncio.to_thread(parse_cache.get, content_hash, suffix)
+    generation = analyzer.topic_generation
+    parsed_content, analysis, timings = await analyzer.ingest_pool.run(
+        parse_and_analyze, file_path, analyzer.all_topics, INGEST_MEMORY_LIMIT, cached
+    )
+    if analysis is not None:
+        # merge_analysis re-tags if other topics are published before it runs
+        analysis['topic_generation'] = generation
+    UPLOAD_BYTES.observe((await asyncio.to_thread(file_path.stat)).st_size)
+    if cached is None:
+        parser = code_parser.supported_extensions[suffix.lower()].__name__.replace("parse_", "")
+        PARSE_SECONDS.observe(timings["parse"], parser)
+    if cached is None and parsed_content:
+        await asyncio.to_thread(parse_cache.put, content_hash, suffix, parsed_content)
+    return parsed_content, analysis, timings, cached is not None
+
+CallbackMetric('policy_documents', 'Indexed documents', lambda: analyzer.index_stats()['documents'])
+CallbackMetric('policy_sentences', 'Sentences stored, relevant or not', lambda: analyzer.index_stats()['sentences'])
+CallbackMetric('policy_statements', 'Distinct policy statements in the index',
+               lambda: analyzer.index_stats()['statements'])
+CallbackMetric('policy_vocabulary_size', 'Distinct normalized tokens', lambda: analyzer.index_stats()['vocabulary'])
+CallbackMetric('policy_index_memory_bytes', 'Approximate memory held by the index, by component',
+               lambda: analyzer.index_memory(), label='component')
+CallbackMetric('policy_parse_cache_events_total', 'Parse cache lookups and evictions',
+               lambda: {event: parse_cache.stats()[event] for event in ('hits', 'misses', 'evictions')},
+               label='event', kind='counter')
+
+async def index_stored_uploads() -> int:
+    """Index the files in UPLOAD_DIR that the catalog does not list, e.g. after a start
+    without a usable snapshot. Uploads are stored as {doc_id}{suffix}, so each keeps
+    its doc_id. Files are left in place whatever the outcome. Returns how many were indexed."""
+    known = {meta.get('filename') for meta in analyzer.documents.values()}
+    files = [file_path for file_path in sorted(UPLOAD_DIR.iterdir())
+             if file_path.is_file() and file_path.name not in known
+             and file_path.stem not in analyzer.documents and code_parser.is_supported_file(file_path)]
+    # Parsing is bounded by the ingest pool; this bounds the files read at once
+    limit = asyncio.Semaphore(os.cpu_count() or 1)
+    
+    async def index(file_path: Path) -> bool:
+        async with limit:
+            content_hash = await asyncio.to_thread(hash_file, str(file_path))
+            if analyzer.find_document(content_hash) is not None:
+                return False
+            _, analysis, _, _ = await ingest_upload(file_path, content_hash)
+            if analysis is None:
+                return False
+            indexed_as = analyzer.merge_analysis(file_path.stem, analysis, notify=False, content_hash=content_hash,
+                                                 size=file_path.stat().st_size, filename=file_path.name)
+            return indexed_as == file_path.stem
+    
+    indexed = 0
+    outcomes = await asyncio.gather(*(index(file_path) for file_path in files), return_exceptions=True)
+    for file_path, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error indexing stored upload {file_path.name}: {str(outcome)}")
+        else:
+            indexed += outcome
+    if indexed:
+        print(f"Indexed {indexed} stored uploads missing from the snapshot")
+        analyzer.topic_job.notify()
+    return indexed
+
+@app.on_event("startup")
+async def warm_up_resources():
+    open_index()
+    # NLTK data and scikit-learn load lazily; pull them in without delaying startup
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+    if searcher is not analyzer or not writer.is_writer:
+        searcher.start()
+    if not writer.is_writer:
+        return
+    if not segments_published():
+        # Readers need a snapshot with segments before the first upload arrives
+        await analyzer.write_snapshot()
+    writer.start()
+    watcher.start()
+    # Uploads the loaded snapshot does not cover are indexed in the background
+    app.state.index_stored_uploads = asyncio.get_running_loop().create_task(index_stored_uploads())
+
+@app.on_event("shutdown")
+async def shutdown_ingest_pool():
+    if searcher is not analyzer or not writer.is_writer:
+        searcher.stop()
+    if not writer.is_writer:
+        return
+    watcher.stop()
+    writer.stop()
+    # Uploads and deletes still waiting on the debounce timers are only in memory:
+    # fit them now and snapshot the catalog, or they are lost on restart
+    await analyzer.topic_job.stop()
+    await analyzer.snapshot_job.stop()
+    analyzer.ingest_pool.shutdown()
+
+def duplicate_response(doc_id: str) -> Dict:
+    return {
+        "message": "Document already indexed",
+        "doc_id": doc_id,
+        "duplicate": True,
+        "parsed_content": None
+    }
 
 @app.post("/upload/", summary="Upload a document or code file")
 async def upload_document(file: UploadFile = File(...)):
@@ -57,65 +277,358 @@ async def upload_document(file: UploadFile = File(...)):
             detail=f"Unsupported file type. Supported types: {supported_extensions}"
         )
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    doc_id = f"{os.path.splitext(file.filename)[0]}_{timestamp}"
-    file_path = UPLOAD_DIR / f"{doc_id}{Path(file.filename).suffix}"
+    doc_id, file_path = await asyncio.to_thread(new_doc_path, file.filename)
     
     try:
-        # Save uploaded file
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        # Stream the upload to disk; the worker reads and decodes it once
+        size, content_hash = await save_upload(file, file_path)
+    except Exception as e:
+        await asyncio.to_thread(file_path.unlink, missing_ok=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return await index_upload(doc_id, file_path, size, content_hash)
+
+@writer.op
+async def index_upload(doc_id: str, file_path: Path, size: int, content_hash: str) -> Dict:
+    """Index a saved upload under doc_id. Like index_batch, it keeps the file only
+    if it is indexed, so index_stored_uploads does not retry it on every start."""
+    try:
+        # Identical content is already indexed: drop the copy and point at the original
+        existing = analyzer.find_document(content_hash)
+        if existing is not None:
+            await asyncio.to_thread(file_path.unlink)
+            return duplicate_response(existing)
         
-        # Parse the file
-        parsed_content = await code_parser.parse_file(file_path)
-        if parsed_content:
-            # Convert parsed content to analyzable text
-            analysis_text = await convert_parsed_content_to_text(parsed_content)
-            # Process the document using existing analyzer
-            await analyzer.analyze_document(analysis_text, doc_id)
+        # Parse and analyze in the ingest pool, then merge into the shared index
+        parsed_content, analysis, _, _ = await ingest_upload(file_path, content_hash)
+        if analysis is None:
+            await asyncio.to_thread(file_path.unlink)
+            return {
+                "message": "No analyzable content; the document was not indexed",
+                "doc_id": doc_id,
+                "parsed_content": parsed_content,
+                "truncated": False
+            }
+        indexed_as = analyzer.merge_analysis(doc_id, analysis, content_hash=content_hash, size=size,
+                                             filename=file_path.name)
+        if indexed_as != doc_id:
+            await asyncio.to_thread(file_path.unlink)
+            return duplicate_response(indexed_as)
         
         return {
             "message": "Document processed successfully",
             "doc_id": doc_id,
-            "parsed_content": parsed_content
+            # None for files too large to return, which are parsed as a stream
+            "parsed_content": parsed_content,
+            "truncated": analysis["truncated"]
         }
     except Exception as e:
+        await asyncio.to_thread(file_path.unlink, missing_ok=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/upload/batch/", summary="Upload many documents, code files or tar/zip archives")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """Upload many files at once. Parsing fans out over the ingest pool, all results are
+    merged into the index in one step and topics are refreshed once at the end."""
+    started = time.perf_counter()
+    stored: List[Tuple[Dict, Optional[Path]]] = []
+    
+    try:
+        for upload in files:
+            if is_archive(upload.filename):
+                try:
+                    stored.extend(await asyncio.to_thread(extract_archive, upload.file, upload.filename))
+                except (zipfile.BadZipFile, tarfile.TarError) as e:
+                    stored.append(({"filename": upload.filename, "status": "error",
+                                    "detail": f"Invalid archive: {e}"}, None))
+                continue
+            if not code_parser.is_supported_file(Path(upload.filename)):
+                stored.append(({"filename": upload.filename, "status": "unsupported"}, None))
+                continue
+            start = time.perf_counter()
+            doc_id, file_path = await asyncio.to_thread(new_doc_path, upload.filename)
+            try:
+                size, content_hash = await save_upload(upload, file_path)
+            except Exception:
+                file_path.unlink(missing_ok=True)
+                raise
+            stored.append(({"filename": upload.filename, "doc_id": doc_id, "bytes": size,
+                            "hash": content_hash, "timings": {"save": time.perf_counter() - start}}, file_path))
+    except Exception as e:
+        # Nothing has been indexed yet, so none of the files saved so far is kept
+        for _, file_path in stored:
+            if file_path is not None:
+                file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=str(e))
+    return await index_batch(stored, started)
 
-async def convert_parsed_content_to_text(parsed_content: dict) -> str:
-    """Convert parsed content to analyzable text format"""
-    sections = []
+@writer.op
+async def index_batch(stored: List[Tuple[Dict, Optional[Path]]], started: float) -> Dict:
+    """Index the files saved by upload_batch and refresh topics once"""
+    # Short-circuit content that is already indexed or appears earlier in this batch,
+    # so each distinct file is parsed once
+    pending = []
+    first_copies: Dict[str, Dict] = {}
+    copies: List[Tuple[Dict, Dict]] = []
+    for result, file_path in stored:
+        if file_path is None:
+            continue
+        existing = analyzer.find_document(result["hash"])
+        if existing is not None:
+            file_path.unlink()
+            result.update(status="duplicate", doc_id=existing)
+        elif result["hash"] in first_copies:
+            file_path.unlink()
+            copies.append((result, first_copies[result["hash"]]))
+        else:
+            first_copies[result["hash"]] = result
+            pending.append((result, file_path))
+    
+    # Parse and analyze every remaining file in parallel
+    outcomes = await asyncio.gather(
+        *(ingest_upload(file_path, result["hash"]) for result, file_path in pending),
+        return_exceptions=True
+    )
+    
+    # Merge everything without yielding to the event loop, so queries see all or nothing
+    indexed = 0
+    for (result, file_path), outcome in zip(pending, outcomes):
+        if isinstance(outcome, Exception):
+            file_path.unlink(missing_ok=True)
+            result.update(status="error", detail=str(outcome))
+            continue
+        parsed_content, analysis, timings, cache_hit = outcome
+        result["timings"].update(timings)
+        result["parse_cache_hit"] = cache_hit
+        if analysis is None:
+            file_path.unlink()
+            result["status"] = "empty"
+            continue
+        start = time.perf_counter()
+        indexed_as = analyzer.merge_analysis(result["doc_id"], analysis, notify=False,
+                                             content_hash=result["hash"], size=result["bytes"],
+                                             filename=file_path.name)
+        result["timings"]["merge"] = time.perf_counter() - start
+        if indexed_as != result["doc_id"]:
+            # Same content appeared earlier in this batch
+            file_path.unlink()
+            result.update(status="duplicate", doc_id=indexed_as)
+            continue
+        result.update(status="ok", truncated=analysis["truncated"])
+        indexed += 1
+    for result, first in copies:
+        if first["status"] in ("ok", "duplicate"):
+            result.update(status="duplicate", doc_id=first["doc_id"])
+        else:
+            # The copy would have failed the same way
+            result.update({key: first[key] for key in ("status", "detail") if key in first}, doc_id=None)
     
-    for key, value in parsed_content.items():
-        if isinstance(value, list):
-            sections.append(f"=== {key.upper()} ===")
-            sections.extend(value)
-        elif isinstance(value, str):
-            sections.append(f"=== {key.upper()} ===")
-            sections.append(value)
+    start = time.perf_counter()
+    if indexed:
+        await analyzer.refresh_topics()
+    topic_seconds = time.perf_counter() - start
+    
+    return {
+        "message": f"Indexed {indexed} of {len(stored)} files",
+        "files": [result for result, _ in stored],
+        "topic_refresh_seconds": topic_seconds,
+        "total_seconds": time.perf_counter() - started
+    }
+
+def remove_upload(meta: Dict):
+    """Delete the stored upload behind a catalog entry; watched files are left alone"""
+    if meta.get("filename"):
+        (UPLOAD_DIR / meta["filename"]).unlink(missing_ok=True)
+
+@app.delete("/documents/{doc_id:path}", summary="Remove a document from the index")
+async def delete_document(doc_id: str):
+    """Remove a document's sentences and postings; topics are refreshed lazily"""
+    return await delete_indexed(doc_id)
+
+@writer.op
+async def delete_indexed(doc_id: str) -> Dict:
+    meta = analyzer.remove_document(doc_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    await asyncio.to_thread(remove_upload, meta)
+    return {"message": "Document removed", "doc_id": doc_id}
+
+@app.put("/documents/{doc_id:path}", summary="Replace the content of a document")
+async def replace_document(doc_id: str, file: UploadFile = File(...)):
+    """Re-index a document from a new upload under the same doc_id.
+
+    The new file is parsed before the old content is removed, and the swap happens
+    in one step, so queries see either version but never neither.
+    """
+    # Readers only see the last snapshot, so there the writer decides after the upload
+    if writer.is_writer and doc_id not in analyzer.documents:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    if not code_parser.is_supported_file(Path(file.filename)):
+        supported_extensions = ', '.join(code_parser.supported_extensions.keys())
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type. Supported types: {supported_extensions}"
+        )
     
-    return "\n\n".join(sections)
+    # Staged under a fresh name until the swap; it takes over doc_id afterwards
+    _, staged_path = await asyncio.to_thread(new_doc_path, file.filename)
+    try:
+        size, content_hash = await save_upload(file, staged_path)
+    except Exception as e:
+        await asyncio.to_thread(staged_path.unlink, missing_ok=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    return await replace_indexed(doc_id, staged_path, size, content_hash)
+
+@writer.op
+async def replace_indexed(doc_id: str, staged_path: Path, size: int, content_hash: str) -> Dict:
+    """Swap a saved upload in as the new content of doc_id"""
+    try:
+        old = analyzer.documents.get(doc_id)
+        if old is None:
+            staged_path.unlink()
+            raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+        existing = analyzer.find_document(content_hash)
+        if existing == doc_id:
+            staged_path.unlink()
+            return {"message": "Document unchanged", "doc_id": doc_id, "parsed_content": None}
+        if existing is not None:
+            staged_path.unlink()
+            raise HTTPException(status_code=409, detail=f"Content already indexed as {existing}")
+        
+        parsed_content, analysis, _, _ = await ingest_upload(staged_path, content_hash)
+        if analysis is None:
+            staged_path.unlink()
+            raise HTTPException(status_code=422, detail="No analyzable content in the new file")
+        # Checked again: other requests may have changed the index while this one parsed
+        if doc_id not in analyzer.documents:
+            staged_path.unlink()
+            raise HTTPException(status_code=404, detail=f"Document {doc_id} was removed meanwhile")
+        existing = analyzer.find_document(content_hash)
+        if existing is not None:
+            staged_path.unlink()
+            raise HTTPException(status_code=409, detail=f"Content already indexed as {existing}")
+        
+        file_path = UPLOAD_DIR / f"{doc_id}{staged_path.suffix}"
+        old = analyzer.replace_document(doc_id, analysis, content_hash=content_hash, size=size,
+                                        filename=file_path.name if old.get("filename") else None)
+        if old.get("filename"):
+            await asyncio.to_thread(remove_upload, old)
+            staged_path.replace(file_path)
+        else:
+            # Not an upload (e.g. a watched file), so there is no stored copy to keep
+            staged_path.unlink()
+        return {
+            "message": "Document replaced",
+            "doc_id": doc_id,
+            "parsed_content": parsed_content,
+            "truncated": analysis["truncated"]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        staged_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def search(method, *args):
+    """Call a searcher method. A ShardPool blocks until every shard has answered, so
+    sharded searches run in a worker thread and the event loop keeps serving."""
+    if isinstance(searcher, SegmentIndex) and searcher.shards is not None:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
 
 @app.post("/query/", response_model=AnalysisResponse, summary="Query policy documents")
 async def query_documents(query: Query):
     """Query processed policy documents"""
     try:
-        responses = analyzer.get_relevant_responses(query.text, query.max_responses)
+        responses = await search(searcher.get_relevant_responses, query.text, query.max_responses, query.ranker)
         return {"responses": responses}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/batch/", response_model=BatchAnalysisResponse, summary="Query policy documents in a batch")
+async def query_documents_batch(queries: List[Query]):
+    """Run a list of queries in one request, scoring the queries of each ranker together.
+
+    Results come back in the order of the queries, each as /query/ would return it.
+    """
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    try:
+        results = await search(searcher.get_relevant_responses_batch,
+                               [(query.text, query.max_responses, query.ranker) for query in queries])
+        return {"results": [{"responses": responses} for responses in results]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/topics/", summary="Get available topics")
 async def get_topics():
-    """Get list of available topics"""
-    return {"topics": list(analyzer.all_topics)}
-
-@app.get("/get_existing_documents/", summary="Get existing documents")
-async def get_existing_documents():
-    """Get list of existing documents, without including .git .DS_Store etc."""
-    return {"files": [f.name for f in UPLOAD_DIR.iterdir() if f.is_file() and not f.name.startswith(".")], 
-            "file_contents": [f.read_text() for f in UPLOAD_DIR.iterdir() if f.is_file() and not f.name.startswith(".")]}
+    """Get list of available topics with the generation and age of the topic model"""
+    return {"topics": list(analyzer.all_topics), **analyzer.get_topic_status()}
+
+@app.get("/parse_cache/", summary="Get parse cache statistics")
+async def get_parse_cache_stats():
+    """Hit/miss/eviction counters and size of the persistent parse cache"""
+    return parse_cache.stats()
+
+@app.get("/metrics", summary="Prometheus metrics")
+async def get_metrics():
+    """Latency histograms and index gauges in the Prometheus text format"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/get_existing_documents/", summary="List indexed documents")
+async def get_existing_documents(offset: int = QueryParam(0, ge=0), limit: int = QueryParam(100, ge=1, le=1000)):
+    """One page of the document catalog: doc_id, file name, size, hash, sentence count and
+    ingest time. Contents are served one document at a time by /documents/{doc_id}/content."""
+    documents = analyzer.list_documents(offset, limit)
+    return {
+        "total": len(analyzer.documents),
+        "offset": offset,
+        "limit": limit,
+        "files": [document.get("filename") or document["doc_id"] for document in documents],
+        "documents": documents
+    }
+
+def document_path(meta: Dict) -> Optional[Path]:
+    """File behind a catalog entry: the stored upload, or the watched file itself.
+    Only the catalog is consulted, so readers resolve it as the writer does."""
+    if meta.get("filename"):
+        return UPLOAD_DIR / meta["filename"]
+    if meta.get("path"):
+        return Path(meta["path"])
+    return None
+
+async def iter_file_range(file_path: Path, start: int, end: int):
+    async with aiofiles.open(file_path, 'rb') as f:
+        await f.seek(start)
+        remaining = end - start
+        while remaining > 0 and (chunk := await f.read(min(UPLOAD_CHUNK_SIZE, remaining))):
+            remaining -= len(chunk)
+            yield chunk
+
+@app.get("/documents/{doc_id:path}/content", summary="Get the content of a document")
+async def get_document_content(doc_id: str, offset: int = QueryParam(0, ge=0),
+                               length: Optional[int] = QueryParam(None, ge=0)):
+    """Stream a byte range of one document, [offset, offset + length), or all of it.
+
+    The stored file is served as uploaded; if it is gone, the segmented text kept in
+    the index is served instead. X-Document-Size carries the full size in bytes.
+    """
+    meta = analyzer.documents.get(doc_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    file_path = document_path(meta)
+    if file_path is not None and file_path.is_file():
+        size = file_path.stat().st_size
+        end = size if length is None else min(size, offset + length)
+        body = iter_file_range(file_path, offset, end)
+    else:
+        data = analyzer.document_text(doc_id).encode('utf-8')
+        size = len(data)
+        end = size if length is None else min(size, offset + length)
+        body = iter([data[offset:end]])
+    return StreamingResponse(body, media_type="text/plain; charset=utf-8", headers={
+        "Content-Length": str(max(0, end - offset)),
+        "X-Document-Size": str(size)
+    })
     
     
 
@@ -0,0 +1,128 @@
+"""Process-wide latency histograms and gauges, rendered in the Prometheus text format"""
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+import math
+import threading
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from 50 microseconds (one query) to two minutes (a large topic refit)
+TIME_BUCKETS = (5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05,
+                0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Bytes, 1 KB to 1 GB in powers of four
+BYTE_BUCKETS = tuple(float(1 << n) for n in range(10, 31, 2))
+
+REGISTRY: List = []
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels; safe to observe from threads"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Label values -> per-bucket counts (last one is +Inf), then sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((values, (list(counts), total[0])) for values, (counts, total) in self._series.items())
+        for values, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter read from live state at scrape time.
+
+    fn returns a number, or a dict of label value -> number for a single label.
+    """
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], Union[float, Dict[str, float]]],
+                 label: str = '', kind: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.label = label
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        value = self.fn()
+        if isinstance(value, dict):
+            for label_value, number in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.label,), (label_value,))} {_number(number)}")
+        else:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric, in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            print(f"Error rendering metric {metric.name}: {str(e)}")
+    return '\n'.join(lines) + '\n'
+
+
+UPLOAD_BYTES = Histogram(
+    'policy_upload_bytes', 'Size of each uploaded or watched file', buckets=BYTE_BUCKETS)
+PARSE_SECONDS = Histogram(
+    'policy_parse_seconds', 'CodeFileParser time per file, by parser', labels=('parser',))
+INGEST_STAGE_SECONDS = Histogram(
+    'policy_ingest_stage_seconds',
+    'Time per file in each analysis stage: segment, relevance, tag, normalize, merge',
+    labels=('stage',))
+TOPIC_SECONDS = Histogram(
+    'policy_topic_refresh_seconds',
+    'Topic refresh time: fit (model update or refit), tag (re-tagging) and embed (LSA fit)',
+    labels=('stage',))
+QUERY_SECONDS = Histogram(
+    'policy_query_seconds',
+    'Query time: score (ranking), batch (ranking the queries of a batch with one ranker) and serialize',
+    labels=('ranker', 'stage'))
+REQUEST_SECONDS = Histogram(
+    'policy_http_request_seconds', 'End-to-end HTTP request time', labels=('method', 'route'))
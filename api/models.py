@@ -1,16 +1,21 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class Query(BaseModel):
     text: str
-    max_responses: Optional[int] = 3
+    max_responses: Optional[int] = 3  # None returns every match
+    ranker: Literal["legacy", "bm25", "dense", "hybrid"] = "legacy"
 
 class PolicyResponse(BaseModel):
     statement: str
     score: float
     source: str
+    sources: List[str] = []
     context: List[str]
     topics: List[str]
 
 class AnalysisResponse(BaseModel):
-    responses: List[PolicyResponse]
\ No newline at end of file
+    responses: List[PolicyResponse]
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[AnalysisResponse]
@@ -0,0 +1,98 @@
+"""Offline, lazily loaded NLP resources.
+
+Nothing here touches the network. NLTK data is looked up in NLTK_DATA_DIR
+(default api/nltk_data) ahead of NLTK's usual search path; provision it on a
+connected machine with
+
+    python -m nltk.downloader -d api/nltk_data punkt stopwords wordnet
+
+The pinned nltk 3.8.1 splits sentences with the pickled `punkt` model; nltk
+3.8.2 and later only load `punkt_tab`, so download that one instead with them.
+
+When a resource is missing, a built-in fallback is used instead: untrained Punkt
+for sentences, scikit-learn's English stopword list, and no lemmatization.
+nltk itself (which imports scipy.stats) and scikit-learn are only imported on
+first use, so importing the API stays cheap.
+"""
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, FrozenSet, List, Optional
+import os
+
+
+NLTK_DATA_DIR = Path(os.environ.get("NLTK_DATA_DIR", Path(__file__).parent / "nltk_data"))
+
+PUNKT_PICKLE = 'tokenizers/punkt/english.pickle'
+PUNKT_TAB = 'tokenizers/punkt_tab/english/'
+STOPWORDS_RESOURCES = ('corpora/stopwords', 'corpora/stopwords.zip')
+WORDNET_RESOURCES = ('corpora/wordnet', 'corpora/wordnet.zip')
+
+
+@lru_cache(maxsize=None)
+def load_nltk():
+    """Import nltk with NLTK_DATA_DIR first on its data path"""
+    import nltk
+    if str(NLTK_DATA_DIR) not in nltk.data.path:
+        nltk.data.path.insert(0, str(NLTK_DATA_DIR))
+    return nltk
+
+
+def find_resource(names) -> Optional[str]:
+    """First of the given NLTK resource names that is available locally"""
+    nltk = load_nltk()
+    for name in names:
+        try:
+            nltk.data.find(name)
+            return name
+        except LookupError:
+            continue
+    return None
+
+
+def punkt_resource() -> str:
+    """The Punkt model nltk.sent_tokenize loads in the installed nltk"""
+    from nltk.tokenize import punkt
+    # PunktTokenizer, which reads punkt_tab, replaced the pickle in nltk 3.8.2
+    return PUNKT_TAB if hasattr(punkt, 'PunktTokenizer') else PUNKT_PICKLE
+
+
+@lru_cache(maxsize=None)
+def get_sent_tokenize() -> Callable[[str], List[str]]:
+    """nltk's English sentence splitter, or untrained Punkt without the model"""
+    nltk = load_nltk()
+    if find_resource((punkt_resource(),)) is not None:
+        return nltk.tokenize.sent_tokenize
+    print(f"Punkt model not found in {NLTK_DATA_DIR}, using untrained sentence splitting")
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+    return PunktSentenceTokenizer().tokenize
+
+
+@lru_cache(maxsize=None)
+def get_stop_words() -> FrozenSet[str]:
+    """NLTK English stopwords, or scikit-learn's list without the corpus"""
+    if find_resource(STOPWORDS_RESOURCES) is not None:
+        from nltk.corpus import stopwords
+        return frozenset(stopwords.words('english'))
+    print(f"NLTK stopwords not found in {NLTK_DATA_DIR}, using scikit-learn's list")
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return frozenset(ENGLISH_STOP_WORDS)
+
+
+@lru_cache(maxsize=None)
+def get_lemmatize() -> Callable[[str], str]:
+    """WordNet lemmatizer, or the identity without the WordNet corpus"""
+    if find_resource(WORDNET_RESOURCES) is not None:
+        from nltk.stem import WordNetLemmatizer
+        lemmatize = WordNetLemmatizer().lemmatize
+        lemmatize('warmup')  # WordNet itself is loaded on the first call
+        return lemmatize
+    print(f"WordNet not found in {NLTK_DATA_DIR}, tokens will not be lemmatized")
+    return lambda word: word
+
+
+def warm_up():
+    """Load every resource now, e.g. in a background thread once the server is up"""
+    get_sent_tokenize()
+    get_stop_words()
+    get_lemmatize()
+    import sklearn.feature_extraction.text  # noqa: F401  used by the topic model
@@ -0,0 +1,42 @@
+"""Token pipeline shared by ingestion and queries"""
+from functools import lru_cache
+from typing import List, Optional
+import os
+import re
+
+from nlp_resources import get_lemmatize, get_stop_words
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Distinct words whose lemma is memoized per process
+LEMMA_CACHE_SIZE = int(os.environ.get("LEMMA_CACHE_SIZE", "100000"))
+
+
+class TextNormalizer:
+    """Tokenize, lowercase, strip punctuation, drop stopwords and lemmatize.
+
+    Lemmas go through a bounded LRU cache, since the same few thousand words
+    make up nearly every sentence. Stopwords and the lemmatizer come from
+    nlp_resources, with offline fallbacks.
+    """
+
+    def __init__(self, cache_size: int = LEMMA_CACHE_SIZE):
+        self.stop_words = get_stop_words()
+        self.lemmatize = lru_cache(maxsize=cache_size)(get_lemmatize())
+
+    def tokens(self, text: str) -> List[str]:
+        """Normalized tokens of a text, in order and with repeats"""
+        stop_words = self.stop_words
+        lemmatize = self.lemmatize
+        return [lemmatize(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in stop_words]
+
+
+_normalizer: Optional[TextNormalizer] = None
+
+
+def get_normalizer() -> TextNormalizer:
+    """The process-wide normalizer, so each ingest worker builds it and its cache once"""
+    global _normalizer
+    if _normalizer is None:
+        _normalizer = TextNormalizer()
+    return _normalizer
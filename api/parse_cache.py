@@ -0,0 +1,105 @@
+"""Persistent cache of CodeFileParser results, so unchanged files are never parsed twice"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+import json
+import os
+import tempfile
+import threading
+import zlib
+
+from CodeFileParser import PARSER_VERSION
+
+
+PARSE_CACHE_DIR = Path(os.environ.get("PARSE_CACHE_DIR", "parse_cache"))
+# Total size of the cache files; least recently used entries are evicted past it
+PARSE_CACHE_SIZE = int(os.environ.get("PARSE_CACHE_SIZE", str(256 << 20)))
+
+
+class ParseCache:
+    """Parse results stored as zlib-compressed JSON, one file per entry.
+
+    Entries are keyed by the sha256 of the file content, PARSER_VERSION and the
+    file extension, so a parser change or a rename to another language never
+    serves a stale result. Recency is kept in memory and mirrored in file
+    mtimes, which restores the LRU order on restart.
+    """
+
+    def __init__(self, directory: Path = PARSE_CACHE_DIR, max_bytes: int = PARSE_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        # Entry file name -> size, least recently used first
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+        files = sorted((f.stat().st_mtime, f.name, f.stat().st_size)
+                       for f in directory.glob(f"*.v{PARSER_VERSION}.*.json.z"))
+        for _, name, size in files:
+            self.entries[name] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def entry_name(content_hash: str, suffix: str) -> str:
+        return f"{content_hash}.v{PARSER_VERSION}.{suffix.lower().lstrip('.')}.json.z"
+
+    def get(self, content_hash: str, suffix: str) -> Optional[Dict]:
+        """Cached parse result for the content, or None"""
+        name = self.entry_name(content_hash, suffix)
+        path = self.directory / name
+        with self._lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+        try:
+            parsed = json.loads(zlib.decompress(path.read_bytes()))
+            os.utime(path)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Dropping unreadable parse cache entry {name}: {e}")
+            with self._lock:
+                self.misses += 1
+                self.total_bytes -= self.entries.pop(name, 0)
+            path.unlink(missing_ok=True)
+            return None
+        with self._lock:
+            self.hits += 1
+        return parsed
+
+    def put(self, content_hash: str, suffix: str, parsed: Dict):
+        """Store a parse result, evicting least recently used entries past max_bytes"""
+        name = self.entry_name(content_hash, suffix)
+        data = zlib.compress(json.dumps(parsed, separators=(',', ':')).encode('utf-8'))
+        if len(data) > self.max_bytes:
+            return
+        # A private temporary per writer: two uploads of the same content may be stored at once
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.directory / name)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            self.total_bytes += len(data) - self.entries.pop(name, 0)
+            self.entries[name] = len(data)
+            while self.total_bytes > self.max_bytes:
+                evicted, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+                (self.directory / evicted).unlink(missing_ok=True)
+
+    def stats(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "parser_version": PARSER_VERSION,
+        }
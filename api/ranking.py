@@ -0,0 +1,290 @@
+"""BM25 ranking over an incrementally maintained sparse term-document matrix"""
+from array import array
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+
+def top_k_scores(candidates: np.ndarray, scores: np.ndarray, k: Optional[int]) -> List[Tuple[int, float]]:
+    """Pick the k highest scores with a partition, ordered by score then id; k=None keeps all"""
+    if (k is not None and k <= 0) or not len(candidates):
+        return []
+    if k is not None and len(candidates) > k:
+        # Ties at the k-th score go to the lowest ids, so the selection is the
+        # same however the candidates are split up, e.g. across index shards
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)
+        tied = tied[np.argsort(candidates[tied], kind='stable')[:k - len(above)]]
+        best = np.concatenate([above, tied])
+        candidates, scores = candidates[best], scores[best]
+    order = np.lexsort((candidates, -scores))
+    return [(int(candidates[i]), float(scores[i])) for i in order]
+
+
+def query_matrix(query_keys: List[Sequence[Hashable]]) -> Tuple[list, sparse.csr_matrix]:
+    """The sorted distinct keys (terms, topics) of several queries, and a (queries x keys)
+    matrix that is 1 where a query has a key. Keys must be distinct within a query."""
+    keys = sorted(set().union(*query_keys)) if query_keys else []
+    column = {key: i for i, key in enumerate(keys)}
+    indptr = np.zeros(len(query_keys) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(query) for query in query_keys])
+    indices = np.array([column[key] for query in query_keys for key in query], dtype=np.int64)
+    matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(query_keys), len(keys)))
+    # Sorted columns make each row sum its terms in the same order as the single-query scorers
+    matrix.sort_indices()
+    return keys, matrix
+
+
+def split_rows(product: sparse.csr_matrix) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """(candidate ids in id order, scores) of every row of a (queries x sentences) product"""
+    product = product.tocsr()
+    product.sort_indices()
+    return [(product.indices[start:end].astype(np.int64), product.data[start:end])
+            for start, end in zip(product.indptr[:-1], product.indptr[1:])]
+
+
+def bm25_idf(doc_freqs: np.ndarray, num_docs: int) -> np.ndarray:
+    df = doc_freqs.astype(np.float64)
+    return np.log1p((num_docs - df + 0.5) / (df + 0.5))
+
+
+def bm25_bound(term_idf: np.ndarray, k1: float) -> float:
+    """Upper bound of the BM25 score over these terms, approached as term frequencies grow"""
+    return float(term_idf.sum() * (k1 + 1))
+
+
+def bm25_weights(term_idf: np.ndarray, tf: np.ndarray, doc_lengths: np.ndarray, avg_length: float,
+                 k1: float, b: float) -> np.ndarray:
+    """BM25 contribution of each (term, sentence) posting"""
+    norm = k1 * (1 - b + b * doc_lengths / avg_length)
+    return term_idf * tf * (k1 + 1) / (tf + norm)
+
+
+class BM25Index:
+    """Okapi BM25 over a term-major (terms x sentences) CSR matrix of term frequencies.
+
+    New sentences are appended to a small delta matrix; the delta is folded into
+    the base matrix once it grows past merge_ratio of the base, so ingestion cost
+    stays proportional to the new sentences. BM25 weights are computed at query
+    time for the touched entries only, so idf and average length are always current.
+    Removed sentences leave the statistics at once and their matrix entries are
+    dropped at the next merge; until then they are masked out of the scores.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, merge_ratio: float = 0.1):
+        self.k1 = k1
+        self.b = b
+        self.merge_ratio = merge_ratio
+        self.vocabulary: Dict[str, int] = {}
+        self.doc_freqs = array('i')
+        self.doc_lengths = array('i')
+        self.total_length = 0
+        self.removed = bytearray()
+        self.num_removed = 0
+        self._base: Optional[sparse.csr_matrix] = None
+        self._base_docs = 0
+        self._pending_terms = array('i')
+        self._pending_docs = array('i')
+        self._pending_tfs = array('f')
+        self._delta: Optional[sparse.csr_matrix] = None
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def num_live(self) -> int:
+        return self.num_docs - self.num_removed
+
+    def add(self, doc_id: int, tokens: Iterable[str]):
+        """Append a sentence; ids must be assigned consecutively from 0"""
+        if doc_id != self.num_docs:
+            raise ValueError(f"Expected sentence id {self.num_docs}, got {doc_id}")
+        counts = Counter(tokens)
+        for token, tf in counts.items():
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                term_id = len(self.vocabulary)
+                self.vocabulary[token] = term_id
+                self.doc_freqs.append(0)
+            self.doc_freqs[term_id] += 1
+            self._pending_terms.append(term_id)
+            self._pending_docs.append(doc_id)
+            self._pending_tfs.append(tf)
+        length = sum(counts.values())
+        self.doc_lengths.append(length)
+        self.removed.append(0)
+        self.total_length += length
+        self._delta = None
+
+    def load_segments(self, token_names: List[str], indptr: np.ndarray, ids: np.ndarray, tfs: np.ndarray,
+                      lengths: np.ndarray, removed: np.ndarray):
+        """Restore the index from the term-major arrays of snapshot.export_segments.
+
+        They hold the term frequencies of the live sentences only, which is what
+        the base matrix holds after a merge, so they become the base as they are.
+        """
+        self.vocabulary = {token: i for i, token in enumerate(token_names)}
+        self.doc_freqs = array('i', np.diff(indptr).astype(np.int32).tobytes())
+        self.doc_lengths = array('i', lengths.astype(np.int32).tobytes())
+        self.total_length = int(lengths.sum())
+        self.removed = bytearray(removed.astype(np.uint8).tobytes())
+        self.num_removed = int(removed.sum())
+        self._base = sparse.csr_matrix((tfs.astype(np.float32), ids.astype(np.int32), indptr),
+                                       shape=(len(token_names), len(lengths)))
+        self._base_docs = len(lengths)
+        self._pending_terms = array('i')
+        self._pending_docs = array('i')
+        self._pending_tfs = array('f')
+        self._delta = None
+
+    def remove(self, doc_id: int, tokens: Iterable[str]):
+        """Take a sentence out of the statistics; tokens must be those it was added with"""
+        if self.removed[doc_id]:
+            return
+        for token in set(tokens):
+            self.doc_freqs[self.vocabulary[token]] -= 1
+        self.total_length -= self.doc_lengths[doc_id]
+        self.doc_lengths[doc_id] = 0
+        self.removed[doc_id] = 1
+        self.num_removed += 1
+
+    def _segments(self) -> List[Tuple[sparse.csr_matrix, int]]:
+        """Return the (matrix, first sentence id) pairs that make up the index"""
+        pending = len(self._pending_tfs)
+        base_nnz = self._base.nnz if self._base is not None else 0
+        if pending and pending >= self.merge_ratio * base_nnz:
+            self._merge()
+        segments = []
+        if self._base is not None:
+            segments.append((self._base, 0))
+        if len(self._pending_tfs):
+            if self._delta is None:
+                self._delta = sparse.csr_matrix(
+                    (
+                        np.frombuffer(self._pending_tfs, dtype=np.float32),
+                        (
+                            np.frombuffer(self._pending_terms, dtype=np.int32),
+                            np.frombuffer(self._pending_docs, dtype=np.int32) - self._base_docs,
+                        ),
+                    ),
+                    shape=(len(self.vocabulary), self.num_docs - self._base_docs),
+                )
+            segments.append((self._delta, self._base_docs))
+        return segments
+
+    def _merge(self):
+        """Fold pending entries into the base matrix"""
+        terms = np.frombuffer(self._pending_terms, dtype=np.int32)
+        docs = np.frombuffer(self._pending_docs, dtype=np.int32)
+        tfs = np.frombuffer(self._pending_tfs, dtype=np.float32)
+        if self._base is not None:
+            base = self._base.tocoo()
+            terms = np.concatenate([base.row, terms])
+            docs = np.concatenate([base.col, docs])
+            tfs = np.concatenate([base.data, tfs])
+        if self.num_removed:
+            live = ~np.frombuffer(self.removed, dtype=np.bool_)[docs]
+            terms, docs, tfs = terms[live], docs[live], tfs[live]
+        self._base = sparse.csr_matrix(
+            (tfs, (terms, docs)), shape=(len(self.vocabulary), self.num_docs)
+        )
+        self._base_docs = self.num_docs
+        self._pending_terms = array('i')
+        self._pending_docs = array('i')
+        self._pending_tfs = array('f')
+        self._delta = None
+
+    def nbytes(self) -> int:
+        total = sum(len(column) * column.itemsize for column in (
+            self.doc_freqs, self.doc_lengths, self._pending_terms, self._pending_docs, self._pending_tfs))
+        for matrix in (self._base, self._delta):
+            if matrix is not None:
+                total += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        return total + len(self.removed)
+
+    def idf(self, term_ids: np.ndarray) -> np.ndarray:
+        return bm25_idf(np.frombuffer(self.doc_freqs, dtype=np.int32)[term_ids], self.num_live)
+
+    def _term_ids(self, tokens: Iterable[str]) -> np.ndarray:
+        return np.array(sorted({self.vocabulary[t] for t in tokens if t in self.vocabulary}), dtype=np.int64)
+
+    def max_score(self, tokens: Iterable[str]) -> float:
+        """Score no sentence can reach for these tokens, to put scores on a 0-1 scale"""
+        return bm25_bound(self.idf(self._term_ids(tokens)), self.k1)
+
+    def score(self, tokens: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (candidate sentence ids, BM25 scores) for a tokenized query"""
+        term_ids = self._term_ids(tokens)
+        if not len(term_ids) or not self.num_live:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        idf = self.idf(term_ids)
+        avg_length = self.total_length / self.num_live or 1.0
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+        ids, weights = [], []
+        for matrix, offset in self._segments():
+            rows = term_ids < matrix.shape[0]
+            if not rows.any():
+                continue
+            # One sparse row slice pulls the postings of every query term at once
+            postings = matrix[term_ids[rows]]
+            docs = postings.indices.astype(np.int64) + offset
+            tf = postings.data.astype(np.float64)
+            term_idf = np.repeat(idf[rows], np.diff(postings.indptr))
+            ids.append(docs)
+            weights.append(bm25_weights(term_idf, tf, doc_lengths[docs], avg_length, self.k1, self.b))
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        candidates, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        if self.num_removed:
+            live = ~np.frombuffer(self.removed, dtype=np.bool_)[candidates]
+            candidates, scores = candidates[live], scores[live]
+        return candidates, scores
+
+    def score_batch(self, queries: List[Iterable[str]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """score() of several tokenized queries, with one sparse product per index segment.
+
+        Each posting's weight depends on its term and sentence only, so the
+        weights of every term in the batch are computed once, and a product
+        with the (queries x terms) matrix sums them per query.
+        """
+        terms, matrix = query_matrix([self._term_ids(tokens).tolist() for tokens in queries])
+        if not terms or not self.num_live:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))] * len(queries)
+
+        terms = np.array(terms, dtype=np.int64)
+        idf = self.idf(terms)
+        avg_length = self.total_length / self.num_live or 1.0
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+        parts = []
+        for segment, offset in self._segments():
+            rows = terms < segment.shape[0]
+            if not rows.any():
+                continue
+            postings = segment[terms[rows]]
+            docs = postings.indices.astype(np.int64) + offset
+            weights = bm25_weights(np.repeat(idf[rows], np.diff(postings.indptr)), postings.data.astype(np.float64),
+                                   doc_lengths[docs], avg_length, self.k1, self.b)
+            postings = sparse.csr_matrix((weights, postings.indices, postings.indptr), shape=postings.shape)
+            parts.append((split_rows(matrix[:, np.flatnonzero(rows)] @ postings), offset))
+
+        results = []
+        for i in range(len(queries)):
+            # Segments hold disjoint, increasing ranges of sentence ids
+            candidates = np.concatenate([rows[i][0] + offset for rows, offset in parts] or [np.empty(0, np.int64)])
+            scores = np.concatenate([rows[i][1] for rows, _ in parts] or [np.empty(0)])
+            if self.num_removed and len(candidates):
+                live = ~np.frombuffer(self.removed, dtype=np.bool_)[candidates]
+                candidates, scores = candidates[live], scores[live]
+            results.append((candidates, scores))
+        return results
+
+    def top_k(self, tokens: Iterable[str], k: Optional[int]) -> List[Tuple[int, float]]:
+        candidates, scores = self.score(tokens)
+        return top_k_scores(candidates, scores, k)
@@ -0,0 +1,447 @@
+"""Query-only view of the index, memory-mapped from the current snapshot.
+
+With several uvicorn workers only one of them owns the PolicyAnalyzer (see
+index_writer.py). The others serve queries from the arrays each snapshot
+exports (snapshot.export_segments), mapped read-only, so the page cache holds
+one copy of the index however many workers map it. Snapshot directories are
+numbered by generation and CURRENT names the latest one; readers poll it and
+swap in a new generation with a single reference assignment, so a query runs
+against one generation from start to end.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+
+from inverted_index import overlap_scores, overlap_scores_batch, top_overlap
+from metrics import QUERY_SECONDS
+from normalize import get_normalizer
+from ranking import bm25_bound, bm25_idf, bm25_weights, query_matrix, split_rows, top_k_scores
+from semantic import query_vector, semantic_top_k, semantic_top_k_batch
+from sentence_store import removed_positions
+from snapshot import CURRENT_FILE, INDEX_DIR, read_strings
+from topics import TopicTagger
+
+
+# Seconds between checks of CURRENT for a newer generation
+SEGMENT_POLL_INTERVAL = float(os.environ.get("SEGMENT_POLL_INTERVAL", "1"))
+
+
+def segments_published(root: Path = INDEX_DIR) -> bool:
+    """Whether CURRENT names a snapshot that readers can open"""
+    try:
+        name = (root / CURRENT_FILE).read_text().strip()
+    except OSError:
+        return False
+    return (root / name / 'segment_ids.npy').exists()
+
+
+class SegmentScorer:
+    """The rankers over term-major postings, as exported by snapshot.export_segments.
+
+    Subclasses provide postings_indptr/ids/tfs, term_indptr (postings of the
+    whole generation, for document frequencies), lengths, num_live, avg_length,
+    k1, b, num_statements, topic_members(), and the rows of the LSA embeddings
+    they score with embedding_ids (None: row i is statement i). Scores equal those of
+    InvertedIndex and BM25Index on the snapshotted index, for any subset of the
+    postings, since the corpus statistics always come from the whole generation.
+    """
+
+    def legacy_scores(self, term_ids: np.ndarray, topics: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """One point per shared token, two per shared topic"""
+        starts, ends = self.postings_indptr[term_ids], self.postings_indptr[term_ids + 1]
+        token_hits = [self.postings_ids[s:e] for s, e in zip(starts, ends) if e > s]
+        topic_hits = [hits for hits in (self.topic_members(t) for t in topics) if len(hits)]
+        return overlap_scores(token_hits, topic_hits, self.num_statements)
+
+    def bm25_scores(self, term_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        starts, ends = self.postings_indptr[term_ids], self.postings_indptr[term_ids + 1]
+        if not (ends - starts).any() or not self.num_live:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        docs = np.concatenate([self.postings_ids[s:e] for s, e in zip(starts, ends)]).astype(np.int64)
+        tf = np.concatenate([self.postings_tfs[s:e] for s, e in zip(starts, ends)]).astype(np.float64)
+        doc_freqs = self.term_indptr[term_ids + 1] - self.term_indptr[term_ids]
+        term_idf = np.repeat(bm25_idf(doc_freqs, self.num_live), ends - starts)
+        weights = bm25_weights(term_idf, tf, self.lengths[docs], self.avg_length, self.k1, self.b)
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        return candidates, np.bincount(inverse, weights=weights)
+
+    def legacy_scores_batch(self, term_ids: List[np.ndarray],
+                            topics: List[List[str]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return overlap_scores_batch(
+            [ids.tolist() for ids in term_ids],
+            lambda term: self.postings_ids[self.postings_indptr[term]:self.postings_indptr[term + 1]],
+            topics, self.topic_members, self.num_statements)
+
+    def bm25_scores_batch(self, term_ids: List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """bm25_scores of several queries, from one sparse product as in BM25Index.score_batch"""
+        terms, matrix = query_matrix([ids.tolist() for ids in term_ids])
+        terms = np.array(terms, dtype=np.int64)
+        starts, ends = self.postings_indptr[terms], self.postings_indptr[terms + 1]
+        if not (ends - starts).any() or not self.num_live:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))] * len(term_ids)
+        docs = np.concatenate([self.postings_ids[s:e] for s, e in zip(starts, ends)]).astype(np.int64)
+        tf = np.concatenate([self.postings_tfs[s:e] for s, e in zip(starts, ends)]).astype(np.float64)
+        doc_freqs = self.term_indptr[terms + 1] - self.term_indptr[terms]
+        term_idf = np.repeat(bm25_idf(doc_freqs, self.num_live), ends - starts)
+        weights = bm25_weights(term_idf, tf, self.lengths[docs], self.avg_length, self.k1, self.b)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=indptr[1:])
+        postings = sparse.csr_matrix((weights, docs, indptr), shape=(len(terms), self.num_statements))
+        return split_rows(matrix @ postings)
+
+    def bm25_bound(self, term_ids: np.ndarray) -> float:
+        doc_freqs = self.term_indptr[term_ids + 1] - self.term_indptr[term_ids]
+        return bm25_bound(bm25_idf(doc_freqs, self.num_live), self.k1)
+
+    def top_k(self, ranker: str, term_ids: np.ndarray, topics: List[str], k: int,
+              query: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """(statement id, score) of the k best statements, by score then id.
+
+        query is the LSA embedding of the query, for the dense and hybrid rankers.
+        """
+        if ranker == "bm25":
+            return top_k_scores(*self.bm25_scores(term_ids), k)
+        if ranker in ("dense", "hybrid"):
+            lexical = None
+            if ranker == "hybrid":
+                candidates, scores = self.bm25_scores(term_ids)
+                if len(candidates):
+                    scores = scores / self.bm25_bound(term_ids)
+                lexical = candidates, scores
+            return semantic_top_k(self.embeddings, self.embedding_ids, query, k, lexical)
+        return top_overlap(*self.legacy_scores(term_ids, topics), k)
+
+    def top_k_batch(self, ranker: str, term_ids: List[np.ndarray], topics: List[List[str]], ks: List[int],
+                    queries: List[Optional[np.ndarray]]) -> List[List[Tuple[int, float]]]:
+        """top_k of several queries with the same ranker, scored together"""
+        if ranker == "bm25":
+            return [top_k_scores(*scores, k) for scores, k in zip(self.bm25_scores_batch(term_ids), ks)]
+        if ranker == "legacy":
+            return [top_overlap(*scores, k) for scores, k in zip(self.legacy_scores_batch(term_ids, topics), ks)]
+        lexical = None
+        if ranker == "hybrid":
+            lexical = []
+            for ids, (candidates, scores) in zip(term_ids, self.bm25_scores_batch(term_ids)):
+                if len(candidates):
+                    scores = scores / self.bm25_bound(ids)
+                lexical.append((candidates, scores))
+        return semantic_top_k_batch(self.embeddings, self.embedding_ids, queries, ks, lexical)
+
+
+class Segment(SegmentScorer):
+    """One snapshot generation, mapped read-only. Never changes once opened."""
+
+    def __init__(self, directory: Path):
+        with open(directory / 'manifest.json', 'r') as f:
+            manifest = json.load(f)
+        if 'segments' not in manifest:
+            raise ValueError(f"{directory.name} was written without query segments")
+        self.name = directory.name
+        self.generation = manifest['generation']
+        self.documents: Dict[str, Dict] = manifest['documents']
+        self.doc_hashes = {meta['hash']: doc_id for doc_id, meta in self.documents.items() if meta['hash']}
+        self.all_topics = set(manifest['all_topics'])
+        self.topic_generation = manifest['topic_generation']
+        self.topics_updated_at = manifest['topics_updated_at']
+        stats = manifest['segments']
+        self.num_live = stats['num_live']
+        self.avg_length = stats['total_length'] / self.num_live if self.num_live else 1.0
+        self.k1, self.b = stats['k1'], stats['b']
+
+        def load(name: str) -> np.ndarray:
+            return np.load(directory / f'{name}.npy', mmap_mode='r')
+
+        self.doc_first = load('doc_first')
+        self.doc_removed = load('doc_removed')
+        self.statement_pos = load('statement_pos')
+        self.topic_bits = load('topic_bits')
+        self.sentence_bytes = load('sentence_bytes')
+        # Positions of removed documents stay in place; only live ones are counted
+        self.num_sentences = len(self.sentence_bytes) - 1 - removed_positions(self.doc_first, self.doc_removed)
+        self.postings_indptr = load('segment_indptr')
+        self.postings_ids = load('segment_ids')
+        self.postings_tfs = load('segment_tfs')
+        self.lengths = load('segment_lengths')
+        self.term_indptr = self.postings_indptr
+        self.num_statements = len(self.statement_pos)
+        self.extra_keys = load('extra_source_keys')
+        self.extra_indptr = load('extra_sources_indptr')
+        self.extra_ids = load('extra_sources_ids')
+        if (directory / 'embeddings.npy').exists():
+            self.embeddings = load('embeddings')
+            self.lsa_components = load('lsa_components')
+            self.lsa_idf = load('lsa_idf')
+        else:
+            # Written before the first LSA fit
+            self.embeddings = self.lsa_components = self.lsa_idf = None
+        self.embedding_ids = None
+        text_path = directory / 'doc_text.bin'
+        # An empty file cannot be mapped
+        self.text = np.memmap(text_path, dtype=np.uint8, mode='r') if text_path.stat().st_size else b''
+        # Lookup tables are per process; they are a small fraction of the arrays above
+        self.doc_ids = read_strings(directory, 'doc_ids')
+        # Removed documents keep their slot but cannot be looked up, as in SentenceStore.load
+        self.doc_index = {doc_id: i for i, doc_id in enumerate(self.doc_ids) if not self.doc_removed[i]}
+        self.token_ids = {token: i for i, token in enumerate(read_strings(directory, 'token_names'))}
+        self.topic_names = read_strings(directory, 'topic_names')
+        self.tagger = TopicTagger(self.topic_names)
+        self._topic_members: Dict[str, np.ndarray] = {}
+
+    def nbytes(self) -> int:
+        """Bytes mapped from the snapshot files"""
+        arrays = (self.doc_first, self.doc_removed, self.statement_pos, self.topic_bits, self.sentence_bytes,
+                  self.postings_indptr, self.postings_ids, self.postings_tfs, self.lengths,
+                  self.extra_keys, self.extra_indptr, self.extra_ids,
+                  self.embeddings, self.lsa_components, self.lsa_idf)
+        return sum(a.nbytes for a in arrays if a is not None) + len(self.text)
+
+    def document_of(self, position: int) -> int:
+        return int(np.searchsorted(self.doc_first, position, side='right')) - 1
+
+    def sentence(self, position: int) -> str:
+        return bytes(self.text[self.sentence_bytes[position]:self.sentence_bytes[position + 1]]).decode('utf-8')
+
+    def document_text(self, doc_id: str) -> str:
+        doc = self.doc_index[doc_id]
+        return bytes(self.text[self.sentence_bytes[self.doc_first[doc]]:
+                               self.sentence_bytes[self.doc_first[doc + 1]]]).decode('utf-8')
+
+    def statement(self, statement_id: int) -> str:
+        return self.sentence(int(self.statement_pos[statement_id]))
+
+    def context(self, statement_id: int, window: int = 2) -> List[str]:
+        position = int(self.statement_pos[statement_id])
+        doc = self.document_of(position)
+        start = max(int(self.doc_first[doc]), position - window)
+        end = min(int(self.doc_first[doc + 1]), position + window + 1)
+        return [self.sentence(p) for p in range(start, end)]
+
+    def sources(self, statement_id: int) -> List[str]:
+        positions = [int(self.statement_pos[statement_id])]
+        i = int(np.searchsorted(self.extra_keys, statement_id))
+        if i < len(self.extra_keys) and self.extra_keys[i] == statement_id:
+            positions.extend(self.extra_ids[self.extra_indptr[i]:self.extra_indptr[i + 1]].tolist())
+        return [self.doc_ids[self.document_of(p)] for p in positions]
+
+    def topics(self, statement_id: int) -> Set[str]:
+        bits = int(self.topic_bits[statement_id])
+        return {name for i, name in enumerate(self.topic_names) if bits >> i & 1}
+
+    def topic_members(self, topic: str) -> np.ndarray:
+        members = self._topic_members.get(topic)
+        if members is None:
+            if topic in self.topic_names:
+                bit = np.uint64(1 << self.topic_names.index(topic))
+                members = np.flatnonzero(self.topic_bits & bit).astype(np.int32)
+            else:
+                members = np.empty(0, dtype=np.int32)
+            self._topic_members[topic] = members
+        return members
+
+    def term_ids(self, tokens: List[str]) -> np.ndarray:
+        """Sorted ids of the query tokens found in the vocabulary"""
+        return np.array(sorted({self.token_ids[t] for t in tokens if t in self.token_ids}), dtype=np.int64)
+
+    def query_vector(self, term_ids: np.ndarray) -> Optional[np.ndarray]:
+        if self.lsa_components is None:
+            return None
+        return query_vector(self.lsa_components, self.lsa_idf, term_ids)
+
+    def query_topics(self, query: str) -> List[str]:
+        """Topics sharing a word with the query, as PolicyAnalyzer.extract_topics_from_text"""
+        return sorted(self.tagger.tag([query])[0])
+
+
+class SegmentIndex:
+    """Read-only stand-in for PolicyAnalyzer in workers that do not own the index.
+
+    Serves queries, the catalog and document text from the latest generation.
+    Documents indexed by the writer appear once it writes its next snapshot,
+    after the debounced topic refresh and at most SNAPSHOT_INTERVAL later. With a shards.ShardPool, scoring is
+    scattered over its processes and only the responses are built here; the
+    first generation is then opened by start(), never at import.
+    """
+
+    def __init__(self, root: Path = INDEX_DIR, interval: float = SEGMENT_POLL_INTERVAL, shards=None):
+        self.root = root
+        self.interval = interval
+        self.shards = shards
+        self.segment: Optional[Segment] = None
+        self._current: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        if shards is None:
+            self.refresh()
+
+    def refresh(self) -> bool:
+        """Open the generation CURRENT points at, if it is new. Returns True on a swap."""
+        try:
+            name = (self.root / CURRENT_FILE).read_text().strip()
+        except OSError:
+            return False
+        if name == self._current:
+            return False
+        try:
+            segment = Segment(self.root / name)
+            if self.shards is not None:
+                self.shards.open(self.root / name)
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            # Usually superseded and deleted while being opened; the next poll catches up
+            print(f"Error opening index segment {name}: {e}")
+            return False
+        previous, self.segment, self._current = self._current, segment, name
+        if self.shards is not None:
+            # Queries that picked up the previous generation may still be in flight
+            self.shards.retain([name] + ([previous] if previous else []))
+        return True
+
+    def start(self):
+        """Start polling for new generations; must run on the event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.shards is not None:
+            self.shards.shutdown()
+
+    async def _run(self):
+        while True:
+            # Opening decodes the lookup tables, so keep it off the event loop
+            await asyncio.to_thread(self.refresh)
+            await asyncio.sleep(self.interval)
+
+    @property
+    def generation(self) -> int:
+        return self.segment.generation if self.segment is not None else 0
+
+    @property
+    def documents(self) -> Dict[str, Dict]:
+        return self.segment.documents if self.segment is not None else {}
+
+    @property
+    def all_topics(self) -> Set[str]:
+        return self.segment.all_topics if self.segment is not None else set()
+
+    def list_documents(self, offset: int = 0, limit: int = 100) -> List[Dict]:
+        documents = list(self.documents.items())[offset:offset + limit]
+        return [{'doc_id': doc_id, **meta} for doc_id, meta in documents]
+
+    def find_document(self, content_hash: str) -> Optional[str]:
+        return self.segment.doc_hashes.get(content_hash) if self.segment is not None else None
+
+    def document_text(self, doc_id: str) -> str:
+        return self.segment.document_text(doc_id)
+
+    def get_topic_status(self) -> Dict:
+        segment = self.segment
+        if segment is None or segment.topics_updated_at is None:
+            age = None
+        else:
+            age = time.time() - segment.topics_updated_at
+        return {
+            'generation': segment.topic_generation if segment is not None else 0,
+            'age_seconds': age,
+            # Only the writer knows what is waiting for the next refresh; the
+            # client types this as a number, so readers report none
+            'pending_documents': 0
+        }
+
+    def index_stats(self) -> Dict[str, int]:
+        segment = self.segment
+        if segment is None:
+            return {'documents': 0, 'sentences': 0, 'statements': 0, 'vocabulary': 0}
+        return {
+            'documents': len(segment.documents),
+            'sentences': segment.num_sentences,
+            'statements': segment.num_live,
+            'vocabulary': len(segment.token_ids),
+        }
+
+    def index_memory(self) -> Dict[str, int]:
+        return {'segments': self.segment.nbytes() if self.segment is not None else 0}
+
+    def rank(self, query: str, max_responses: int = 3,
+             ranker: str = "legacy") -> Tuple[Optional[Segment], List[Tuple[int, float]]]:
+        """The generation queried and the (statement id, score) of its best statements"""
+        if ranker not in ("legacy", "bm25", "dense", "hybrid"):
+            raise ValueError(f"Unknown ranker: {ranker}")
+        segment = self.segment
+        if segment is None:
+            return None, []
+        term_ids = segment.term_ids(get_normalizer().tokens(query))
+        topics = segment.query_topics(query) if ranker == "legacy" else []
+        vector = segment.query_vector(term_ids) if ranker in ("dense", "hybrid") else None
+        if self.shards is not None:
+            return segment, self.shards.top_k(segment.name, ranker, term_ids, topics, max_responses, vector)
+        return segment, segment.top_k(ranker, term_ids, topics, max_responses, vector)
+
+    def get_relevant_responses(self, query: str, max_responses: int = 3, ranker: str = "legacy") -> List[Dict]:
+        """Same results as PolicyAnalyzer.get_relevant_responses on the snapshotted index"""
+        start = time.perf_counter()
+        segment, ranked = self.rank(query, max_responses, ranker)
+        scored = time.perf_counter()
+        QUERY_SECONDS.observe(scored - start, ranker, 'score')
+
+        scored_responses = self._responses(segment, ranked)
+        QUERY_SECONDS.observe(time.perf_counter() - scored, ranker, 'serialize')
+        return scored_responses
+
+    def get_relevant_responses_batch(self, queries: List[Tuple[str, int, str]]) -> List[List[Dict]]:
+        """Same results as PolicyAnalyzer.get_relevant_responses_batch on the snapshotted index"""
+        groups: Dict[str, List[int]] = {}
+        for i, (_, _, ranker) in enumerate(queries):
+            if ranker not in ("legacy", "bm25", "dense", "hybrid"):
+                raise ValueError(f"Unknown ranker: {ranker}")
+            groups.setdefault(ranker, []).append(i)
+
+        results: List[List[Dict]] = [[] for _ in queries]
+        segment = self.segment
+        if segment is None:
+            return results
+        normalizer = get_normalizer()
+        for ranker, members in groups.items():
+            start = time.perf_counter()
+            texts = [queries[i][0] for i in members]
+            ks = [queries[i][1] for i in members]
+            term_ids = [segment.term_ids(normalizer.tokens(text)) for text in texts]
+            if ranker == "legacy":
+                topics = [sorted(query_topics) for query_topics in segment.tagger.tag(texts)]
+            else:
+                topics = [[] for _ in texts]
+            if ranker in ("dense", "hybrid"):
+                vectors = [segment.query_vector(ids) for ids in term_ids]
+            else:
+                vectors = [None] * len(texts)
+            if self.shards is not None:
+                ranked = self.shards.top_k_batch(segment.name, ranker, term_ids, topics, ks, vectors)
+            else:
+                ranked = segment.top_k_batch(ranker, term_ids, topics, ks, vectors)
+            scored = time.perf_counter()
+            QUERY_SECONDS.observe(scored - start, ranker, 'batch')
+            for i, query_ranked in zip(members, ranked):
+                results[i] = self._responses(segment, query_ranked)
+            QUERY_SECONDS.observe(time.perf_counter() - scored, ranker, 'serialize')
+        return results
+
+    @staticmethod
+    def _responses(segment: Segment, ranked: List[Tuple[int, float]]) -> List[Dict]:
+        responses = []
+        for statement_id, score in ranked:
+            sources = segment.sources(statement_id)
+            responses.append({
+                'statement': segment.statement(statement_id),
+                'score': score,
+                'source': sources[0],
+                'sources': sources,
+                'context': segment.context(statement_id),
+                'topics': list(segment.topics(statement_id))
+            })
+        return responses
@@ -0,0 +1,313 @@
+"""Dense statement embeddings from latent semantic analysis (LSA) of the statement tokens.
+
+Statements are TF-IDF vectors over the normalized tokens SentenceStore already
+keeps, projected onto the top singular vectors of the corpus found by
+TruncatedSVD. Embeddings are unit length and stored as one contiguous float32
+matrix, so a query is scored against every statement with a single
+matrix-vector product. scikit-learn is imported on first use, as in topics.py.
+"""
+from typing import List, Optional, Tuple
+import os
+
+import numpy as np
+from scipy import sparse
+
+from ranking import top_k_scores
+
+
+# Embedding width; query time grows linearly with it. A query reads every row once
+# (256 MB for 1M statements at 64), so it is bound by memory bandwidth; 1M statements
+# have measured ~47 ms at p50 on one core, over benchmarks/dense.py's 20 ms budget
+LSA_DIMENSIONS = int(os.environ.get("LSA_DIMENSIONS", "64"))
+# Refit once the live statements differ from those fitted by this fraction;
+# statements indexed in between are projected with the fitted model
+LSA_REFIT_RATIO = float(os.environ.get("LSA_REFIT_RATIO", "0.5"))
+# Share of a hybrid score that comes from the embeddings; the rest is BM25
+HYBRID_WEIGHT = float(os.environ.get("HYBRID_WEIGHT", "0.5"))
+# Most bytes of (queries x statements) scores a query batch computes at once
+BATCH_SCORE_BYTES = int(os.environ.get("BATCH_SCORE_BYTES", str(64 << 20)))
+
+
+def _unit_rows(matrix):
+    from sklearn.preprocessing import normalize
+    return normalize(matrix, copy=False)
+
+
+class LsaModel:
+    """Term idf and the (dimensions x terms) projection of one fit; never changes afterwards.
+
+    Terms are SentenceStore token ids. Tokens first seen after the fit are
+    outside the projection and ignored until the next one.
+    """
+
+    def __init__(self, components: np.ndarray, idf: np.ndarray):
+        self.components = components
+        self.idf = idf
+
+    @property
+    def dimensions(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, indptr: np.ndarray, tokens: np.ndarray, live: np.ndarray, num_terms: int,
+            dimensions: int = LSA_DIMENSIONS) -> Optional[Tuple['LsaModel', np.ndarray]]:
+        """Fit on the live statements; returns the model and every statement's embedding.
+
+        indptr and tokens are SentenceStore.token_indptr and statement_tokens.
+        Returns None while there are too few statements or terms for one dimension.
+        """
+        from sklearn.decomposition import TruncatedSVD
+
+        counts = _term_counts(indptr, tokens, live, num_terms)
+        num_live = int(live.sum())
+        dimensions = min(dimensions, num_terms - 1, num_live - 1)
+        if dimensions < 1:
+            return None
+        doc_freqs = np.bincount(counts.indices, minlength=num_terms)
+        idf = (np.log((1 + num_live) / (1 + doc_freqs)) + 1).astype(np.float32)
+        weighted = _unit_rows(counts.multiply(idf).tocsr())
+        svd = TruncatedSVD(dimensions, algorithm='randomized', random_state=0)
+        svd.fit(weighted[np.flatnonzero(live)])
+        model = cls(svd.components_.astype(np.float32), idf)
+        return model, model._project(weighted)
+
+    def embed(self, indptr: np.ndarray, tokens: np.ndarray, live: np.ndarray) -> np.ndarray:
+        """Embeddings of statements the model was not fitted on; zero for removed ones"""
+        return self._project(_unit_rows(_term_counts(indptr, tokens, live, len(self.idf))
+                                        .multiply(self.idf).tocsr()))
+
+    def _project(self, weighted: sparse.csr_matrix) -> np.ndarray:
+        embeddings = np.ascontiguousarray(weighted @ self.components.T, dtype=np.float32)
+        return _unit_rows(embeddings)
+
+    def query_vector(self, term_ids: np.ndarray) -> Optional[np.ndarray]:
+        return query_vector(self.components, self.idf, term_ids)
+
+
+def _term_counts(indptr: np.ndarray, tokens: np.ndarray, live: np.ndarray, num_terms: int) -> sparse.csr_matrix:
+    """(statements x terms) token counts; removed statements and unknown terms are left out"""
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    keep = live[rows] & (tokens < num_terms)
+    counts = sparse.csr_matrix(
+        (np.ones(int(keep.sum()), dtype=np.float32), (rows[keep], tokens[keep])),
+        shape=(len(indptr) - 1, num_terms)
+    )
+    counts.sum_duplicates()
+    return counts
+
+
+def query_vector(components: np.ndarray, idf: np.ndarray, term_ids: np.ndarray) -> Optional[np.ndarray]:
+    """Unit embedding of a query given its distinct term ids, or None if none was fitted"""
+    term_ids = term_ids[term_ids < len(idf)]
+    if not len(term_ids):
+        return None
+    vector = np.asarray(components[:, term_ids] @ idf[term_ids], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else None
+
+
+def semantic_top_k(embeddings: Optional[np.ndarray], ids: Optional[np.ndarray], query: Optional[np.ndarray],
+                   k: int, lexical: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                   weight: float = HYBRID_WEIGHT):
+    """(statement id, score) of the k best statements by cosine similarity to the query.
+
+    Row i of embeddings is statement ids[i], or statement i if ids is None.
+    With lexical=(statement ids, scores in [0, 1]) the score is weight x cosine
+    + (1 - weight) x lexical score. Only positive scores are returned, which
+    also leaves out removed statements, whose embeddings are zero.
+    """
+    if query is None or embeddings is None or not len(embeddings):
+        if lexical is None:
+            return []
+        candidates, lexical_scores = lexical
+        return top_k_scores(candidates, (1 - weight) * lexical_scores, k)
+    return _top_scores(embeddings @ query, ids, k, lexical, weight)
+
+
+def semantic_top_k_batch(embeddings: Optional[np.ndarray], ids: Optional[np.ndarray],
+                         queries: List[Optional[np.ndarray]], ks: List[int],
+                         lexical: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None,
+                         weight: float = HYBRID_WEIGHT) -> List[list]:
+    """semantic_top_k of several queries, scored in blocks with one matrix-matrix product each.
+
+    A block of q queries reads the embeddings once instead of q times. The
+    product may round differently from a matrix-vector one, so scores can
+    differ from semantic_top_k's in the last digits.
+    """
+    lexical = lexical or [None] * len(queries)
+    if embeddings is None or not len(embeddings):
+        return [semantic_top_k(embeddings, ids, None, k, fused, weight) for k, fused in zip(ks, lexical)]
+    results: List[Optional[list]] = [None] * len(queries)
+    pending = []
+    for i, query in enumerate(queries):
+        if query is None:
+            results[i] = semantic_top_k(embeddings, ids, None, ks[i], lexical[i], weight)
+        else:
+            pending.append(i)
+    block = max(1, BATCH_SCORE_BYTES // (4 * len(embeddings)))
+    for start in range(0, len(pending), block):
+        rows = pending[start:start + block]
+        scores = np.stack([queries[i] for i in rows]) @ embeddings.T
+        for i, row in zip(rows, scores):
+            results[i] = _top_scores(row, ids, ks[i], lexical[i], weight)
+    return results
+
+
+def _top_scores(scores: np.ndarray, ids: Optional[np.ndarray], k: int,
+                lexical: Optional[Tuple[np.ndarray, np.ndarray]], weight: float):
+    if lexical is not None:
+        candidates, lexical_scores = lexical
+        scores *= weight
+        rows = candidates if ids is None else np.searchsorted(ids, candidates)
+        scores[rows] += (1 - weight) * lexical_scores
+    if k is not None and 0 < k < len(scores):
+        # Partition the raw scores for the k-th best instead of first gathering every
+        # positive one, often half the corpus; only scores that can make the top k
+        # (ties at the k-th included) are gathered and ranked
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = np.flatnonzero(scores >= kth) if kth > 0 else np.flatnonzero(scores > 0)
+    else:
+        keep = np.flatnonzero(scores > 0)
+    return top_k_scores(keep if ids is None else ids[keep], scores[keep], k)
+
+
+class SemanticIndex:
+    """Embeddings of every store statement, kept in step with the PolicyAnalyzer indexes.
+
+    add() reserves a zero row per statement; update() projects the new rows with
+    the fitted model, one batch per document. The model is refitted by the
+    topic refresh job when refit_due(), in a worker thread (fit), and installed
+    by publish() on the event loop. Until the first fit every row is zero and
+    the dense ranker returns nothing.
+    """
+
+    def __init__(self, dimensions: int = LSA_DIMENSIONS):
+        # Most dimensions to fit; a small corpus gets fewer
+        self.dimensions = dimensions
+        self.model: Optional[LsaModel] = None
+        # Live statements the model was fitted on
+        self.fitted_live = 0
+        self.num_rows = 0
+        self.num_embedded = 0
+        self._rows = np.zeros((0, dimensions), dtype=np.float32)
+        # (rows, statement id, overwritten row) of removals while a capture() is open
+        self._journal: Optional[list] = None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._rows[:self.num_rows]
+
+    def _reserve(self, num_rows: int):
+        if num_rows > len(self._rows):
+            rows = np.zeros((max(num_rows, 2 * len(self._rows), 1024), self._rows.shape[1]), dtype=np.float32)
+            rows[:self.num_rows] = self._rows[:self.num_rows]
+            self._rows = rows
+
+    def add(self, statement_id: int):
+        """Append a statement; ids must be assigned consecutively from 0"""
+        if statement_id != self.num_rows:
+            raise ValueError(f"Expected statement id {self.num_rows}, got {statement_id}")
+        self._reserve(self.num_rows + 1)
+        self.num_rows += 1
+
+    def remove(self, statement_id: int):
+        if self._journal is not None:
+            self._journal.append((self._rows, statement_id, self._rows[statement_id].copy()))
+        self._rows[statement_id] = 0
+
+    def capture(self) -> 'EmbeddingsCapture':
+        """Start a copy of the embeddings that EmbeddingsCapture.materialize() finishes in a
+        worker thread, ending any earlier capture; see SentenceStore.capture()"""
+        self._journal = []
+        return EmbeddingsCapture(self, self._journal)
+
+    def update(self, store):
+        """Embed the statements added since the last update"""
+        if self.model is None or self.num_embedded == self.num_rows:
+            self.num_embedded = self.num_rows
+            return
+        start, end = self.num_embedded, self.num_rows
+        indptr = np.array(store.token_indptr[start:end + 1], dtype=np.int64)
+        tokens = np.array(store.statement_tokens[indptr[0]:indptr[-1]], dtype=np.int64)
+        live = np.array(store.statement_pos[start:end], dtype=np.int64) >= 0
+        self._rows[start:end] = self.model.embed(indptr - indptr[0], tokens, live)
+        self.num_embedded = end
+
+    def refit_due(self, num_live: int) -> bool:
+        if self.model is None:
+            return num_live > 1
+        return abs(num_live - self.fitted_live) > LSA_REFIT_RATIO * self.fitted_live
+
+    def fit(self, store, num_statements: int):
+        """Fit a new model on the first num_statements; safe to run in a worker thread"""
+        # Slicing copies the columns, so the event loop may keep appending to them
+        indptr = np.array(store.token_indptr[:num_statements + 1], dtype=np.int64)
+        tokens = np.array(store.statement_tokens[:indptr[-1]], dtype=np.int64)
+        live = np.array(store.statement_pos[:num_statements], dtype=np.int64) >= 0
+        return LsaModel.fit(indptr, tokens, live, len(store.token_names), self.dimensions), int(live.sum())
+
+    def publish(self, result, store):
+        """Install a result of fit(), re-embedding what changed while it ran"""
+        fitted, fitted_live = result
+        if fitted is None:
+            return
+        model, embeddings = fitted
+        rows = np.zeros((len(self._rows), model.dimensions), dtype=np.float32)
+        rows[:len(embeddings)] = embeddings
+        # Removed while the fit was running
+        removed = np.flatnonzero(np.array(store.statement_pos[:len(embeddings)], dtype=np.int64) < 0)
+        rows[removed] = 0
+        self.model, self.fitted_live, self._rows = model, fitted_live, rows
+        self.num_embedded = len(embeddings)
+        self.update(store)
+
+    def load(self, num_rows: int, model: Optional[LsaModel] = None, embeddings: Optional[np.ndarray] = None,
+             fitted_live: int = 0):
+        """Restore num_rows statements from a snapshot, with their fit if there was one"""
+        if model is None or embeddings is None:
+            self._reserve(num_rows)
+            self.num_rows = self.num_embedded = num_rows
+            return
+        self._rows = np.zeros((max(len(embeddings), 1024), model.dimensions), dtype=np.float32)
+        self._rows[:len(embeddings)] = embeddings
+        self.model, self.fitted_live = model, fitted_live
+        self.num_rows = self.num_embedded = len(embeddings)
+
+    def query_vector(self, term_ids: np.ndarray) -> Optional[np.ndarray]:
+        return self.model.query_vector(term_ids) if self.model is not None else None
+
+    def top_k(self, term_ids: np.ndarray, k: int, lexical: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        return semantic_top_k(self.embeddings, None, self.query_vector(term_ids), k, lexical)
+
+    def top_k_batch(self, term_ids: List[np.ndarray], ks: List[int],
+                    lexical: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None):
+        return semantic_top_k_batch(self.embeddings, None, [self.query_vector(t) for t in term_ids], ks, lexical)
+
+    def nbytes(self) -> int:
+        total = self._rows.nbytes
+        if self.model is not None:
+            total += self.model.components.nbytes + self.model.idf.nbytes
+        return total
+
+
+class EmbeddingsCapture:
+    """The embeddings as of SemanticIndex.capture(), for a snapshot written off the event loop"""
+
+    def __init__(self, index: SemanticIndex, journal: list):
+        self.index = index
+        self.journal = journal
+        # publish() and _reserve() swap in new arrays and update() only fills rows
+        # past num_embedded, so removals are the only change to these rows
+        self.rows = index._rows
+        self.num_rows = index.num_rows
+
+    def materialize(self) -> np.ndarray:
+        """Copy the rows as they were captured and stop recording removals"""
+        rows = self.rows[:self.num_rows].copy()
+        journal = list(self.journal)
+        if self.index._journal is self.journal:
+            self.index._journal = None
+        for target, statement_id, row in reversed(journal):
+            if target is self.rows and statement_id < len(rows):
+                rows[statement_id] = row
+        return rows
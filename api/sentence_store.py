@@ -0,0 +1,433 @@
+"""Array-backed store for segmented documents and their indexed statements"""
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+import hashlib
+import sys
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from snapshot import read_strings, write_strings
+
+
+class SentenceStore:
+    """Columnar storage for sentences, replacing the old context_map dict-of-dicts.
+
+    Each document's sentences are concatenated into one string, with the start
+    offset of every sentence position kept in a flat array. Statements (the
+    policy-relevant, de-duplicated sentences that get indexed) have integer ids
+    and point at the position of their first occurrence, so their text and
+    context window are sliced out of the document on demand. Topics are bitsets
+    over a small topic table, doc ids are interned, and the normalized tokens of
+    each statement are kept as ids into a token vocabulary.
+
+    Removing a document drops its text and tombstones the statements only it
+    contained (position -1), so ids stay stable for the posting lists. Statements
+    it shares with other documents move to their next occurrence. Its sentence
+    positions are never reused or compacted: statements, extra sources and the
+    exported segments address sentences by position, so reclaiming them would mean
+    renumbering all of those. A removed position costs 4 bytes of offsets.
+    """
+
+    MAX_TOPICS = 64
+
+    def __init__(self, context_window: int = 2):
+        self.context_window = context_window
+        # Documents, by interned index
+        self.doc_ids: List[str] = []
+        self.doc_index: Dict[str, int] = {}
+        self.doc_text: List[str] = []
+        self.doc_removed = array('B')
+        # First sentence position of each document, plus an end sentinel
+        self.doc_first = array('q', [0])
+        # Sentence positions of removed documents, which keep their place in offsets
+        self.removed_positions = 0
+        # Start offset of every sentence position within its document text
+        self.offsets = array('I')
+        # Statement id -> position of its first occurrence, and its topic bitset
+        self.statement_pos = array('q')
+        self.topic_bits = array('Q')
+        # Statement ids found in each document
+        self.doc_statements: List[array] = []
+        # Positions of further occurrences of statements found in more than one document
+        self.extra_sources: Dict[int, array] = {}
+        # Normalized tokens of each statement, as (indptr, ids) into token_names
+        self.token_names: List[str] = []
+        self.token_ids: Dict[str, int] = {}
+        self.token_indptr = array('q', [0])
+        self.statement_tokens = array('i')
+        self.topic_names: List[str] = []
+        self._topic_bit: Dict[str, int] = {}
+        self._topic_members: Dict[str, np.ndarray] = {}
+        # Open-addressing table of text key -> statement id; -1 marks a free slot.
+        # Keys are stable across processes, so the table is saved as it is
+        self._slot_keys = array('q', bytes(8 * 16))
+        self._slot_ids = array('i', [-1]) * 16
+        # (column, index, overwritten value) of in-place changes while a capture() is open
+        self._journal: Optional[list] = None
+
+    def __len__(self) -> int:
+        return len(self.statement_pos)
+
+    @property
+    def num_positions(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def num_live_positions(self) -> int:
+        """Sentences of the documents still indexed"""
+        return len(self.offsets) - self.removed_positions
+
+    def add_document(self, doc_id: str, sentences: List[str]) -> int:
+        """Store the sentences of a document and return its interned index"""
+        doc = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.doc_index[doc_id] = doc
+        start = 0
+        for sentence in sentences:
+            self.offsets.append(start)
+            start += len(sentence)
+        self.doc_text.append("".join(sentences))
+        self.doc_removed.append(0)
+        self.doc_first.append(self.doc_first[-1] + len(sentences))
+        self.doc_statements.append(array('I'))
+        return doc
+
+    def document_text(self, doc_id: str) -> str:
+        """The segmented text of a document, sentences joined as stored"""
+        return self.doc_text[self.doc_index[doc_id]]
+
+    def document_of(self, position: int) -> int:
+        return bisect_right(self.doc_first, position) - 1
+
+    def sentence(self, position: int, doc: Optional[int] = None) -> str:
+        if doc is None:
+            doc = self.document_of(position)
+        start = self.offsets[position]
+        if position + 1 < self.doc_first[doc + 1]:
+            return self.doc_text[doc][start:self.offsets[position + 1]]
+        return self.doc_text[doc][start:]
+
+    def find(self, text: str) -> Optional[int]:
+        """Statement id of an identical sentence that is already stored"""
+        key = _text_key(text)
+        mask = len(self._slot_ids) - 1
+        slot = key & mask
+        while self._slot_ids[slot] != -1:
+            statement_id = self._slot_ids[slot]
+            if (self._slot_keys[slot] == key and self.statement_pos[statement_id] >= 0
+                    and self.statement(statement_id) == text):
+                return statement_id
+            slot = (slot + 1) & mask
+        return None
+
+    def add_statement(self, doc: int, position: int, text: str, topics: Iterable[str] = (),
+                      tokens: Iterable[str] = ()) -> int:
+        """Register the sentence at position as a new statement"""
+        statement_id = len(self.statement_pos)
+        self.statement_pos.append(position)
+        self.topic_bits.append(self.encode_topics(topics))
+        for token in tokens:
+            token_id = self.token_ids.get(token)
+            if token_id is None:
+                token_id = len(self.token_names)
+                self.token_ids[token] = token_id
+                self.token_names.append(token)
+            self.statement_tokens.append(token_id)
+        self.token_indptr.append(len(self.statement_tokens))
+        self._remember(text, statement_id)
+        self.doc_statements[doc].append(statement_id)
+        for topic in topics:
+            self._topic_members.pop(topic, None)
+        return statement_id
+
+    def _remember(self, text: str, statement_id: int):
+        if 2 * (statement_id + 1) > len(self._slot_ids):
+            self._grow()
+        self._insert(_text_key(text), statement_id)
+
+    def _insert(self, key: int, statement_id: int):
+        mask = len(self._slot_ids) - 1
+        slot = key & mask
+        while self._slot_ids[slot] != -1:
+            slot = (slot + 1) & mask
+        self._set(self._slot_keys, slot, key)
+        self._set(self._slot_ids, slot, statement_id)
+
+    def _set(self, column, index: int, value):
+        if self._journal is not None:
+            self._journal.append((column, index, column[index]))
+        column[index] = value
+
+    def _record_sources(self, statement_id: int):
+        if self._journal is not None:
+            extra = self.extra_sources.get(statement_id)
+            self._journal.append((self.extra_sources, statement_id, None if extra is None else extra[:]))
+
+    def _grow(self):
+        keys, ids = self._slot_keys, self._slot_ids
+        capacity = 2 * len(ids)
+        self._slot_keys = array('q', bytes(8 * capacity))
+        self._slot_ids = array('i', [-1]) * capacity
+        for key, statement_id in zip(keys, ids):
+            if statement_id != -1 and self.statement_pos[statement_id] >= 0:
+                self._insert(key, statement_id)
+
+    def add_source(self, statement_id: int, doc: int, position: int):
+        """Record another document containing an existing statement at position"""
+        if doc == self.document_of(self.statement_pos[statement_id]):
+            return
+        extra = self.extra_sources.get(statement_id, ())
+        if all(self.document_of(p) != doc for p in extra):
+            self._record_sources(statement_id)
+            self.extra_sources.setdefault(statement_id, array('I')).append(position)
+            self.doc_statements[doc].append(statement_id)
+
+    def remove_document(self, doc_id: str) -> List[int]:
+        """Drop a document in time proportional to its statements.
+
+        Returns the ids of the statements that no other document contains; they
+        are tombstoned and must be removed from the posting lists by the caller.
+        """
+        doc = self.doc_index.pop(doc_id)
+        removed = []
+        for statement_id in self.doc_statements[doc]:
+            extra = self.extra_sources.get(statement_id)
+            if extra is not None:
+                self._record_sources(statement_id)
+            if self.document_of(self.statement_pos[statement_id]) != doc:
+                extra.pop(next(i for i, p in enumerate(extra) if self.document_of(p) == doc))
+            elif extra:
+                # Keep the statement, now pointing at its next occurrence
+                self._set(self.statement_pos, statement_id, extra.pop(0))
+            else:
+                self._set(self.statement_pos, statement_id, -1)
+                self._set(self.topic_bits, statement_id, 0)
+                removed.append(statement_id)
+            if extra is not None and not extra:
+                del self.extra_sources[statement_id]
+        self._set(self.doc_text, doc, '')
+        self._set(self.doc_statements, doc, array('I'))
+        self._set(self.doc_removed, doc, 1)
+        self.removed_positions += self.doc_first[doc + 1] - self.doc_first[doc]
+        self._topic_members = {}
+        return removed
+
+    def is_removed(self, statement_id: int) -> bool:
+        return self.statement_pos[statement_id] < 0
+
+    def statement(self, statement_id: int) -> str:
+        """Text of a statement, or '' once it has been removed"""
+        position = self.statement_pos[statement_id]
+        return self.sentence(position) if position >= 0 else ''
+
+    def tokens(self, statement_id: int) -> List[str]:
+        """Normalized tokens of a statement, as computed at ingest"""
+        start, end = self.token_indptr[statement_id], self.token_indptr[statement_id + 1]
+        return [self.token_names[t] for t in self.statement_tokens[start:end]]
+
+    def context(self, statement_id: int) -> List[str]:
+        """Sentences around a statement, derived from its document offsets"""
+        position = self.statement_pos[statement_id]
+        doc = self.document_of(position)
+        start = max(self.doc_first[doc], position - self.context_window)
+        end = min(self.doc_first[doc + 1], position + self.context_window + 1)
+        return [self.sentence(p, doc) for p in range(start, end)]
+
+    def doc_id(self, statement_id: int) -> str:
+        return self.doc_ids[self.document_of(self.statement_pos[statement_id])]
+
+    def sources(self, statement_id: int) -> List[str]:
+        positions = [self.statement_pos[statement_id]]
+        positions.extend(self.extra_sources.get(statement_id, ()))
+        return [self.doc_ids[self.document_of(p)] for p in positions]
+
+    def encode_topics(self, topics: Iterable[str], topic_bit: Optional[Dict[str, int]] = None) -> int:
+        """Bitset of the topics that are in the topic table; others are dropped"""
+        if topic_bit is None:
+            topic_bit = self._topic_bit
+        bits = 0
+        for topic in topics:
+            bit = topic_bit.get(topic)
+            if bit is not None:
+                bits |= 1 << bit
+        return bits
+
+    def topics(self, statement_id: int) -> Set[str]:
+        bits = self.topic_bits[statement_id]
+        return {name for i, name in enumerate(self.topic_names) if bits >> i & 1}
+
+    @classmethod
+    def topic_table(cls, topics: Iterable[str]) -> List[str]:
+        return sorted(topics)[:cls.MAX_TOPICS]
+
+    def replace_topics(self, topic_names: List[str], topic_bits: array):
+        """Swap in a new topic table together with the bitsets computed against it"""
+        self.topic_names = list(topic_names)
+        self._topic_bit = {name: i for i, name in enumerate(self.topic_names)}
+        self.topic_bits = topic_bits
+        self._topic_members = {}
+
+    def topic_members(self, topic: str) -> np.ndarray:
+        """Ids of the statements tagged with a topic, cached until tags change"""
+        members = self._topic_members.get(topic)
+        if members is None:
+            bit = self._topic_bit.get(topic)
+            if bit is None or not len(self.topic_bits):
+                members = np.empty(0, dtype=np.int32)
+            else:
+                bits = np.frombuffer(self.topic_bits, dtype=np.uint64)
+                members = np.flatnonzero(bits & np.uint64(1 << bit)).astype(np.int32)
+            self._topic_members[topic] = members
+        return members
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns, texts and lookup tables"""
+        columns = (self.doc_first, self.offsets, self.statement_pos, self.topic_bits, self.doc_removed,
+                   self.token_indptr, self.statement_tokens, self._slot_keys, self._slot_ids)
+        total = sum(len(column) * column.itemsize for column in columns)
+        total += sum(sys.getsizeof(text) for text in self.doc_text)
+        total += sum(sys.getsizeof(token) for token in self.token_names)
+        total += sum(len(group) * group.itemsize for group in self.doc_statements)
+        total += sum(len(group) * group.itemsize for group in self.extra_sources.values())
+        return total
+
+    def capture(self) -> 'StoreCapture':
+        """Start a copy of the store that StoreCapture.materialize() finishes in a worker
+        thread, ending any earlier capture. Takes the columns by reference, so it is cheap
+        on the event loop; until materialize() every in-place change records the value it
+        overwrites, and the copy puts those back. Appends land past the captured lengths."""
+        self._journal = []
+        return StoreCapture(self, self._journal)
+
+    def save(self, directory: Path):
+        """Write every column as a flat array file next to the document texts"""
+        for name, values in (('doc_ids', self.doc_ids), ('doc_text', self.doc_text),
+                             ('topic_names', self.topic_names), ('token_names', self.token_names)):
+            write_strings(directory, name, values)
+        for name, column, dtype in (('doc_first', self.doc_first, np.int64),
+                                    ('doc_removed', self.doc_removed, np.uint8),
+                                    ('offsets', self.offsets, np.uint32),
+                                    ('statement_pos', self.statement_pos, np.int64),
+                                    ('topic_bits', self.topic_bits, np.uint64),
+                                    ('token_indptr', self.token_indptr, np.int64),
+                                    ('statement_tokens', self.statement_tokens, np.int32),
+                                    ('slot_keys', self._slot_keys, np.int64),
+                                    ('slot_ids', self._slot_ids, np.int32)):
+            np.save(directory / f'{name}.npy', np.frombuffer(column, dtype=dtype))
+        _save_groups(directory, 'doc_statements', self.doc_statements)
+        keys = sorted(self.extra_sources)
+        np.save(directory / 'extra_source_keys.npy', np.asarray(keys, dtype=np.int64))
+        _save_groups(directory, 'extra_sources', [self.extra_sources[k] for k in keys])
+
+    @classmethod
+    def load(cls, directory: Path, context_window: int = 2) -> 'SentenceStore':
+        """Read a store written by save()"""
+        store = cls(context_window)
+        store.doc_ids = read_strings(directory, 'doc_ids')
+        store.doc_removed = _load_column(directory, 'doc_removed', 'B')
+        store.doc_index = {doc_id: i for i, doc_id in enumerate(store.doc_ids) if not store.doc_removed[i]}
+        store.doc_text = read_strings(directory, 'doc_text')
+        store.doc_first = _load_column(directory, 'doc_first', 'q')
+        store.removed_positions = removed_positions(np.load(directory / 'doc_first.npy'),
+                                                    np.load(directory / 'doc_removed.npy'))
+        store.offsets = _load_column(directory, 'offsets', 'I')
+        store.statement_pos = _load_column(directory, 'statement_pos', 'q')
+        topic_bits = _load_column(directory, 'topic_bits', 'Q')
+        store.replace_topics(read_strings(directory, 'topic_names'), topic_bits)
+        store.token_names = read_strings(directory, 'token_names')
+        store.token_ids = {token: i for i, token in enumerate(store.token_names)}
+        store.token_indptr = _load_column(directory, 'token_indptr', 'q')
+        store.statement_tokens = _load_column(directory, 'statement_tokens', 'i')
+        store.doc_statements = _load_groups(directory, 'doc_statements')
+        keys = np.load(directory / 'extra_source_keys.npy').tolist()
+        store.extra_sources = dict(zip(keys, _load_groups(directory, 'extra_sources')))
+        store._slot_keys = _load_column(directory, 'slot_keys', 'q')
+        store._slot_ids = _load_column(directory, 'slot_ids', 'i')
+        return store
+
+
+_ARRAY_COLUMNS = ('doc_first', 'doc_removed', 'offsets', 'statement_pos', 'topic_bits',
+                  'token_indptr', 'statement_tokens', '_slot_keys', '_slot_ids')
+_LIST_COLUMNS = ('doc_ids', 'doc_text', 'topic_names', 'token_names', 'doc_statements')
+
+
+class StoreCapture:
+    """A SentenceStore as of SentenceStore.capture(), for a snapshot written off the event loop"""
+
+    def __init__(self, store: SentenceStore, journal: list):
+        self.store = store
+        self.journal = journal
+        self.context_window = store.context_window
+        self.removed_positions = store.removed_positions
+        self.extra_sources = store.extra_sources
+        self.columns = {name: getattr(store, name) for name in _ARRAY_COLUMNS + _LIST_COLUMNS}
+        self.lengths = {name: len(column) for name, column in self.columns.items()}
+
+    def materialize(self) -> SentenceStore:
+        """Copy the store as it was captured and stop recording its changes; safe in a worker thread.
+
+        Each slice is atomic under the GIL, but the event loop may change the
+        store between them, so every recorded change is undone on the copies,
+        latest first, leaving the value each slot had at capture time.
+        """
+        copies = {name: column[:self.lengths[name]] for name, column in self.columns.items()}
+        extra_sources = {statement_id: extra[:] for statement_id, extra in dict(self.extra_sources).items()}
+        # Changes after this read were made after the slices above, which already hold the captured values
+        journal = list(self.journal)
+        if self.store._journal is self.journal:
+            self.store._journal = None
+        targets = {id(column): copies[name] for name, column in self.columns.items()}
+        for column, index, value in reversed(journal):
+            if column is self.extra_sources:
+                if value is None:
+                    extra_sources.pop(index, None)
+                else:
+                    extra_sources[index] = value
+                continue
+            # Columns replaced since the capture, e.g. by replace_topics(), are not in the copy
+            target = targets.get(id(column))
+            if target is not None and index < len(target):
+                target[index] = value
+
+        store = SentenceStore(self.context_window)
+        for name, column in copies.items():
+            setattr(store, name, column)
+        store.doc_index = {doc_id: i for i, doc_id in enumerate(store.doc_ids) if not store.doc_removed[i]}
+        store.token_ids = {token: i for i, token in enumerate(store.token_names)}
+        store._topic_bit = {name: i for i, name in enumerate(store.topic_names)}
+        store.removed_positions = self.removed_positions
+        store.extra_sources = extra_sources
+        return store
+
+
+def removed_positions(doc_first: np.ndarray, doc_removed: np.ndarray) -> int:
+    """Sentence positions held by removed documents"""
+    return int(np.diff(doc_first)[doc_removed.astype(bool)].sum())
+
+
+def _text_key(text: str) -> int:
+    """64-bit key of a sentence; unlike hash() it does not change between processes"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def _load_column(directory: Path, name: str, typecode: str) -> array:
+    column = array(typecode)
+    column.frombytes(np.load(directory / f'{name}.npy').tobytes())
+    return column
+
+
+def _save_groups(directory: Path, name: str, groups: List[array]):
+    """Write a list of id arrays as (indptr, ids)"""
+    indptr = np.zeros(len(groups) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(g) for g in groups])
+    ids = np.frombuffer(b''.join(g.tobytes() for g in groups), dtype=np.uint32)
+    np.save(directory / f'{name}_indptr.npy', indptr)
+    np.save(directory / f'{name}_ids.npy', ids)
+
+
+def _load_groups(directory: Path, name: str) -> List[array]:
+    indptr = np.load(directory / f'{name}_indptr.npy')
+    ids = np.load(directory / f'{name}_ids.npy')
+    return [array('I', ids[indptr[i]:indptr[i + 1]].tobytes()) for i in range(len(indptr) - 1)]
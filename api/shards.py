@@ -0,0 +1,205 @@
+"""Scatter-gather query execution over index shards in local worker processes"""
+from concurrent.futures import Future
+from itertools import count, islice
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from segments import SegmentScorer
+from snapshot import read_strings
+
+
+# Shard processes per query-serving worker; 0 scores every query in the worker itself
+INDEX_SHARDS = int(os.environ.get("INDEX_SHARDS", "0"))
+
+
+def shard_of(doc_id: str, num_shards: int) -> int:
+    """Stable across processes and restarts, unlike hash()"""
+    return zlib.crc32(doc_id.encode('utf-8')) % num_shards
+
+
+class ShardSegment(SegmentScorer):
+    """The statements of one generation whose first source hashes to this shard.
+
+    Maps the generation's files like Segment, then copies out the postings of
+    its own statements, so each shard scans only its part of every posting list.
+    Statement ids stay global. Document frequencies, lengths and the average
+    length come from the whole generation, so BM25 scores equal unsharded ones.
+    """
+
+    def __init__(self, directory: Path, shard: int, num_shards: int):
+        with open(directory / 'manifest.json', 'r') as f:
+            stats = json.load(f)['segments']
+        self.num_live = stats['num_live']
+        self.avg_length = stats['total_length'] / self.num_live if self.num_live else 1.0
+        self.k1, self.b = stats['k1'], stats['b']
+
+        def load(name: str) -> np.ndarray:
+            return np.load(directory / f'{name}.npy', mmap_mode='r')
+
+        self.term_indptr = load('segment_indptr')
+        self.lengths = load('segment_lengths')
+        self.topic_bits = load('topic_bits')
+        self.topic_names = read_strings(directory, 'topic_names')
+        statement_pos = load('statement_pos')
+        self.num_statements = len(statement_pos)
+
+        doc_shards = np.array([shard_of(doc_id, num_shards) for doc_id in read_strings(directory, 'doc_ids')],
+                              dtype=np.int64)
+        statement_docs = np.searchsorted(load('doc_first'), statement_pos, side='right') - 1
+        self.mine = (statement_pos >= 0) & (doc_shards[statement_docs] == shard)
+
+        ids = load('segment_ids')
+        keep = self.mine[ids]
+        rows = np.repeat(np.arange(len(self.term_indptr) - 1), np.diff(self.term_indptr))[keep]
+        self.postings_indptr = np.zeros(len(self.term_indptr), dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.term_indptr) - 1), out=self.postings_indptr[1:])
+        self.postings_ids = ids[keep]
+        self.postings_tfs = load('segment_tfs')[keep]
+        # Own rows of the embeddings, copied out like the postings
+        self.embedding_ids = np.flatnonzero(self.mine)
+        self.embeddings = None
+        if (directory / 'embeddings.npy').exists():
+            self.embeddings = np.ascontiguousarray(load('embeddings')[self.embedding_ids])
+        self._topic_members: Dict[str, np.ndarray] = {}
+
+    def topic_members(self, topic: str) -> np.ndarray:
+        members = self._topic_members.get(topic)
+        if members is None:
+            if topic in self.topic_names:
+                bit = np.uint64(1 << self.topic_names.index(topic))
+                members = np.flatnonzero((self.topic_bits & bit).astype(np.bool_) & self.mine).astype(np.int32)
+            else:
+                members = np.empty(0, dtype=np.int32)
+            self._topic_members[topic] = members
+        return members
+
+
+def _serve_shard(conn, shard: int, num_shards: int):
+    """Shard process: answers requests in order, keyed by generation name"""
+    segments: Dict[str, ShardSegment] = {}
+    while True:
+        try:
+            request_id, request = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            kind = request[0]
+            if kind == 'open':
+                directory = Path(request[1])
+                if directory.name not in segments:
+                    segments[directory.name] = ShardSegment(directory, shard, num_shards)
+                result = None
+            elif kind == 'retain':
+                for name in set(segments) - set(request[1]):
+                    del segments[name]
+                result = None
+            elif kind == 'batch':
+                _, name, ranker, term_ids, topics, ks, queries = request
+                result = segments[name].top_k_batch(ranker, term_ids, topics, ks, queries)
+            else:
+                _, name, ranker, term_ids, topics, k, query = request
+                result = segments[name].top_k(ranker, term_ids, topics, k, query)
+            conn.send((request_id, True, result))
+        except Exception as e:
+            conn.send((request_id, False, f"{type(e).__name__}: {e}"))
+
+
+class ShardPool:
+    """Fans each query out to num_shards processes and merges their top k.
+
+    Every shard returns its own k best statements ordered by (score desc, id),
+    the same order both rankers use, so a heap merge of the shard lists yields
+    exactly the unsharded top k. Requests are pipelined: any number of threads
+    may query at once, and each shard works through them in order. Processes
+    are spawned on first use, for the same reason as IngestPool's.
+    """
+
+    def __init__(self, num_shards: int = INDEX_SHARDS):
+        self.num_shards = num_shards
+        self._conns = []
+        self._processes = []
+        self._pending: Dict[int, Future] = {}
+        self._ids = count()
+        self._send_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._conns:
+                return
+            context = multiprocessing.get_context('spawn')
+            for shard in range(self.num_shards):
+                conn, child = context.Pipe()
+                process = context.Process(target=_serve_shard, args=(child, shard, self.num_shards), daemon=True)
+                process.start()
+                child.close()
+                threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+                self._processes.append(process)
+                self._conns.append(conn)
+
+    def _receive(self, conn):
+        while True:
+            try:
+                request_id, ok, value = conn.recv()
+            except (EOFError, OSError):
+                # A shard exited: nothing pending will be answered
+                for request_id in list(self._pending):
+                    future = self._pending.pop(request_id, None)
+                    if future is not None:
+                        future.set_exception(RuntimeError("Index shard process exited"))
+                return
+            future = self._pending.pop(request_id)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+    def _broadcast(self, request: tuple) -> list:
+        """Send a request to every shard and wait for all of their answers"""
+        self._start()
+        futures = []
+        with self._send_lock:
+            for conn in self._conns:
+                request_id = next(self._ids)
+                future = Future()
+                self._pending[request_id] = future
+                conn.send((request_id, request))
+                futures.append(future)
+        return [future.result() for future in futures]
+
+    def open(self, directory: Path):
+        """Build every shard's part of a generation; returns once all are ready"""
+        self._broadcast(('open', str(directory)))
+
+    def retain(self, names: List[str]):
+        """Drop every generation but these"""
+        self._broadcast(('retain', list(names)))
+
+    def top_k(self, generation: str, ranker: str, term_ids: np.ndarray, topics: List[str],
+              k: int, query: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        results = self._broadcast(('query', generation, ranker, term_ids, topics, k, query))
+        return list(islice(heapq.merge(*results, key=lambda hit: (-hit[1], hit[0])), k))
+
+    def top_k_batch(self, generation: str, ranker: str, term_ids: List[np.ndarray], topics: List[List[str]],
+                    ks: List[int], queries: List[Optional[np.ndarray]]) -> List[List[Tuple[int, float]]]:
+        """top_k of several queries with one request per shard"""
+        results = self._broadcast(('batch', generation, ranker, term_ids, topics, ks, queries))
+        return [list(islice(heapq.merge(*shard_hits, key=lambda hit: (-hit[1], hit[0])), k))
+                for shard_hits, k in zip(zip(*results), ks)]
+
+    def shutdown(self):
+        for conn in self._conns:
+            conn.close()
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self._conns, self._processes = [], []
@@ -0,0 +1,241 @@
+"""On-disk snapshots of the PolicyAnalyzer index so a restart can serve queries warm"""
+from pathlib import Path
+from typing import Dict, List, Optional
+from datetime import datetime
+import json
+import os
+import shutil
+
+import numpy as np
+from scipy import sparse
+
+from semantic import LsaModel
+
+
+INDEX_DIR = Path("index")
+SNAPSHOT_VERSION = 9
+CURRENT_FILE = "CURRENT"
+
+
+def write_strings(directory: Path, name: str, strings: List[str]):
+    """Write strings as one UTF-8 blob plus an offsets array, for read_strings"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(directory / f"{name}.bin", 'wb') as f:
+        for b in encoded:
+            f.write(b)
+    np.save(directory / f"{name}_offsets.npy", offsets)
+
+
+def read_strings(directory: Path, name: str) -> List[str]:
+    """Read strings written by write_strings using memory-mapped offsets"""
+    offsets = np.load(directory / f"{name}_offsets.npy", mmap_mode='r')
+    blob = np.memmap(directory / f"{name}.bin", dtype=np.uint8, mode='r') if offsets[-1] else b''
+    data = bytes(blob)
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def export_segments(store, directory: Path) -> Dict:
+    """Write the arrays read-only workers query from (see segments.py); returns their stats.
+
+    The postings of every token are one row of a term-major CSR matrix of term
+    frequencies over the live statements, which serves both rankers. Sentence
+    byte offsets let a reader slice single sentences out of doc_text.bin.
+    """
+    num_statements = len(store)
+    token_indptr = np.frombuffer(store.token_indptr, dtype=np.int64)
+    tokens = np.frombuffer(store.statement_tokens, dtype=np.int32)
+    live = np.frombuffer(store.statement_pos, dtype=np.int64) >= 0
+    lengths = np.diff(token_indptr).astype(np.int32)
+    statements = np.repeat(np.arange(num_statements, dtype=np.int32), lengths)
+    keep = live[statements]
+    lengths[~live] = 0
+    matrix = sparse.csr_matrix(
+        (np.ones(int(keep.sum()), dtype=np.float32), (tokens[keep], statements[keep])),
+        shape=(len(store.token_names), num_statements)
+    )
+    matrix.sum_duplicates()
+    np.save(directory / 'segment_indptr.npy', matrix.indptr.astype(np.int64))
+    np.save(directory / 'segment_ids.npy', matrix.indices.astype(np.int32))
+    np.save(directory / 'segment_tfs.npy', matrix.data.astype(np.float32))
+    np.save(directory / 'segment_lengths.npy', lengths)
+    np.save(directory / 'sentence_bytes.npy', _sentence_bytes(store))
+    return {'num_live': int(live.sum()), 'total_length': int(lengths.sum())}
+
+
+def _sentence_bytes(store) -> np.ndarray:
+    """Offset of every sentence position in the UTF-8 doc_text blob, plus its end"""
+    char_offsets = np.frombuffer(store.offsets, dtype=np.uint32)
+    offsets = np.empty(store.num_positions + 1, dtype=np.int64)
+    start = 0
+    for doc, text in enumerate(store.doc_text):
+        first, end = store.doc_first[doc], store.doc_first[doc + 1]
+        if text.isascii():
+            # Removed documents keep their positions but not their text
+            offsets[first:end] = char_offsets[first:end].astype(np.int64) + start if text else start
+            start += len(text)
+            continue
+        cuts = char_offsets[first:end].tolist() + [len(text)]
+        sizes = [len(text[a:b].encode('utf-8')) for a, b in zip(cuts, cuts[1:])]
+        offsets[first:end] = start + np.cumsum([0] + sizes[:-1])
+        start += sum(sizes)
+    offsets[-1] = start
+    return offsets
+
+
+def _current_snapshot(root: Path) -> Optional[Path]:
+    current = root / CURRENT_FILE
+    if not current.exists():
+        return None
+    snapshot_dir = root / current.read_text().strip()
+    return snapshot_dir if snapshot_dir.is_dir() else None
+
+
+def capture_snapshot(analyzer) -> Dict:
+    """Take the analyzer state save_snapshot writes, so write_snapshot can copy it in a worker
+    thread while the event loop keeps changing the index. The store and the embeddings are
+    captured by reference (SentenceStore.capture), so this costs no pass over the columns.
+    A published topic model is never changed in place (fit_topics works on a copy)."""
+    semantic = analyzer.semantic
+    return {
+        'store': analyzer.store.capture(),
+        'topic_model': analyzer.topic_model,
+        'lsa_model': semantic.model,
+        'embeddings': semantic.capture() if semantic.model is not None else None,
+        'fitted_live': semantic.fitted_live,
+        'all_topics': sorted(analyzer.all_topics),
+        'topic_generation': analyzer.topic_generation,
+        'topics_updated_at': analyzer.topics_updated_at,
+        'documents': dict(analyzer.documents),
+        'k1': analyzer.bm25.k1,
+        'b': analyzer.bm25.b,
+    }
+
+
+def save_snapshot(analyzer, root: Path = INDEX_DIR) -> Path:
+    """Write the analyzer state to a new snapshot directory and point CURRENT at it"""
+    return write_snapshot(capture_snapshot(analyzer), root)
+
+
+def write_snapshot(state: Dict, root: Path = INDEX_DIR) -> Path:
+    """Write a capture_snapshot result to a new snapshot directory and point CURRENT at it.
+    Callers must not write two snapshots to the same root at once."""
+    # First, so the captures stop recording changes even if the write fails
+    store = state['store'].materialize()
+    embeddings = state['embeddings'].materialize() if state['embeddings'] is not None else None
+    root.mkdir(parents=True, exist_ok=True)
+    previous = _current_snapshot(root)
+    generation = 1
+    if previous is not None:
+        generation = int(previous.name.split('-')[-1]) + 1
+
+    snapshot_dir = root / f"snapshot-{generation:08d}"
+    tmp_dir = root / f".{snapshot_dir.name}.tmp"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    store.save(tmp_dir)
+    segments = export_segments(store, tmp_dir)
+
+    topic_model = state['topic_model']
+    # Names are stored positionally next to their feature ids
+    write_strings(tmp_dir, 'topic_terms', list(topic_model.terms.values()))
+    features = np.fromiter(topic_model.terms.keys(), dtype=np.int64, count=len(topic_model.terms))
+    np.save(tmp_dir / 'topic_term_features.npy', features)
+    np.save(tmp_dir / 'doc_freqs.npy', topic_model.doc_freqs)
+    if topic_model.centroids is not None:
+        np.save(tmp_dir / 'centroids.npy', topic_model.centroids)
+        np.save(tmp_dir / 'centroid_counts.npy', topic_model.counts)
+    if state['lsa_model'] is not None:
+        # One row per statement id, so readers can map it and score it directly
+        np.save(tmp_dir / 'embeddings.npy', embeddings)
+        np.save(tmp_dir / 'lsa_components.npy', state['lsa_model'].components)
+        np.save(tmp_dir / 'lsa_idf.npy', state['lsa_model'].idf)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'generation': generation,
+        'created_at': datetime.now().isoformat(),
+        'num_statements': len(store),
+        'all_topics': state['all_topics'],
+        'topic_generation': state['topic_generation'],
+        'topics_updated_at': state['topics_updated_at'],
+        'documents': state['documents'],
+        'segments': dict(segments, k1=state['k1'], b=state['b']),
+        'topic_model': {
+            'num_topics': topic_model.num_topics,
+            'n_features': topic_model.n_features,
+            'num_docs': topic_model.num_docs,
+        },
+        'semantic': {'fitted_live': state['fitted_live']},
+    }
+    with open(tmp_dir / 'manifest.json', 'w') as f:
+        json.dump(manifest, f)
+
+    os.replace(tmp_dir, snapshot_dir)
+    current_tmp = root / f".{CURRENT_FILE}.tmp"
+    current_tmp.write_text(snapshot_dir.name)
+    os.replace(current_tmp, root / CURRENT_FILE)
+
+    # Workers still mapping an older snapshot keep reading it after the unlink; where
+    # mapped files cannot be deleted (Windows) they are retried on the next save
+    for old in root.glob("snapshot-*"):
+        if old != snapshot_dir:
+            shutil.rmtree(old, ignore_errors=True)
+    return snapshot_dir
+
+
+def load_snapshot(analyzer, root: Path = INDEX_DIR) -> bool:
+    """Restore analyzer state from the current snapshot. Returns False if there is none."""
+    snapshot_dir = _current_snapshot(root)
+    if snapshot_dir is None:
+        return False
+
+    with open(snapshot_dir / 'manifest.json', 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        print(f"Ignoring snapshot {snapshot_dir.name}: version {manifest.get('version')} != {SNAPSHOT_VERSION}")
+        return False
+
+    store = analyzer.store.load(snapshot_dir, analyzer.store.context_window)
+    analyzer.store = store
+    # The postings are restored from the exported segments instead of re-indexing
+    # every statement, so a warm start costs array reads
+    indptr = np.load(snapshot_dir / 'segment_indptr.npy')
+    ids = np.load(snapshot_dir / 'segment_ids.npy')
+    removed = np.frombuffer(store.statement_pos, dtype=np.int64) < 0
+    analyzer.index.load_segments(store.token_names, indptr, ids, removed)
+    analyzer.bm25.load_segments(store.token_names, indptr, ids, np.load(snapshot_dir / 'segment_tfs.npy'),
+                                np.load(snapshot_dir / 'segment_lengths.npy'), removed)
+    if (snapshot_dir / 'embeddings.npy').exists():
+        model = LsaModel(np.load(snapshot_dir / 'lsa_components.npy'), np.load(snapshot_dir / 'lsa_idf.npy'))
+        analyzer.semantic.load(len(store), model, np.load(snapshot_dir / 'embeddings.npy'),
+                               manifest['semantic']['fitted_live'])
+    else:
+        analyzer.semantic.load(len(store))
+    analyzer.all_topics = set(manifest['all_topics'])
+    analyzer.documents = manifest['documents']
+    analyzer.doc_hashes = {
+        meta['hash']: doc_id for doc_id, meta in analyzer.documents.items() if meta['hash']
+    }
+    analyzer.topic_generation = manifest['topic_generation']
+    analyzer.topics_updated_at = manifest['topics_updated_at']
+
+    topic_model = analyzer.topic_model
+    params = manifest['topic_model']
+    if params['n_features'] == topic_model.n_features and params['num_topics'] == topic_model.num_topics:
+        features = np.load(snapshot_dir / 'topic_term_features.npy')
+        topic_model.terms = dict(zip(features.tolist(), read_strings(snapshot_dir, 'topic_terms')))
+        topic_model.doc_freqs = np.load(snapshot_dir / 'doc_freqs.npy')
+        topic_model.num_docs = params['num_docs']
+        if (snapshot_dir / 'centroids.npy').exists():
+            topic_model.centroids = np.load(snapshot_dir / 'centroids.npy')
+            topic_model.counts = np.load(snapshot_dir / 'centroid_counts.npy')
+    else:
+        print("Snapshot topic model does not match the current configuration, starting a new one")
+
+    print(f"Loaded snapshot {snapshot_dir.name} with {manifest['num_statements']} statements")
+    return True
@@ -0,0 +1,62 @@
+"""Background job that writes PolicyAnalyzer snapshots at a bounded rate"""
+from typing import Awaitable, Callable, Optional
+import asyncio
+
+
+class SnapshotJob:
+    """Coalesces snapshot requests into at most one write per interval.
+
+    Every snapshot copies and rewrites the whole index, so its cost grows with
+    the corpus rather than with the change that asked for it. A request made
+    when the last write is at least interval seconds old is written at once;
+    later ones are folded into a single write once the interval has passed.
+    Readers serving from the snapshots see changes up to interval seconds late.
+    """
+
+    def __init__(self, write: Callable[[], Awaitable], interval: float = 30.0):
+        self.write = write
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_write = float('-inf')
+        # A change was requested that no write has started on yet
+        self._dirty = False
+
+    def request(self):
+        """Called after the index changed; must run on the event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._task = None
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            wait = self._last_write + self.interval - self._loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty = False
+            # Shielded, so stop() cancels the timer but never a write in progress
+            await asyncio.shield(self._write())
+
+    async def _write(self):
+        try:
+            await self.write()
+        except Exception as e:
+            print(f"Error writing snapshot: {str(e)}")
+        self._last_write = asyncio.get_running_loop().time()
+
+    async def stop(self):
+        """Cancel the timer and write anything still requested, e.g. before shutdown"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._dirty:
+            self._dirty = False
+            await self._write()
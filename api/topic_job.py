@@ -0,0 +1,135 @@
+"""Debounced background job that refreshes PolicyAnalyzer topics after uploads"""
+from typing import Callable, Optional
+import asyncio
+import inspect
+
+
+class TopicRefreshJob:
+    """Coalesces bursts of uploads into one topic refresh.
+
+    The first upload after a refresh starts a timer; the refresh runs when the
+    timer expires or as soon as max_pending documents are waiting, whichever
+    comes first. The fit itself runs in a worker thread and the result is
+    published by the analyzer in a single step on the event loop. on_refresh is
+    called after every refresh that had documents or removals to process, even
+    one whose fit failed, e.g. to write a snapshot; it is awaited if it returns
+    an awaitable, so it can do its work off the event loop. Documents leave the pending
+    list only once a fit has taken them in.
+
+    Removed documents are handled on the same timer. They only cost a refit
+    once the analyzer says enough are gone; then the model is rebuilt from the
+    live documents instead of updated with the pending ones.
+
+    The LSA statement embeddings are refitted on the same schedule, once the
+    analyzer says the corpus has changed enough since their last fit.
+    """
+
+    def __init__(self, analyzer, delay: float = 5.0, max_pending: int = 20,
+                 on_refresh: Optional[Callable[[], object]] = None):
+        self.analyzer = analyzer
+        self.delay = delay
+        self.max_pending = max_pending
+        self.on_refresh = on_refresh
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # One lock for the life of the job, so a refresh still running from an
+        # earlier task or from refresh_topics is never overlapped by another
+        self._lock = asyncio.Lock()
+        # Documents removed or replaced since the last refresh
+        self.removals = 0
+        # Message of the last failed fit; its documents stay pending until the next upload
+        self.last_error: Optional[str] = None
+
+    def notify(self):
+        """Called after a document is queued; must run on the event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        if len(self.analyzer.pending_topic_docs) >= self.max_pending:
+            self._wake.set()
+
+    def notify_removal(self):
+        """Called after a document is removed or replaced; must run on the event loop"""
+        self.removals += 1
+        self.notify()
+
+    async def _run(self):
+        while self.analyzer.pending_topic_docs or self.removals:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.refresh()
+            if self.last_error is not None:
+                # Retried on the next notify instead of every delay seconds
+                break
+
+    async def stop(self) -> bool:
+        """Cancel the timer and refresh anything still pending, e.g. before shutdown.
+        Returns True if a refresh ran, and with it on_refresh."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if not self.analyzer.pending_topic_docs and not self.removals:
+            return False
+        await self.refresh()
+        return True
+
+    async def refresh(self) -> bool:
+        """Fit all pending documents now. Returns True if new topics were published."""
+        async with self._lock:
+            pending = len(self.analyzer.pending_topic_docs)
+            removals = self.removals
+            if not pending and not removals:
+                return False
+            # Documents queued while the fit runs are left for the next refresh
+            docs = self.analyzer.pending_topic_docs[:pending]
+            num_sentences = len(self.analyzer.store)
+            refit = self.analyzer.topic_refit_due()
+            removed = self.analyzer.removed_since_fit
+            if refit:
+                # Pending documents are already in the store, so they are included
+                docs = self.analyzer.live_documents()
+            published = False
+            if docs:
+                try:
+                    result = await asyncio.to_thread(self.analyzer.fit_topics, docs, num_sentences, refit)
+                except Exception as e:
+                    print(f"Error in topic extraction: {str(e)}")
+                    self.last_error = str(e)
+                    self.analyzer.use_default_topics()
+                    # The documents stay pending, but the catalog they changed is saved
+                    await self._on_refresh()
+                    return False
+                published = self.analyzer.publish_topics(result, num_sentences)
+                if refit:
+                    self.analyzer.removed_since_fit -= removed
+            del self.analyzer.pending_topic_docs[:pending]
+            self.removals -= removals
+            self.last_error = None
+            if self.analyzer.embeddings_due():
+                try:
+                    result = await asyncio.to_thread(self.analyzer.fit_embeddings, len(self.analyzer.store))
+                except Exception as e:
+                    print(f"Error fitting sentence embeddings: {str(e)}")
+                else:
+                    self.analyzer.publish_embeddings(result)
+            await self._on_refresh()
+            return published
+
+    async def _on_refresh(self):
+        if self.on_refresh is None:
+            return
+        result = self.on_refresh()
+        if inspect.isawaitable(result):
+            await result
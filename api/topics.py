@@ -0,0 +1,184 @@
+"""Incremental topic model: hashed TF-IDF sentence vectors clustered with online k-means.
+
+scikit-learn is imported on first use rather than at import time, since it
+dominates the API's startup.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from scipy import sparse
+
+
+def hashing_vectorizer(n_features: int, **params):
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(
+        n_features=n_features,
+        stop_words='english',
+        alternate_sign=False,
+        norm=None,
+        **params
+    )
+
+
+def term_feature(term: str, n_features: int) -> int:
+    """Bucket HashingVectorizer assigns to a term with alternate_sign=False"""
+    from sklearn.utils import murmurhash3_32
+    return abs(murmurhash3_32(term, seed=0)) % n_features
+
+
+class TopicModel:
+    """Topic clusters that are updated one document at a time.
+
+    Sentences are hashed into a fixed feature space, so there is no vocabulary
+    to refit, and idf comes from running document frequencies. Centroids follow
+    the mini-batch k-means update (each centroid is the running mean of the
+    points assigned to it), so they move less as they accumulate points and the
+    topics of already tagged sentences stay valid.
+    """
+
+    def __init__(self, num_topics: int = 10, terms_per_topic: int = 5, n_features: int = 2 ** 18):
+        self.num_topics = num_topics
+        self.terms_per_topic = terms_per_topic
+        self.n_features = n_features
+        self._vectorizer = None
+        self.doc_freqs = np.zeros(n_features, dtype=np.int64)
+        self.num_docs = 0
+        # Readable name for each hashed feature, used to label the centroids
+        self.terms: Dict[int, str] = {}
+        self.centroids: Optional[np.ndarray] = None
+        self.counts: Optional[np.ndarray] = None
+        # Sentence vectors held back until there are enough to seed the centroids
+        self._pending: List[sparse.csr_matrix] = []
+
+    @property
+    def vectorizer(self):
+        if self._vectorizer is None:
+            self._vectorizer = hashing_vectorizer(self.n_features, ngram_range=(1, 2))
+        return self._vectorizer
+
+    def copy(self) -> 'TopicModel':
+        """A copy to fit into while this model stays published: the arrays and the term
+        names are copied, the vectorizer, which holds no fitted state, is shared"""
+        model = TopicModel(self.num_topics, self.terms_per_topic, self.n_features)
+        model._vectorizer = self._vectorizer
+        model.doc_freqs = self.doc_freqs.copy()
+        model.num_docs = self.num_docs
+        model.terms = self.terms.copy()
+        if self.centroids is not None:
+            model.centroids = self.centroids.copy()
+            model.counts = self.counts.copy()
+        model._pending = list(self._pending)
+        return model
+
+    def idf(self) -> np.ndarray:
+        return np.log((1 + self.num_docs) / (1 + self.doc_freqs)) + 1
+
+    def partial_fit(self, text: str, sentences: List[str]) -> bool:
+        """Fold one document into the model. Returns True if the centroids changed."""
+        from sklearn.cluster import kmeans_plusplus
+        from sklearn.preprocessing import normalize
+
+        for term in set(self.vectorizer.build_analyzer()(text)):
+            feature = term_feature(term, self.n_features)
+            self.doc_freqs[feature] += 1
+            self.terms.setdefault(feature, term)
+        self.num_docs += 1
+
+        if not sentences:
+            return False
+        vectors = self.vectorizer.transform(sentences)
+        vectors = vectors[vectors.getnnz(axis=1) > 0]
+        if not vectors.shape[0]:
+            return False
+        vectors = normalize(vectors.multiply(self.idf()).tocsr())
+
+        if self.centroids is None:
+            self._pending.append(vectors)
+            pending = sparse.vstack(self._pending).tocsr()
+            if pending.shape[0] < self.num_topics:
+                return False
+            self._pending = []
+            centers, _ = kmeans_plusplus(pending, self.num_topics, random_state=42)
+            self.centroids = np.asarray(centers, dtype=np.float32)
+            self.counts = np.zeros(self.num_topics, dtype=np.float64)
+            vectors = pending
+
+        self._step(vectors)
+        return True
+
+    def _step(self, vectors: sparse.csr_matrix):
+        """One mini-batch k-means update with per-centroid learning rates"""
+        distances = (self.centroids ** 2).sum(axis=1) - 2 * np.asarray(vectors @ self.centroids.T)
+        labels = distances.argmin(axis=1)
+        assignment = sparse.csr_matrix(
+            (np.ones(len(labels)), (labels, np.arange(len(labels)))),
+            shape=(self.num_topics, len(labels))
+        )
+        sums = (assignment @ vectors).toarray()
+        batch_counts = np.bincount(labels, minlength=self.num_topics)
+        for cluster in np.flatnonzero(batch_counts):
+            self.counts[cluster] += batch_counts[cluster]
+            rate = batch_counts[cluster] / self.counts[cluster]
+            mean = sums[cluster] / batch_counts[cluster]
+            self.centroids[cluster] += rate * (mean - self.centroids[cluster])
+
+    def topic_terms(self) -> List[List[str]]:
+        """Top named terms of each centroid"""
+        if self.centroids is None:
+            return []
+        topics = []
+        width = min(self.n_features, self.terms_per_topic * 4)
+        for centroid in self.centroids:
+            best = np.argpartition(-centroid, width - 1)[:width]
+            best = best[np.argsort(-centroid[best])]
+            terms = [self.terms[f] for f in best if centroid[f] > 0 and f in self.terms]
+            topics.append(terms[:self.terms_per_topic])
+        return topics
+
+    def topics(self) -> Set[str]:
+        return {term for terms in self.topic_terms() for term in terms}
+
+
+class TopicTagger:
+    """Tags sentences with every topic that shares a word with them.
+
+    A batch of sentences is tokenized once by a binary HashingVectorizer (the
+    topic model's tokenization, unigrams only) and matched against all topics
+    with one sparse product against a word x topic indicator matrix. Topics are
+    kept sorted, so column i is bit i of a SentenceStore topic bitset.
+    """
+
+    def __init__(self, topics: Iterable[str], n_features: int = 2 ** 18):
+        self.topics = sorted(topics)
+        self.vectorizer = hashing_vectorizer(n_features, binary=True)
+        features, columns = [], []
+        for column, topic in enumerate(self.topics):
+            for word in set(topic.split()):
+                features.append(term_feature(word, n_features))
+                columns.append(column)
+        self.indicator = sparse.csr_matrix(
+            (np.ones(len(features), dtype=np.float32), (features, columns)),
+            shape=(n_features, len(self.topics))
+        )
+
+    def match(self, sentences: List[str]) -> sparse.csr_matrix:
+        """(sentences x topics) matrix, non-zero where a sentence contains a topic word"""
+        if not sentences:
+            return sparse.csr_matrix((0, len(self.topics)), dtype=np.float32)
+        return (self.vectorizer.transform(sentences) @ self.indicator).tocsr()
+
+    def tag(self, sentences: List[str]) -> List[Set[str]]:
+        matches = self.match(sentences)
+        return [
+            {self.topics[j] for j in matches.indices[matches.indptr[i]:matches.indptr[i + 1]]}
+            for i in range(matches.shape[0])
+        ]
+
+    def tag_bits(self, sentences: List[str]) -> np.ndarray:
+        """Topic bitsets (bit i = topics[i]) as uint64, for at most 64 topics"""
+        if len(self.topics) > 64:
+            raise ValueError(f"Bitsets hold at most 64 topics, got {len(self.topics)}")
+        matches = self.match(sentences).tocoo()
+        bits = np.zeros(len(sentences), dtype=np.uint64)
+        np.bitwise_or.at(bits, matches.row, np.left_shift(np.uint64(1), matches.col.astype(np.uint64)))
+        return bits
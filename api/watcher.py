@@ -0,0 +1,201 @@
+"""Background indexer for the directories listed in the tray app's watched_paths"""
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+
+from snapshot import INDEX_DIR
+
+
+# Written by PolicyAnalyzerTray in system_tray_app.py
+CONFIG_PATH = Path.home() / '.policy_analyzer_config.json'
+# Seconds between polls; an idle poll only stats the watched files
+WATCH_INTERVAL = float(os.environ.get("WATCH_INTERVAL", "5"))
+# Changed files hashed and ingested at once; the rest wait their turn
+WATCH_CONCURRENCY = int(os.environ.get("WATCH_CONCURRENCY", str(2 * (os.cpu_count() or 1))))
+MANIFEST_FILE = "watch_manifest.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def load_watched_paths(config_path: Path = CONFIG_PATH) -> Optional[List[Path]]:
+    """watched_paths from the tray config; None if the config cannot be read"""
+    if not config_path.exists():
+        return []
+    try:
+        with open(config_path, 'r') as f:
+            return [Path(p) for p in json.load(f).get('watched_paths', [])]
+    except (OSError, ValueError) as e:
+        print(f"Error reading watched paths from {config_path}: {e}")
+        return None
+
+
+def crawl(root: Path, is_supported: Callable[[Path], bool]) -> Dict[str, Tuple[int, int]]:
+    """(mtime_ns, size) of every supported file under root, skipping hidden entries"""
+    files = {}
+    stack = [str(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and is_supported(Path(entry.name)):
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            continue
+    return files
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DirectoryWatcher:
+    """Keeps the index in sync with the watched directories by polling.
+
+    Every poll crawls the watched roots in parallel threads and compares each
+    file's (mtime, size) with a manifest stored next to the index snapshots.
+    Only files whose stat changed are hashed, only files whose hash changed are
+    re-ingested, and files that disappeared are removed from the index, so an
+    idle poll costs one stat per file. Watched files are indexed under their
+    absolute path as doc_id. Roots that are missing (e.g. an unmounted drive)
+    keep their documents until they come back or are unwatched.
+    """
+
+    def __init__(self, analyzer,
+                 ingest: Callable[[Path, str], Awaitable[Tuple[Optional[Dict], Optional[Dict], Dict, bool]]],
+                 is_supported: Callable[[Path], bool], config_path: Path = CONFIG_PATH,
+                 root: Path = INDEX_DIR, interval: float = WATCH_INTERVAL,
+                 concurrency: int = WATCH_CONCURRENCY):
+        self.analyzer = analyzer
+        self.ingest = ingest
+        self.is_supported = is_supported
+        self.config_path = config_path
+        self.manifest_path = root / MANIFEST_FILE
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        # File path -> {mtime_ns, size, hash, doc_id, owned}
+        self.manifest: Dict[str, Dict] = self._load_manifest()
+        self._task: Optional[asyncio.Task] = None
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading watch manifest: {e}")
+            return {}
+
+    def _save_manifest(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_name(f".{MANIFEST_FILE}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def start(self):
+        """Start polling; must run on the event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Error syncing watched paths: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def sync(self) -> Dict[str, int]:
+        """Bring the index up to date with the watched files once"""
+        counts = {'indexed': 0, 'removed': 0, 'unchanged': 0}
+        roots = load_watched_paths(self.config_path)
+        if roots is None:
+            return counts
+        available = [root for root in roots if root.is_dir()]
+        missing = [str(root.resolve()) for root in roots if not root.is_dir()]
+        files: Dict[str, Tuple[int, int]] = {}
+        for found in await asyncio.gather(*(asyncio.to_thread(crawl, root.resolve(), self.is_supported)
+                                            for root in available)):
+            files.update(found)
+
+        removed = [path for path in self.manifest
+                   if path not in files and not any(Path(path).is_relative_to(root) for root in missing)]
+        for path in removed:
+            self._forget(path)
+        counts['removed'] = len(removed)
+
+        changed = [path for path, stat in files.items() if self._is_stale(path, stat)]
+        counts['unchanged'] = len(files) - len(changed)
+        # A newly watched tree can hold thousands of files; don't read them all at once
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def ingest(path: str) -> str:
+            async with limit:
+                return await self._ingest(path, files[path])
+
+        outcomes = await asyncio.gather(*(ingest(path) for path in changed), return_exceptions=True)
+        for path, outcome in zip(changed, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error indexing watched file {path}: {str(outcome)}")
+            else:
+                counts[outcome] += 1
+
+        if removed or changed:
+            self._save_manifest()
+        return counts
+
+    def _is_stale(self, path: str, stat: Tuple[int, int]) -> bool:
+        entry = self.manifest.get(path)
+        if entry is None or (entry['mtime_ns'], entry['size']) != tuple(stat):
+            return True
+        # Indexed but lost, e.g. the snapshot was older than the manifest
+        return entry['doc_id'] is not None and entry['doc_id'] not in self.analyzer.documents
+
+    def _forget(self, path: str):
+        entry = self.manifest.pop(path)
+        if entry['owned']:
+            self.analyzer.remove_document(entry['doc_id'])
+
+    async def _ingest(self, path: str, stat: Tuple[int, int]) -> str:
+        content_hash = await asyncio.to_thread(hash_file, path)
+        entry = self.manifest.get(path)
+        if (entry is not None and entry['hash'] == content_hash
+                and (entry['doc_id'] is None or entry['doc_id'] in self.analyzer.documents)):
+            # Touched but identical
+            entry['mtime_ns'], entry['size'] = stat
+            return 'unchanged'
+        _, analysis, _, _ = await self.ingest(Path(path), content_hash)
+        # Old version out and new one in without yielding, so queries never miss the file
+        if path in self.manifest:
+            self._forget(path)
+        indexed_as = None
+        if analysis is not None:
+            indexed_as = self.analyzer.merge_analysis(path, analysis, content_hash=content_hash, size=stat[1],
+                                                      path=path)
+        self.manifest[path] = {
+            'mtime_ns': stat[0],
+            'size': stat[1],
+            'hash': content_hash,
+            'doc_id': indexed_as,
+            # Content already indexed from elsewhere is never removed on its behalf
+            'owned': indexed_as == path,
+        }
+        return 'indexed'
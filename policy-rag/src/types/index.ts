@@ -46,4 +46,7 @@ export interface DocumentCount {
 
 export interface TopicResponse {
   topics: string[];
+  generation: number;
+  age_seconds: number | null;
+  pending_documents: number;
 }